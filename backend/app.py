@@ -1,13 +1,55 @@
-from fastapi import FastAPI
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
+import os
 import random
 import uuid
-from risk_service import risk_check, verify_3ds, validate_3ds_code
+from risk_service import (risk_check, risk_check_batch, verify_3ds, validate_3ds_code,
+                          RULE_ENGINE, SHADOW_EVALUATOR, LLM_GATE, LOAD_SHEDDER, FEATURE_STORE,
+                          LINKAGE_INDEX, FX_TABLE, RISK_EVAL_MODE)
+from audit_log import decision_record, load_audit_writer
+from pending_store import load_pending_store
+from merchant_rules import (cached_merchant_engine, clear_merchant_cache, merchant_cache_info,
+                            set_merchant_sample_every)
+from prompt_templates import TOKEN_USAGE
+import tracing
+from profiler import PROFILER, collapsed_text
+from llm_service import LLM_LIMITER
+from stream_scoring import NDJSONStreamingResponse, score_stream
 
 app = FastAPI()
 
-# In-memory storage for pending 3DS transactions
-pending_transactions = {}
+# Token for /admin endpoints; admin endpoints are disabled when unset
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Storage for pending 3DS transactions (in-memory, or shared by workers via PENDING_STORE_PATH)
+pending_transactions = load_pending_store()
+
+# Background writer for decision records (enabled by AUDIT_LOG_DIR)
+AUDIT_WRITER = load_audit_writer()
+
+# Largest /checkout/batch request and number of payments routed to processors at once
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "50"))
+BATCH_ROUTING_WORKERS = int(os.getenv("BATCH_ROUTING_WORKERS", "8"))
+
+def init_routing_pool():
+    """Thread pool routing the payments of a batch; recreated in forked workers"""
+    global ROUTING_POOL
+    ROUTING_POOL = ThreadPoolExecutor(max_workers=BATCH_ROUTING_WORKERS, thread_name_prefix="batch-routing")
+
+init_routing_pool()
+os.register_at_fork(after_in_child=init_routing_pool)
+
+# One root span per request; routing and validation show up as request_parse
+if tracing.TRACER:
+    @app.middleware("http")
+    async def trace_requests(request, call_next):
+        with tracing.span(f"{request.method} {request.url.path}") as root:
+            response = await call_next(request)
+            root.set("status_code", response.status_code)
+        return response
 
 class PaymentRequest(BaseModel):
     amount: float
@@ -17,6 +59,13 @@ class PaymentRequest(BaseModel):
     card_country: str = None
     ip_country: str = "CN"
     user_history: int = 0
+    merchant_id: str = None
+    user_id: str = None
+    ip_address: str = None
+    device_id: str = None
+
+class BatchCheckoutRequest(BaseModel):
+    payments: List[PaymentRequest]
 
 class ThreeDSVerifyRequest(BaseModel):
     transaction_id: str
@@ -47,10 +96,47 @@ def mock_wechat_processor(payment_request):
         "message": "微信支付成功"
     }
 
+def audit_eval_mode():
+    """Rule evaluation mode for checkouts: full instead of fast while decisions are audited
+
+    Fast mode stops once the decision is settled, so its score and reasons
+    only cover part of the rules; audit records feed the columnar archive
+    and LLM gate training and need the complete ones.
+    """
+    return "full" if AUDIT_WRITER and RISK_EVAL_MODE == "fast" else None
+
+def audit_decision(payment_request, risk, status, transaction_id=None):
+    """Queue the checkout decision for the audit log without blocking"""
+    if AUDIT_WRITER:
+        AUDIT_WRITER.enqueue(decision_record(payment_request, risk, status, transaction_id))
+
+def shutdown():
+    """Flush the background writers (audit log, user/card profiles)
+
+    Registered with atexit as well, but serve.py workers leave through
+    os._exit(), which skips atexit handlers, so they call this directly.
+    """
+    if AUDIT_WRITER:
+        AUDIT_WRITER.close()
+    if FEATURE_STORE:
+        FEATURE_STORE.close()
+
+def record_payment(payment_request):
+    """Add a successful payment to the user/card profiles (write-behind)"""
+    if FEATURE_STORE:
+        FEATURE_STORE.record(payment_request)
+
+def link_payment(payment_request):
+    """Link the payment's card, IP, user and device in the fraud-ring index before scoring"""
+    if LINKAGE_INDEX:
+        with tracing.span("linkage", op="link"):
+            LINKAGE_INDEX.link(payment_request)
+
 def process_payment(payment_request):
     """Process payment with risk assessment and routing"""
     # 1. Risk check
-    risk = risk_check(payment_request)
+    link_payment(payment_request)
+    risk = risk_check(payment_request, mode=audit_eval_mode())
     
     # 2. 3DS verification
     if risk['requires_3ds']:
@@ -58,11 +144,13 @@ def process_payment(payment_request):
         if three_ds_result['status'] == 'challenge':
             # Generate transaction ID and store payment data
             transaction_id = str(uuid.uuid4())
-            pending_transactions[transaction_id] = {
-                "payment_request": payment_request,
-                "risk": risk,
-                "timestamp": random.randint(100000, 999999)
-            }
+            with tracing.span("pending_store", op="put"):
+                pending_transactions[transaction_id] = {
+                    "payment_request": payment_request,
+                    "risk": risk,
+                    "timestamp": random.randint(100000, 999999)
+                }
+            audit_decision(payment_request, risk, "pending_3ds", transaction_id)
             return {
                 "status": "pending_3ds",
                 "transaction_id": transaction_id,
@@ -71,14 +159,24 @@ def process_payment(payment_request):
             }
     
     # 3. Route to payment channel
+    return payment_outcome(payment_request, risk, route_payment(payment_request))
+
+def route_payment(payment_request):
+    """Send the payment to its processor; None for unsupported payment methods"""
     method = payment_request['payment_method']
-    if method == 'credit_card':
-        result = mock_credit_card_processor(payment_request)
-    elif method == 'alipay':
-        result = mock_alipay_processor(payment_request)
-    elif method == 'wechat_pay':
-        result = mock_wechat_processor(payment_request)
-    else:
+    with tracing.span("routing", method=method):
+        if method == 'credit_card':
+            return mock_credit_card_processor(payment_request)
+        elif method == 'alipay':
+            return mock_alipay_processor(payment_request)
+        elif method == 'wechat_pay':
+            return mock_wechat_processor(payment_request)
+        return None
+
+def payment_outcome(payment_request, risk, result):
+    """Audit a routed payment and build its checkout response"""
+    if result is None:
+        audit_decision(payment_request, risk, "failed")
         return {
             "status": "failed",
             "transaction_id": None,
@@ -86,8 +184,12 @@ def process_payment(payment_request):
             "message": "不支持的支付方式"
         }
     
+    status = "success" if result['success'] else "failed"
+    if result['success']:
+        record_payment(payment_request)
+    audit_decision(payment_request, risk, status, result['id'])
     return {
-        "status": "success" if result['success'] else "failed",
+        "status": status,
         "transaction_id": result['id'],
         "risk_score": risk['risk_score'],
         "risk_level": risk['risk_level'],
@@ -99,42 +201,153 @@ def process_payment(payment_request):
 @app.post("/checkout")
 def checkout(request: PaymentRequest):
     """Checkout endpoint"""
-    result = process_payment(request.dict())
-    return result
+    # Routing, body read and validation before this point
+    tracing.record("request_parse")
+    with PROFILER.route("/checkout"):
+        if LOAD_SHEDDER:
+            with LOAD_SHEDDER.track():
+                return process_payment(request.dict())
+        result = process_payment(request.dict())
+        return result
+
+def process_batch(payment_requests):
+    """Score the payments of one order together and route the ones not held for 3DS concurrently
+
+    All payments that need a 3DS challenge are stored under one shared
+    transaction ID, so the customer completes a single challenge for the order.
+    """
+    for payment_request in payment_requests:
+        link_payment(payment_request)
+    risks = risk_check_batch(payment_requests, mode=audit_eval_mode())
+    challenged = [i for i, risk in enumerate(risks)
+                  if risk['requires_3ds'] and verify_3ds(payment_requests[i], risk)['status'] == 'challenge']
+    # Processors are called from the pool; each task gets its own copy of the trace context
+    futures = {i: ROUTING_POOL.submit(tracing.wrap(route_payment), payment_requests[i])
+               for i in range(len(payment_requests)) if i not in challenged}
+    
+    items = [None] * len(payment_requests)
+    transaction_id = None
+    if challenged:
+        transaction_id = str(uuid.uuid4())
+        with tracing.span("pending_store", op="put", batch=len(challenged)):
+            pending_transactions[transaction_id] = {
+                "batch": [
+                    {"index": i, "payment_request": payment_requests[i], "risk": risks[i]}
+                    for i in challenged
+                ],
+                "timestamp": random.randint(100000, 999999)
+            }
+        for i in challenged:
+            audit_decision(payment_requests[i], risks[i], "pending_3ds", transaction_id)
+            items[i] = {
+                "status": "pending_3ds",
+                "transaction_id": transaction_id,
+                "risk": risks[i]
+            }
+    for i, future in futures.items():
+        items[i] = payment_outcome(payment_requests[i], risks[i], future.result())
+    
+    statuses = {item['status'] for item in items}
+    if challenged:
+        status = "pending_3ds"
+    else:
+        status = statuses.pop() if len(statuses) == 1 else "partial"
+    response = {"status": status, "transaction_id": transaction_id, "items": items}
+    if challenged:
+        response["next_step"] = "complete_3ds_verification"
+    return response
+
+@app.post("/checkout/batch")
+def checkout_batch(request: BatchCheckoutRequest):
+    """Checkout endpoint for the per-seller payments of one order"""
+    tracing.record("request_parse")
+    if not request.payments:
+        raise HTTPException(status_code=400, detail="支付列表不能为空")
+    if len(request.payments) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"单次最多提交{BATCH_MAX_ITEMS}笔支付")
+    with PROFILER.route("/checkout/batch"):
+        return process_batch([payment.dict() for payment in request.payments])
+
+def score_event(event, llm):
+    """risk_check result for one streamed pre-auth event, with its "id" if it has one"""
+    transaction = PaymentRequest.model_validate(event).model_dump()
+    with tracing.span("stream_event"):
+        risk = risk_check(transaction, llm=llm)
+    if "id" in event:
+        return {"id": event["id"], **risk}
+    return risk
+
+@app.post("/risk/stream")
+async def risk_stream(request: Request, llm: bool = False):
+    """Score a chunked NDJSON body of transactions, streaming back one NDJSON result per line
+
+    llm=true adds LLM insight; lines are then scored in the thread pool,
+    at most STREAM_MAX_IN_FLIGHT at a time.
+    """
+    results = score_stream(request.stream(), lambda event: score_event(event, llm), in_threads=llm)
+    return NDJSONStreamingResponse(results)
 
 @app.post("/3ds-verify")
 def verify_3ds_code(request: ThreeDSVerifyRequest):
     """3DS verification endpoint"""
+    tracing.record("request_parse")
+    with PROFILER.route("/3ds-verify"):
+        return complete_3ds_payment(request)
+
+def complete_3ds_payment(request):
+    """Validate the 3DS code and process the stored payment"""
     result = validate_3ds_code(request)
     
     if result['success']:
         # Retrieve stored transaction data
-        if request.transaction_id not in pending_transactions:
+        with tracing.span("pending_store", op="get"):
+            stored_data = pending_transactions.get(request.transaction_id)
+        if stored_data is None:
             return {
                 "success": False,
                 "message": "交易ID无效或已过期"
             }
         
-        stored_data = pending_transactions[request.transaction_id]
+        if "batch" in stored_data:
+            # One challenge completes every held payment of a /checkout/batch order
+            items = stored_data["batch"]
+            futures = [ROUTING_POOL.submit(tracing.wrap(route_payment), item["payment_request"]) for item in items]
+            with tracing.span("pending_store", op="delete"):
+                del pending_transactions[request.transaction_id]
+            results = []
+            for item, future in zip(items, futures):
+                payment_result = future.result()
+                if payment_result is None:
+                    results.append({"index": item["index"], "status": "failed", "transaction_id": None,
+                                    "message": "不支持的支付方式"})
+                    continue
+                if payment_result['success']:
+                    record_payment(item["payment_request"])
+                results.append({"index": item["index"],
+                                "status": "success" if payment_result['success'] else "failed",
+                                "transaction_id": payment_result['id'],
+                                "payment_message": payment_result['message'],
+                                "risk_score": item["risk"]['risk_score']})
+            # Same rule as process_batch: one shared outcome, otherwise partial
+            statuses = {item['status'] for item in results}
+            result.update({"status": statuses.pop() if len(statuses) == 1 else "partial", "items": results})
+            return result
+        
         payment_request = stored_data["payment_request"]
         risk = stored_data["risk"]
         
         # Process payment with original transaction data
-        method = payment_request['payment_method']
-        if method == 'credit_card':
-            payment_result = mock_credit_card_processor(payment_request)
-        elif method == 'alipay':
-            payment_result = mock_alipay_processor(payment_request)
-        elif method == 'wechat_pay':
-            payment_result = mock_wechat_processor(payment_request)
-        else:
+        payment_result = route_payment(payment_request)
+        if payment_result is None:
             return {
                 "success": False,
                 "message": "不支持的支付方式"
             }
         
         # Clean up stored transaction data
-        del pending_transactions[request.transaction_id]
+        with tracing.span("pending_store", op="delete"):
+            del pending_transactions[request.transaction_id]
+        record_payment(payment_request)
         
         result.update({
             "status": "success",
@@ -142,10 +355,180 @@ def verify_3ds_code(request: ThreeDSVerifyRequest):
             "payment_message": payment_result['message'],
             "risk_score": risk['risk_score']
         })
+    elif LINKAGE_INDEX:
+        record_3ds_failure(request.transaction_id)
     
     return result
 
+def record_3ds_failure(transaction_id):
+    """Count a failed challenge against the fraud-ring clusters of the held payments"""
+    with tracing.span("pending_store", op="get"):
+        stored_data = pending_transactions.get(transaction_id)
+    if stored_data is None:
+        return
+    items = stored_data["batch"] if "batch" in stored_data else [stored_data]
+    for item in items:
+        LINKAGE_INDEX.record_3ds_failure(item["payment_request"])
+
 @app.get("/health")
 def health():
     """Health check endpoint"""
-    return {"status": "ok", "service": "smart-checkout"}
\ No newline at end of file
+    return {"status": "ok", "service": "smart-checkout"}
+
+def require_admin(x_admin_token: str = Header(None)):
+    """Guard for /admin endpoints"""
+    if not ADMIN_TOKEN or x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="无权访问管理接口")
+
+def stats_engine(merchant_id):
+    """Production evaluator, or a cached merchant evaluator when merchant_id is given"""
+    if not merchant_id:
+        return RULE_ENGINE
+    engine = cached_merchant_engine(merchant_id)
+    if engine is None:
+        raise HTTPException(status_code=404, detail="该商户规则未加载")
+    return engine
+
+@app.get("/admin/rule-stats", dependencies=[Depends(require_admin)])
+def get_rule_stats(merchant_id: str = None):
+    """Per-rule evaluation/hit/cost counters"""
+    return stats_engine(merchant_id).stats()
+
+@app.post("/admin/rule-stats/reset", dependencies=[Depends(require_admin)])
+def reset_rule_stats(merchant_id: str = None):
+    """Reset per-rule counters"""
+    engine = stats_engine(merchant_id)
+    engine.reset_stats()
+    return engine.stats()
+
+@app.post("/admin/rule-stats/sampling", dependencies=[Depends(require_admin)])
+def set_rule_stats_sampling(sample_every: int):
+    """Collect rule stats on one in sample_every calls (0 disables), for production and merchant rules"""
+    if sample_every < 0:
+        raise HTTPException(status_code=400, detail="sample_every不能为负数")
+    RULE_ENGINE.sample_every = sample_every
+    set_merchant_sample_every(sample_every)
+    return RULE_ENGINE.stats()
+
+@app.get("/admin/shadow-stats", dependencies=[Depends(require_admin)])
+def get_shadow_stats():
+    """Disagreement stats of shadow rule sets against production"""
+    if not SHADOW_EVALUATOR:
+        raise HTTPException(status_code=404, detail="未配置影子规则（SHADOW_RULES）")
+    return SHADOW_EVALUATOR.snapshot()
+
+@app.post("/admin/shadow-stats/reset", dependencies=[Depends(require_admin)])
+def reset_shadow_stats():
+    """Reset shadow disagreement stats"""
+    if not SHADOW_EVALUATOR:
+        raise HTTPException(status_code=404, detail="未配置影子规则（SHADOW_RULES）")
+    SHADOW_EVALUATOR.reset()
+    return SHADOW_EVALUATOR.snapshot()
+
+@app.get("/admin/audit-stats", dependencies=[Depends(require_admin)])
+def get_audit_stats():
+    """Audit writer counters (enqueued, written, dropped)"""
+    if not AUDIT_WRITER:
+        raise HTTPException(status_code=404, detail="未启用审计日志（AUDIT_LOG_DIR）")
+    return AUDIT_WRITER.stats()
+
+@app.get("/admin/feature-store", dependencies=[Depends(require_admin)])
+def get_feature_store_stats():
+    """Profile cache hit rate and write-behind counters"""
+    if not FEATURE_STORE:
+        raise HTTPException(status_code=404, detail="未启用用户画像存储（FEATURE_STORE_PATH）")
+    return FEATURE_STORE.stats()
+
+@app.get("/admin/linkage", dependencies=[Depends(require_admin)])
+def get_linkage_stats():
+    """Linked checkouts, 3DS failures and generation sizes of the fraud-ring index"""
+    if not LINKAGE_INDEX:
+        raise HTTPException(status_code=404, detail="未启用关联索引（LINKAGE_INDEX）")
+    return LINKAGE_INDEX.stats()
+
+@app.get("/admin/fx-rates", dependencies=[Depends(require_admin)])
+def get_fx_rates():
+    """Current FX snapshot (base currency, as_of, load time) and reload counters"""
+    if not FX_TABLE:
+        raise HTTPException(status_code=404, detail="未加载汇率表（FX_RATES_FILE）")
+    return FX_TABLE.stats()
+
+@app.post("/admin/fx-rates/reload", dependencies=[Depends(require_admin)])
+def reload_fx_rates():
+    """Reload the FX rate file now instead of waiting for the background refresh"""
+    if not FX_TABLE:
+        raise HTTPException(status_code=404, detail="未加载汇率表（FX_RATES_FILE）")
+    if not FX_TABLE.refresh(force=True):
+        raise HTTPException(status_code=400, detail="汇率表加载失败，继续使用当前汇率")
+    return FX_TABLE.stats()
+
+@app.get("/admin/merchant-rules", dependencies=[Depends(require_admin)])
+def get_merchant_rules():
+    """Per-merchant evaluator cache stats"""
+    return merchant_cache_info()
+
+@app.post("/admin/merchant-rules/reload", dependencies=[Depends(require_admin)])
+def reload_merchant_rules():
+    """Drop cached merchant evaluators so edited rule files are reloaded on next use"""
+    clear_merchant_cache()
+    return merchant_cache_info()
+
+@app.get("/admin/llm-gate", dependencies=[Depends(require_admin)])
+def get_llm_gate_stats():
+    """How many LLM-band transactions the local gate model answered without the LLM"""
+    if not LLM_GATE:
+        raise HTTPException(status_code=404, detail="未配置LLM门控模型（LLM_GATE_MODEL）")
+    return LLM_GATE.stats()
+
+@app.get("/admin/llm-usage", dependencies=[Depends(require_admin)])
+def get_llm_usage():
+    """Estimated and actual LLM token usage per prompt template"""
+    return TOKEN_USAGE.snapshot()
+
+@app.post("/admin/llm-usage/reset", dependencies=[Depends(require_admin)])
+def reset_llm_usage():
+    """Reset LLM token usage counters"""
+    TOKEN_USAGE.reset()
+    return TOKEN_USAGE.snapshot()
+
+@app.get("/admin/llm-limiter", dependencies=[Depends(require_admin)])
+def get_llm_limiter_stats():
+    """LLM admission counters, queue depth and queue wait percentiles"""
+    if not LLM_LIMITER:
+        raise HTTPException(status_code=404, detail="未启用LLM限流（LLM_RATE_LIMIT）")
+    return LLM_LIMITER.stats()
+
+@app.post("/admin/llm-limiter/reset", dependencies=[Depends(require_admin)])
+def reset_llm_limiter_stats():
+    """Reset LLM admission counters"""
+    if not LLM_LIMITER:
+        raise HTTPException(status_code=404, detail="未启用LLM限流（LLM_RATE_LIMIT）")
+    LLM_LIMITER.reset()
+    return LLM_LIMITER.stats()
+
+@app.get("/admin/load-shedding", dependencies=[Depends(require_admin)])
+def get_load_shedding_stats():
+    """Current degradation level, last interval p95 and recent state transitions"""
+    if not LOAD_SHEDDER:
+        raise HTTPException(status_code=404, detail="未启用负载降级（SHED_SLO_MS）")
+    return LOAD_SHEDDER.stats()
+
+@app.get("/admin/traces", dependencies=[Depends(require_admin)])
+def get_traces(limit: int = 50, min_duration_ms: float = 0, name: str = None):
+    """Most recent sampled traces, e.g. ?min_duration_ms=200&name=POST%20/checkout"""
+    if not tracing.TRACER:
+        raise HTTPException(status_code=404, detail="未启用链路追踪（TRACE_SAMPLE_RATE）")
+    return {**tracing.TRACER.stats(), "traces": tracing.TRACER.recent(limit, min_duration_ms, name)}
+
+@app.post("/admin/profile", dependencies=[Depends(require_admin)])
+def profile_workers(seconds: float = None, requests: int = None, format: str = "json"):
+    """Sample /checkout and /3ds-verify stacks for N seconds or N requests (at most 60s)
+
+    format=collapsed returns flamegraph.pl input instead of JSON.
+    """
+    if not PROFILER.start(seconds=seconds if seconds or requests else 10, requests=requests):
+        raise HTTPException(status_code=409, detail="已有性能采样在运行")
+    result = PROFILER.wait()
+    if format == "collapsed":
+        return PlainTextResponse(collapsed_text(result))
+    return result
@@ -0,0 +1,238 @@
+"""
+Non-blocking, batched audit log of risk decisions
+
+Records are appended to a bounded in-memory ring buffer and written by a
+background thread in batches to rotated JSONL segment files, with one
+fsync per batch (group commit).
+
+Backpressure: when the buffer is full, enqueue() waits up to
+max_block_ms for space; if the writer still has not caught up, the
+record is dropped and counted in stats()["dropped"]. Requests are
+therefore never delayed by more than max_block_ms, and losses are
+always visible.
+
+Benchmark:
+    python audit_log.py --records 200000
+"""
+
+import argparse
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+
+
+def mask_card_number(card_number):
+    """Keep only the last 4 digits of a card number"""
+    if not card_number:
+        return card_number
+    return "*" * max(len(card_number) - 4, 0) + card_number[-4:]
+
+
+def decision_record(payment_request, risk, status, transaction_id=None):
+    """Build the audit record for one checkout decision"""
+    return {
+        "ts": time.time(),
+        "transaction_id": transaction_id,
+        "status": status,
+        "request": {**payment_request, "card_number": mask_card_number(payment_request.get("card_number"))},
+        "risk_score": risk["risk_score"],
+        "risk_level": risk["risk_level"],
+        "requires_3ds": risk["requires_3ds"],
+        "reasons": risk["reasons"],
+        "llm_insight": risk["llm_insight"]
+    }
+
+
+class AuditWriter:
+    """Background writer of decision records to rotated segment files"""
+
+    def __init__(self, directory, capacity=65536, batch_size=1024, flush_interval=0.2,
+                 segment_bytes=64 * 1024 * 1024, segment_seconds=3600, max_block_ms=5):
+        self.directory = directory
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.max_block = max_block_ms / 1000
+
+        os.makedirs(directory, exist_ok=True)
+        self._start()
+        atexit.register(self.close)
+        # Threads do not survive fork; pre-forked workers get their own writer
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _start(self):
+        self.buffer = deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.write_errors = 0
+
+        self.segment = None
+        self.segment_size = 0
+        self.segment_opened = 0
+        self.segment_seq = 0
+
+        self.thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self.thread.start()
+
+    def _after_fork(self):
+        if not self.closed:
+            self._start()
+
+    def enqueue(self, record):
+        """Add a record; returns False if it had to be dropped"""
+        with self.cond:
+            if len(self.buffer) >= self.capacity:
+                self.cond.wait_for(lambda: len(self.buffer) < self.capacity, timeout=self.max_block)
+                if len(self.buffer) >= self.capacity:
+                    self.dropped += 1
+                    return False
+            self.buffer.append(record)
+            self.enqueued += 1
+            if len(self.buffer) >= self.batch_size:
+                self.cond.notify_all()
+        return True
+
+    def _take_batch(self):
+        with self.cond:
+            self.cond.wait_for(lambda: len(self.buffer) >= self.batch_size or self.closed,
+                               timeout=self.flush_interval)
+            batch = [self.buffer.popleft() for _ in range(min(len(self.buffer), self.batch_size))]
+            # Wake producers waiting for space
+            self.cond.notify_all()
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            try:
+                if batch:
+                    self._write(batch)
+                elif self.closed:
+                    break
+                if self.segment and time.time() - self.segment_opened >= self.segment_seconds:
+                    self._rotate()
+            except OSError as e:
+                # Disk full, EIO, directory removed...: the batch is lost, but the writer keeps
+                # running and starts a new segment with the next batch
+                self.write_errors += 1
+                self.dropped += len(batch)
+                print(f"Audit log write failed, dropped {len(batch)} records: {e}")
+                self._discard_segment()
+        self._close_segment()
+
+    def _write(self, batch):
+        if self.segment is None or self.segment_size >= self.segment_bytes:
+            self._rotate()
+        data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in batch).encode("utf-8")
+        self.segment.write(data)
+        self.segment.flush()
+        os.fsync(self.segment.fileno())
+        self.segment_size += len(data)
+        self.written += len(batch)
+        self.batches += 1
+
+    def _rotate(self):
+        self._close_segment()
+        os.makedirs(self.directory, exist_ok=True)
+        self.segment_seq += 1
+        name = f"audit-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{self.segment_seq:06d}.jsonl"
+        self.segment = open(os.path.join(self.directory, name), "ab")
+        self.segment_size = 0
+        self.segment_opened = time.time()
+
+    def _close_segment(self):
+        if self.segment:
+            self.segment.close()
+            self.segment = None
+
+    def _discard_segment(self):
+        """Drop the current segment after a failed write; it may end with a partial line"""
+        segment, self.segment = self.segment, None
+        if segment:
+            try:
+                segment.close()
+            except OSError:
+                pass
+
+    def close(self):
+        """Flush everything still buffered and stop the writer"""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.thread.join()
+
+    def stats(self):
+        return {
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "write_errors": self.write_errors,
+            "buffered": len(self.buffer),
+            "capacity": self.capacity
+        }
+
+
+def load_audit_writer():
+    """Create the audit writer from environment variables, or None when AUDIT_LOG_DIR is unset"""
+    directory = os.getenv("AUDIT_LOG_DIR")
+    if not directory:
+        return None
+    return AuditWriter(
+        directory,
+        capacity=int(os.getenv("AUDIT_BUFFER_SIZE", "65536")),
+        batch_size=int(os.getenv("AUDIT_BATCH_SIZE", "1024")),
+        flush_interval=float(os.getenv("AUDIT_FLUSH_INTERVAL", "0.2")),
+        segment_bytes=int(os.getenv("AUDIT_SEGMENT_MB", "64")) * 1024 * 1024,
+        segment_seconds=int(os.getenv("AUDIT_SEGMENT_SECONDS", "3600")),
+        max_block_ms=float(os.getenv("AUDIT_MAX_BLOCK_MS", "5"))
+    )
+
+
+def main():
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="Benchmark the audit writer")
+    parser.add_argument("--records", type=int, default=200000)
+    parser.add_argument("--dir", help="segment directory (defaults to a temp dir)")
+    args = parser.parse_args()
+
+    payment_request = {
+        "amount": 6000.0, "currency": "CNY", "payment_method": "credit_card",
+        "card_number": "4111111111111111", "card_country": "CN", "ip_country": "US", "user_history": 0
+    }
+    risk = {"risk_score": 60, "risk_level": "MEDIUM", "requires_3ds": True,
+            "reasons": ["大额交易", "新用户", "跨境交易"], "llm_insight": "基于交易分析，该笔交易风险评分为60。"}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = AuditWriter(args.dir or tmp)
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(args.records):
+            t0 = time.perf_counter_ns()
+            writer.enqueue(decision_record(payment_request, risk, "success"))
+            latencies.append(time.perf_counter_ns() - t0)
+        writer.close()
+        elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        print(json.dumps({
+            **writer.stats(),
+            "records_per_second": round(writer.written / elapsed),
+            "enqueue_p50_us": latencies[len(latencies) // 2] / 1000,
+            "enqueue_p99_us": latencies[int(len(latencies) * 0.99)] / 1000,
+            "enqueue_max_us": latencies[-1] / 1000
+        }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
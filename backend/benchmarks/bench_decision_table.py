@@ -0,0 +1,100 @@
+"""
+Cost of rule evaluation with a precomputed decision table
+
+- per transaction: RuleEngine.decide() in full, fast and table mode on
+  rules.json, and risk_check() end to end (no LLM)
+- agreement: table and full mode give the same decision for every
+  transaction of a synthetic dataset (synth_data.py)
+- size: build time and memory of the table for rule sets of 4-16
+  single-field rules
+
+Usage:
+    python benchmarks/bench_decision_table.py [--rows 200000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import timeit
+import tracemalloc
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+os.environ["OPENAI_API_KEY"] = ""
+
+import risk_service
+from decision_table import DECISION_TABLE_MAX_RULES, compile_decision_table
+from rule_engine import RuleEngine
+from synth_data import TransactionGenerator
+
+
+def per_call(stmt, number, **names):
+    return min(timeit.repeat(stmt, number=number, repeat=5, globals=names)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark decision table mode")
+    parser.add_argument("--rows", type=int, default=200000)
+    args = parser.parse_args()
+
+    with open("rules.json", "r", encoding="utf-8") as f:
+        config = json.load(f)
+    engine = RuleEngine(config, sample_every=0, table_max_rules=DECISION_TABLE_MAX_RULES)
+    transactions = [
+        {"amount": 6000.0, "payment_method": "credit_card", "card_country": "CN", "ip_country": "US",
+         "user_history": 0},
+        {"amount": 120.0, "payment_method": "alipay", "card_country": "CN", "ip_country": "CN", "user_history": 25}
+    ]
+    print("Per transaction (rules.json):")
+    for transaction in transactions:
+        timings = {mode: per_call("engine.decide(t, mode)", 200000, engine=engine, t=transaction, mode=mode)
+                   for mode in ("full", "fast", "table")}
+        print("  " + "  ".join(f"{mode} {us:.3f} us" for mode, us in timings.items())
+              + f"  ({engine.decide(transaction, 'table')[2]})")
+
+    saved = risk_service.RULE_ENGINE
+    risk_service.RULE_ENGINE = engine
+    try:
+        for mode in ("full", "table"):
+            us = per_call("risk_check(t, mode=mode, llm=False)", 50000, risk_check=risk_service.risk_check,
+                          t=transactions[0], mode=mode)
+            print(f"  risk_check() {mode}: {us:.3f} us")
+    finally:
+        risk_service.RULE_ENGINE = saved
+
+    rows = list(TransactionGenerator(seed=1).transactions(args.rows))
+    mismatches = sum(engine.decide(row, "table") != engine.decide(row, "full") for row in rows)
+    start = time.perf_counter()
+    for row in rows:
+        engine.decide(row, "full")
+    full_s = time.perf_counter() - start
+    start = time.perf_counter()
+    for row in rows:
+        engine.decide(row, "table")
+    table_s = time.perf_counter() - start
+    print(f"{args.rows} synthetic transactions: full {full_s * 1000:.0f} ms, table {table_s * 1000:.0f} ms, "
+          f"{mismatches} mismatches")
+
+    print("Table size:")
+    for n in (4, 8, 12, 16):
+        rules = [{"name": f"amount_{i}", "field": "amount", "operator": "gt", "threshold": 1000 * (i + 1),
+                  "score": 5, "message": f"金额超过{1000 * (i + 1)}"} for i in range(n)]
+        big = RuleEngine({**config, "risk_rules": rules}, sample_every=0)
+        tracemalloc.start()
+        start = time.perf_counter()
+        table = compile_decision_table(big, 16)
+        elapsed = time.perf_counter() - start
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        row = {"amount": 7500.0}
+        full = per_call("big.decide(t, 'full')", 50000, big=big, t=row)
+        lookup = per_call("table.lookup(t)", 50000, table=table, t=row)
+        print(f"  {n:2d} rules: {len(table):6d} entries, build {elapsed * 1000:7.1f} ms, {memory / 1e6:5.1f} MB, "
+              f"full {full:.3f} us, lookup {lookup:.3f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Profile lookup latency of the feature store
+
+Fills a store with --users users (each with one card) from synthetic
+payments, then times FeatureStore.features() per transaction:
+- warm: every profile is in the LRU cache
+- cold: cache of 1000 entries, lookups spread over all users, so nearly
+  every lookup reads the SQLite file
+- zipf: a cache of --cache entries under a skewed (Zipf 1.2) access
+  pattern, closer to real traffic
+
+record() (write-behind) is timed too, and the flush rate of the writer.
+
+Usage:
+    python benchmarks/bench_feature_store.py [--users 200000] [--lookups 100000] [--cache 20000]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from feature_store import FeatureStore
+
+KEY = b"bench-card-hash-key-0123456789"
+
+
+def payment(i):
+    return {"user_id": f"u{i}", "card_number": f"4{i:015d}", "amount": 100.0 + i % 500, "ip_country": "CN"}
+
+
+def time_lookups(store, users):
+    latencies = np.empty(len(users))
+    perf_counter = time.perf_counter
+    for n, i in enumerate(users):
+        transaction = payment(i)
+        start = perf_counter()
+        store.features(transaction)
+        latencies[n] = perf_counter() - start
+    return latencies * 1e6
+
+
+def report(name, latencies):
+    p50, p99, p999 = np.percentile(latencies, [50, 99, 99.9])
+    print(f"  {name:<8} p50 {p50:7.1f} us   p99 {p99:7.1f} us   p99.9 {p999:7.1f} us   max {latencies.max():8.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark feature store lookups")
+    parser.add_argument("--users", type=int, default=200000)
+    parser.add_argument("--lookups", type=int, default=100000)
+    parser.add_argument("--cache", type=int, default=20000)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "profiles.db")
+        store = FeatureStore(path, KEY, flush_interval=3600)
+        start = time.perf_counter()
+        for i in range(args.users):
+            store.record(payment(i))
+        recorded = time.perf_counter() - start
+        start = time.perf_counter()
+        store.flush()
+        flushed = time.perf_counter() - start
+        store.close()
+        print(f"record(): {recorded / args.users * 1e6:.1f} us per payment; "
+              f"flush: {2 * args.users / flushed:.0f} profiles/s ({os.path.getsize(path) // 1024 // 1024}MB file)")
+
+        print(f"features() per transaction (user + card profile), {args.lookups} lookups:")
+        warm_users = rng.integers(0, 5000, args.lookups)
+        store = FeatureStore(path, KEY, cache_size=10000)
+        time_lookups(store, warm_users[:10000])
+        report("warm", time_lookups(store, warm_users))
+        store.close()
+
+        store = FeatureStore(path, KEY, cache_size=1000)
+        report("cold", time_lookups(store, rng.integers(0, args.users, args.lookups)))
+        store.close()
+
+        store = FeatureStore(path, KEY, cache_size=args.cache)
+        zipf_users = (rng.zipf(1.2, args.lookups * 2) - 1) % args.users
+        time_lookups(store, zipf_users[:args.lookups])
+        report("zipf", time_lookups(store, zipf_users[args.lookups:]))
+        print(f"  zipf hit rate: {store.stats()['hit_rate']:.1%}")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
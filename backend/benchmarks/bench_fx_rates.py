@@ -0,0 +1,103 @@
+"""
+Cost of currency normalization
+
+- per transaction: FXTable.normalize() and the extra risk_check time
+  for normalized_amount (enrich with and without the FX table)
+- per chunk: normalize_rows() on a replay-sized chunk against a Python
+  loop calling normalize() per row
+- per column: normalize_encoded() on a dictionary-encoded currency
+  column, as stored in synth_data.py / decision_archive.py segments
+- refresh: time to reload the file and swap the snapshot, and lookups
+  running concurrently with reloads
+
+Usage:
+    python benchmarks/bench_fx_rates.py [--rows 50000] [--column-rows 10000000]
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+import timeit
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+os.environ["OPENAI_API_KEY"] = ""
+
+import risk_service
+from fx_rates import FXTable
+
+
+def per_call(stmt, number, **names):
+    return min(timeit.repeat(stmt, number=number, repeat=5, globals=names)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FX normalization")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--column-rows", type=int, default=10_000_000)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    table = FXTable("fx_rates.json", refresh_interval=0)
+    currencies = list(table.snapshot.rates)
+    transaction = {"amount": 6000.0, "currency": "JPY", "payment_method": "credit_card", "ip_country": "CN",
+                   "card_country": "CN", "user_history": 3}
+    print("Per transaction:")
+    lookup = per_call("table.normalize(6000.0, 'JPY')", 200000, table=table)
+    print(f"  normalize():                {lookup:.3f} us")
+    saved = risk_service.FX_TABLE
+    risk_service.FX_TABLE = None
+    without = per_call("enrich(t)", 100000, enrich=risk_service.enrich, t=transaction)
+    risk_service.FX_TABLE = table
+    with_fx = per_call("enrich(t)", 100000, enrich=risk_service.enrich, t=transaction)
+    risk_service.FX_TABLE = saved
+    print(f"  enrich() without FX table:  {without:.3f} us")
+    print(f"  enrich() with FX table:     {with_fx:.3f} us")
+
+    picks = rng.integers(0, len(currencies), args.rows)
+    amounts = rng.lognormal(5.5, 1.2, args.rows)
+    rows = [{"amount": float(a), "currency": currencies[c]} for a, c in zip(amounts, picks)]
+    loop = per_call("[{**r, 'normalized_amount': table.normalize(r['amount'], r['currency'])} for r in rows]",
+                    3, table=table, rows=rows)
+    vectorized = per_call("table.normalize_rows(rows)", 3, table=table, rows=rows)
+    print(f"Chunk of {args.rows} rows:")
+    print(f"  per-row normalize() loop:   {loop / 1000:.1f} ms ({loop / args.rows * 1000:.0f} ns/row)")
+    print(f"  normalize_rows():           {vectorized / 1000:.1f} ms ({vectorized / args.rows * 1000:.0f} ns/row)")
+
+    codes = rng.integers(0, len(currencies), args.column_rows).astype(np.uint8)
+    column = rng.lognormal(5.5, 1.2, args.column_rows)
+    encoded = per_call("table.normalize_encoded(column, codes, currencies)", 1, table=table, column=column,
+                       codes=codes, currencies=currencies)
+    print(f"Column of {args.column_rows} rows (dictionary-encoded currency):")
+    print(f"  normalize_encoded():        {encoded / 1000:.1f} ms ({encoded / args.column_rows * 1000:.1f} ns/row)")
+
+    reload_us = per_call("table.refresh(force=True)", 200, table=table)
+    stop = threading.Event()
+    lookups = [0]
+
+    def reader():
+        while not stop.is_set():
+            for _ in range(1000):
+                table.normalize(100.0, "USD")
+            lookups[0] += 1000
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    start = time.perf_counter()
+    reloads = 0
+    while time.perf_counter() - start < 1.0:
+        table.refresh(force=True)
+        reloads += 1
+    stop.set()
+    thread.join()
+    print(f"Refresh: {reload_us:.0f} us per reload; {reloads} reloads and {lookups[0]} concurrent lookups in 1s, "
+          f"unknown currencies {table.stats()['unknown']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Update and lookup cost of the fraud-ring linkage index
+
+Two measurements:
+- union-find core: --edges random edges between --nodes integer keys
+  (UnionFind.link on key pairs), reporting edges/s and process RSS
+- full index: --checkouts synthetic checkouts with card, IP, user and
+  device identifiers (3 edges each) through LinkageIndex.link and
+  features(), with time advancing so generations rotate; reports
+  per-call latency percentiles and generation sizes
+
+A few fraud rings (one card pool shared by many users, IPs and devices)
+are planted in the checkouts, and the cluster_size seen by ring and
+normal checkouts is printed.
+
+Usage:
+    python benchmarks/bench_linkage.py [--edges 20000000] [--nodes 2000000] [--checkouts 1000000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from linkage import LinkageIndex, UnionFind
+
+BLOCK = 200_000
+
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) // 1024
+    return 0
+
+
+def bench_core(edges, nodes, rng):
+    uf = UnionFind()
+    link = uf.link
+    before = rss_mb()
+    start = time.perf_counter()
+    for offset in range(0, edges, BLOCK):
+        n = min(BLOCK, edges - offset)
+        pairs = rng.integers(0, nodes, (n, 2)).tolist()
+        for pair in pairs:
+            link(pair)
+    elapsed = time.perf_counter() - start
+    largest = max(uf.size[uf.find(x)] for x in range(0, len(uf), max(1, len(uf) // 1000)))
+    print(f"Union-find core: {edges:,} edges over {len(uf):,} nodes in {elapsed:.1f}s "
+          f"({edges / elapsed:,.0f} edges/s, {elapsed / edges * 1e6:.2f} us/edge incl. key lookup), "
+          f"RSS +{rss_mb() - before}MB, largest sampled cluster {largest:,}")
+
+
+def checkouts(n, rng, start_ts, seconds):
+    """Synthetic checkouts from n/4 users, one in 500 coming from one of 5 fraud rings
+
+    Users pay with their own card and device from their household IP
+    (shared by two users); 1% of payments come from a random other IP.
+    Ring members reuse 4 cards from fresh users, devices and IPs.
+    """
+    users = rng.integers(0, n // 4, n)
+    roaming = np.where(rng.random(n) < 0.01, rng.integers(0, n // 8, n), -1)
+    ring = np.where(rng.random(n) < 0.002, rng.integers(0, 5, n), -1)
+    ring_card = rng.integers(0, 4, n)
+    ts = start_ts + np.sort(rng.random(n)) * seconds
+    for i in range(n):
+        if ring[i] >= 0:
+            r = ring[i]
+            yield ts[i], True, {"card_number": f"ring{r}-card{ring_card[i]}", "ip_address": f"ring-ip{i}",
+                                "user_id": f"ring-user{i}", "device_id": f"ring-dev{i}"}
+        else:
+            u = users[i]
+            ip = roaming[i] if roaming[i] >= 0 else u // 2
+            yield ts[i], False, {"card_number": f"card{u}", "ip_address": f"ip{ip}",
+                                 "user_id": f"user{u}", "device_id": f"dev{u}"}
+
+
+def report(name, latencies):
+    p50, p99, p999 = np.percentile(latencies, [50, 99, 99.9])
+    print(f"  {name:<10} p50 {p50:6.1f} us   p99 {p99:6.1f} us   p99.9 {p999:6.1f} us")
+
+
+def bench_index(n, max_nodes, rng):
+    # 24h window, checkouts spread over 3 days so generations rotate every 12h
+    index = LinkageIndex(window=86400, max_nodes=max_nodes)
+    link_us = np.empty(n)
+    features_us = np.empty(n)
+    sizes = {False: [], True: []}
+    perf_counter = time.perf_counter
+    before = rss_mb()
+    start = perf_counter()
+    for i, (ts, is_ring, transaction) in enumerate(checkouts(n, rng, 0.0, 3 * 86400)):
+        t0 = perf_counter()
+        index.link(transaction, now=ts)
+        t1 = perf_counter()
+        features = index.features(transaction)
+        features_us[i] = perf_counter() - t1
+        link_us[i] = t1 - t0
+        if ts > 86400:
+            sizes[is_ring].append(features["cluster_size"])
+    elapsed = perf_counter() - start
+    stats = index.stats()
+    print(f"Full index: {n:,} checkouts ({3 * n:,} edges) in {elapsed:.1f}s including data generation, "
+          f"{stats['rotations']} rotations, generation sizes {[len(g) for g in index.generations]}, "
+          f"RSS +{rss_mb() - before}MB")
+    report("link()", link_us * 1e6)
+    report("features()", features_us * 1e6)
+    for name, is_ring in (("normal", False), ("ring", True)):
+        p50, p99 = np.percentile(sizes[is_ring], [50, 99])
+        print(f"  cluster_size of {name} checkouts after the first day: p50 {p50:.0f}, p99 {p99:.0f}, "
+              f"max {max(sizes[is_ring])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the linkage index")
+    parser.add_argument("--edges", type=int, default=20_000_000)
+    parser.add_argument("--nodes", type=int, default=2_000_000)
+    parser.add_argument("--checkouts", type=int, default=1_000_000)
+    parser.add_argument("--max-nodes", type=int, default=1_000_000)
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+    bench_core(args.edges, args.nodes, rng)
+    bench_index(args.checkouts, args.max_nodes, rng)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+First-call versus steady-state LLM latency, with and without warm-up
+
+Runs against the local TLS stub (benchmarks/tls_stub.py), so the numbers
+isolate client-side setup (lazy imports, TCP, TLS) from inference time.
+Each scenario runs in a fresh process, like a new Lambda container or
+worker.
+
+Usage:
+    python benchmarks/bench_llm_warmup.py [--calls 20]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+TRANSACTION = {
+    "amount": 6000,
+    "currency": "CNY",
+    "payment_method": "credit_card",
+    "user_history": 0,
+    "ip_country": "US",
+    "card_country": "CN"
+}
+
+
+def run_child(calls):
+    """Measure inside a fresh process configured through the environment"""
+    start = time.perf_counter()
+    import llm_service
+    init_ms = (time.perf_counter() - start) * 1000
+
+    latencies = []
+    for _ in range(calls + 1):
+        t0 = time.perf_counter()
+        llm_service.generate_llm_analysis(TRANSACTION, 60, ["大额交易", "新用户", "跨境交易"])
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    print(json.dumps({
+        "init_ms": init_ms,
+        "warmup_ms": llm_service.warmup_ms,
+        "first_call_ms": latencies[0],
+        "steady_p50_ms": statistics.median(latencies[1:]),
+        "steady_max_ms": max(latencies[1:])
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM warm-up benchmark against a local TLS stub")
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.calls)
+        return
+
+    from benchmarks.tls_stub import start_stub
+
+    server, cert, tmp = start_stub()
+    print(f"{'scenario':<12}{'init_ms':>10}{'warmup_ms':>11}{'first_ms':>10}{'steady_p50':>12}{'steady_max':>12}{'conns':>7}")
+    for warmup in ("false", "true"):
+        connections = server.connections
+        env = {
+            **os.environ,
+            "OPENAI_API_KEY": "sk-stub",
+            "OPENAI_BASE_URL": server.base_url,
+            "SSL_CERT_FILE": cert,
+            "LLM_WARMUP": warmup
+        }
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", "--calls", str(args.calls)],
+                                env=env, cwd=BACKEND_DIR, capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        name = "warm-up" if warmup == "true" else "cold"
+        warmup_ms = f"{result['warmup_ms']:.1f}" if result["warmup_ms"] is not None else "-"
+        print(f"{name:<12}{result['init_ms']:>10.1f}{warmup_ms:>11}{result['first_call_ms']:>10.1f}"
+              f"{result['steady_p50_ms']:>12.2f}{result['steady_max_ms']:>12.2f}{server.connections - connections:>7}")
+    server.shutdown()
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Per-transaction cost of composite expression rule sets
+
+Generates rule sets of N expression rules, each an AND/OR of 2-4 atoms
+drawn from a shared pool (threshold comparisons, payment method and
+country checks, amount per past transaction), and times
+RuleEngine.evaluate with and without common subexpression sharing.
+
+Usage:
+    python benchmarks/bench_rule_expressions.py [--rules 100,300,500] [--seed 1]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from rule_engine import RuleEngine
+from rule_expressions import ExpressionSet
+
+TRANSACTIONS = [
+    {"amount": 6000.0, "currency": "CNY", "payment_method": "credit_card", "card_country": "CN",
+     "ip_country": "US", "user_history": 0},
+    {"amount": 120.0, "currency": "CNY", "payment_method": "alipay", "card_country": None,
+     "ip_country": "CN", "user_history": 25},
+    {"amount": 2400.0, "currency": "CNY", "payment_method": "wechat_pay", "card_country": "CN",
+     "ip_country": "CN", "user_history": 2}
+]
+
+
+def atom_pool(rng):
+    atoms = []
+    for threshold in (500, 1000, 2000, 5000, 10000, 20000):
+        atoms.append(f"amount > {threshold}")
+    for threshold in (0, 1, 3, 10):
+        atoms.append(f"user_history <= {threshold}")
+    for ratio in (200, 500, 1000, 3000):
+        atoms.append(f"amount / (user_history + 1) > {ratio}")
+    atoms += [
+        "ip_country != card_country",
+        "payment_method == 'credit_card'",
+        "payment_method in ('alipay', 'wechat_pay')",
+        "ip_country not in ('CN', 'HK', 'MO')",
+        "amount * 0.15 > 600"
+    ]
+    rng.shuffle(atoms)
+    return atoms
+
+
+def make_rules(n, rng):
+    atoms = atom_pool(rng)
+    rules = []
+    for i in range(n):
+        parts = rng.sample(atoms, rng.randint(2, 4))
+        if rng.random() < 0.3:
+            expression = f"({parts[0]} or {parts[1]})" + "".join(f" and {p}" for p in parts[2:])
+        else:
+            expression = " and ".join(parts)
+        if rng.random() < 0.1:
+            expression = f"not ({expression})"
+        rules.append({"name": f"expr_{i}", "operator": "expr", "expression": expression,
+                      "score": rng.randint(1, 10), "message": f"组合规则{i}"})
+    return rules
+
+
+def time_per_call(fn, number=2000):
+    best = min(timeit.repeat(lambda: [fn(t) for t in TRANSACTIONS], number=number, repeat=5))
+    return best / number / len(TRANSACTIONS) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark composite expression rules")
+    parser.add_argument("--rules", default="100,300,500")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    results = []
+    for n in [int(x) for x in args.rules.split(",")]:
+        rng = random.Random(args.seed)
+        rules = make_rules(n, rng)
+        config = {"risk_rules": rules}
+        engine = RuleEngine(config, sample_every=0)
+        unshared = ExpressionSet([(i, r["score"], r["expression"]) for i, r in enumerate(rules)], share=False)
+        shared = engine.expressions
+        for t in TRANSACTIONS:
+            (a, hits_a), (b, hits_b) = shared.evaluate(t), unshared.evaluate(t)
+            assert a == b and sorted(hits_a) == sorted(hits_b)
+        results.append({
+            "rules": n,
+            "shared_subexpressions": shared.shared_count,
+            "no_sharing_us": round(time_per_call(unshared.evaluate), 2),
+            "shared_us": round(time_per_call(shared.evaluate), 2),
+            "engine_evaluate_us": round(time_per_call(engine.evaluate), 2)
+        })
+
+    print(f"{'rules':>6}{'shared':>8}{'no sharing':>12}{'shared':>10}{'evaluate':>10}  (us per transaction)")
+    for r in results:
+        print(f"{r['rules']:>6}{r['shared_subexpressions']:>8}{r['no_sharing_us']:>12}"
+              f"{r['shared_us']:>10}{r['engine_evaluate_us']:>10}")
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
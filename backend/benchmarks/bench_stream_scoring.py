@@ -0,0 +1,160 @@
+"""
+Sustained throughput of the streaming NDJSON scoring endpoint
+
+Two measurements:
+- in process: score_stream over in-memory 64KB chunks, without HTTP
+- end to end: POST /risk/stream on a single uvicorn worker, with a
+  client that writes a chunked body from one thread and reads the
+  NDJSON response from another. The client runs on the same machine,
+  so on one core it competes with the server for the CPU.
+
+The server RSS is read before and after each stream to check that
+memory does not grow with the stream length.
+
+Usage:
+    python benchmarks/bench_stream_scoring.py [--events 20000,200000] [--port 8790]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Production-like settings for both the in-process run and the server
+BENCH_ENV = {"OPENAI_API_KEY": "", "RULE_STATS_SAMPLE_EVERY": "100"}
+os.environ.update(BENCH_ENV)
+
+CHUNK_BYTES = 64 * 1024
+
+
+def make_lines(n, seed=1):
+    rng = random.Random(seed)
+    for i in range(n):
+        yield (json.dumps({
+            "id": i,
+            "amount": rng.choice([80, 300, 2500, 6000, 12000]),
+            "currency": "CNY",
+            "payment_method": rng.choice(["credit_card", "alipay", "wechat_pay"]),
+            "card_country": rng.choice(["CN", "CN", "US"]),
+            "ip_country": rng.choice(["CN", "CN", "JP", "US"]),
+            "user_history": rng.choice([0, 1, 3, 10, 40])
+        }) + "\n").encode()
+
+
+def make_chunks(n):
+    chunk = []
+    size = 0
+    for line in make_lines(n):
+        chunk.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            yield b"".join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield b"".join(chunk)
+
+
+def bench_in_process(n, in_threads):
+    from app import score_event
+    from stream_scoring import score_stream
+
+    chunks = list(make_chunks(n))
+
+    async def source():
+        for chunk in chunks:
+            yield chunk
+
+    async def run():
+        lines = 0
+        async for out in score_stream(source(), lambda event: score_event(event, in_threads), in_threads=in_threads):
+            lines += out.count(b"\n")
+        return lines
+
+    start = time.perf_counter()
+    lines = asyncio.run(run())
+    elapsed = time.perf_counter() - start
+    assert lines == n
+    return n / elapsed
+
+
+def rss_kb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def stream_over_http(port, n):
+    sock = socket.create_connection(("127.0.0.1", port))
+    sock.sendall(b"POST /risk/stream HTTP/1.1\r\nHost: localhost\r\n"
+                 b"Content-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n\r\n")
+
+    def write():
+        for chunk in make_chunks(n):
+            sock.sendall(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+        sock.sendall(b"0\r\n\r\n")
+
+    writer = threading.Thread(target=write)
+    start = time.perf_counter()
+    writer.start()
+    results = 0
+    tail = b""
+    while results < n:
+        data = sock.recv(1 << 16)
+        if not data:
+            break
+        data = tail + data
+        results += data.count(b'{"line"')
+        tail = data[-6:]
+    elapsed = time.perf_counter() - start
+    writer.join()
+    sock.close()
+    assert results == n, results
+    return n / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark POST /risk/stream")
+    parser.add_argument("--events", default="20000,200000")
+    parser.add_argument("--port", type=int, default=8790)
+    args = parser.parse_args()
+    sizes = [int(x) for x in args.events.split(",")]
+
+    print(f"In process, {sizes[0]} events:")
+    print(f"  inline:      {bench_in_process(sizes[0], False):>9.0f} events/s")
+    print(f"  thread pool: {bench_in_process(sizes[0], True):>9.0f} events/s (llm=true path, fallback analysis)")
+
+    env = dict(os.environ, **BENCH_ENV)
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "app:app", "--port", str(args.port),
+                               "--log-level", "warning", "--no-access-log"], cwd=BACKEND_DIR, env=env)
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", args.port)).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+        stream_over_http(args.port, 2000)
+        print("HTTP, one uvicorn worker, client on the same machine:")
+        for n in sizes:
+            before = rss_kb(server.pid)
+            rate = stream_over_http(args.port, n)
+            after = rss_kb(server.pid)
+            print(f"  {n:>7} events: {rate:>9.0f} events/s, server RSS {before // 1024}MB -> {after // 1024}MB")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
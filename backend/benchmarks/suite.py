@@ -0,0 +1,444 @@
+"""
+Microbenchmark suite for the risk and LLM hot paths, with JSON baselines
+
+Benchmarks (per-operation time in microseconds):
+- risk_check/small: risk_check on rules.json, LLM disabled
+- risk_check/large: risk_check on rules.json plus 300 composite expression rules
+- llm/prompt: template selection, rendering and token estimate for one call
+- llm/analysis_stub: generate_llm_analysis against the local TLS stub
+  (client-side cost: prompt, HTTP/TLS round trip, response parsing, usage accounting)
+- pending_store/dict, pending_store/sqlite: put, get and delete of one pending 3DS entry
+- checkout/inprocess: POST /checkout through an in-process ASGI client
+- checkout/p99, checkout/p99_shadow: p99 latency of single POST /checkout
+  calls, without and with shadow rule sets (SHADOW_RULES) scoring every
+  request on the background thread
+
+Inputs come from synth_data.py with a fixed seed, so every run scores the
+same transactions. Each benchmark is calibrated to ~50ms per repeat and
+run --repeats times, split over --rounds passes through the whole suite;
+the per-repeat means are the samples. Latency benchmarks time every
+operation of a repeat (at least LATENCY_MIN_OPS) and use its percentile
+as the sample instead.
+
+compare flags a benchmark as a regression when its median slowed by more
+than --threshold and a two-sided Mann-Whitney U test on the samples gives
+p < --alpha (divided by the number of benchmarks compared), and exits
+with status 1 if any benchmark regressed. Baselines are only comparable
+on the machine that produced them.
+
+Usage:
+    python benchmarks/suite.py run [--filter risk_check] [--repeats 20] [--rounds 4] [--save benchmarks/baselines/local.json]
+    python benchmarks/suite.py compare benchmarks/baselines/baseline.json current.json [--threshold 0.05]
+"""
+
+import argparse
+import contextlib
+import datetime
+import gc
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+
+# Never call a real LLM API and keep per-call logging out of the timings
+os.environ["OPENAI_API_KEY"] = ""
+os.environ["LLM_TOKEN_LOG"] = "false"
+
+TARGET_SECONDS = 0.05
+INPUT_ROWS = 1024
+LATENCY_MIN_OPS = 400
+
+BENCHMARKS = {}
+PERCENTILES = {}
+
+
+def benchmark(name, percentile=None):
+    """Register a context manager that yields the operation to time
+
+    With a percentile, each sample is that percentile of the single
+    operation latencies in a repeat instead of their mean.
+    """
+    def register(setup):
+        BENCHMARKS[name] = contextlib.contextmanager(setup)
+        PERCENTILES[name] = percentile
+        return setup
+    return register
+
+
+def transactions():
+    from synth_data import TransactionGenerator
+    rows = []
+    for row in TransactionGenerator(seed=2024).transactions(INPUT_ROWS):
+        for key in ("ts", "label", "pattern"):
+            del row[key]
+        rows.append(row)
+    return rows
+
+
+def checkout_requests():
+    """transactions() as /checkout bodies: unset optional fields are left out rather than sent as null"""
+    return [{key: value for key, value in row.items() if value is not None} for row in transactions()]
+
+
+def cycling(fn, items):
+    """Operation calling fn on the next item each time"""
+    items = list(items)
+    state = {"i": 0}
+    n = len(items)
+
+    def op():
+        i = state["i"]
+        state["i"] = i + 1 if i + 1 < n else 0
+        return fn(items[i])
+    return op
+
+
+@benchmark("risk_check/small")
+def risk_check_small():
+    from risk_service import risk_check
+    yield cycling(lambda t: risk_check(t, llm=False), transactions())
+
+
+@benchmark("risk_check/large")
+def risk_check_large():
+    import risk_service
+    from benchmarks.bench_rule_expressions import make_rules
+    from rule_engine import RuleEngine
+
+    config = dict(risk_service.RULES_CONFIG)
+    config["risk_rules"] = risk_service.RULES_CONFIG["risk_rules"] + make_rules(300, random.Random(1))
+    saved = risk_service.RULE_ENGINE
+    risk_service.RULE_ENGINE = RuleEngine(config, sample_every=saved.sample_every)
+    try:
+        yield cycling(lambda t: risk_service.risk_check(t, llm=False), transactions())
+    finally:
+        risk_service.RULE_ENGINE = saved
+
+
+@benchmark("llm/prompt")
+def llm_prompt():
+    from prompt_templates import estimate_tokens, get_template
+    from risk_service import risk_check
+
+    items = []
+    for t in transactions()[:256]:
+        risk = risk_check(t, llm=False)
+        items.append((t, risk["risk_score"], risk["reasons"] or ["大额交易"], risk["risk_level"]))
+
+    def build(item):
+        transaction, risk_score, reasons, risk_level = item
+        messages = get_template(risk_level).render(transaction, risk_score, reasons)
+        return sum(estimate_tokens(message["content"]) for message in messages)
+    yield cycling(build, items)
+
+
+@benchmark("llm/analysis_stub")
+def llm_analysis_stub():
+    import llm_service
+    from benchmarks.tls_stub import start_stub
+
+    server, cert, tmp = start_stub()
+    saved = (llm_service.openai_api_key, llm_service.openai_base_url, os.environ.get("SSL_CERT_FILE"))
+    try:
+        os.environ["SSL_CERT_FILE"] = cert
+        llm_service.openai_api_key = "sk-stub"
+        llm_service.openai_base_url = server.base_url
+        llm_service.init_client()
+        reasons = ["大额交易", "新用户", "跨境交易"]
+        yield cycling(lambda t: llm_service.generate_llm_analysis(t, 60, reasons, "MEDIUM"), transactions()[:64])
+    finally:
+        llm_service.openai_api_key, llm_service.openai_base_url, cert_file = saved
+        if cert_file is None:
+            os.environ.pop("SSL_CERT_FILE", None)
+        else:
+            os.environ["SSL_CERT_FILE"] = cert_file
+        llm_service.init_client()
+        server.shutdown()
+        tmp.cleanup()
+
+
+def pending_cycle(store):
+    risk = {"risk_score": 60, "risk_level": "MEDIUM", "requires_3ds": True, "reasons": ["大额交易"],
+            "llm_insight": None}
+    counter = iter(range(1 << 62))
+
+    def op(transaction):
+        key = f"bench-{next(counter)}"
+        store[key] = {"payment_request": transaction, "risk": risk, "timestamp": 123456}
+        store.get(key)
+        del store[key]
+    return op
+
+
+@benchmark("pending_store/dict")
+def pending_store_dict():
+    yield cycling(pending_cycle({}), transactions())
+
+
+@benchmark("pending_store/sqlite")
+def pending_store_sqlite():
+    from pending_store import SqlitePendingStore
+    with tempfile.TemporaryDirectory() as tmp:
+        yield cycling(pending_cycle(SqlitePendingStore(os.path.join(tmp, "pending.db"))), transactions())
+
+
+@benchmark("checkout/inprocess")
+def checkout_inprocess():
+    from fastapi.testclient import TestClient
+    from app import app
+
+    with TestClient(app) as client:
+        yield cycling(lambda t: client.post("/checkout", json=t), checkout_requests())
+
+
+_shadow_evaluator = None
+
+
+def shadow_evaluator():
+    """Shadow rule sets as SHADOW_RULES would load them: rules.json and a 300-rule candidate
+
+    Built once; its scoring thread outlives the benchmark.
+    """
+    global _shadow_evaluator
+    if _shadow_evaluator is None:
+        import risk_service
+        from benchmarks.bench_rule_expressions import make_rules
+        from shadow import ShadowEvaluator
+
+        large = dict(risk_service.RULES_CONFIG)
+        large["risk_rules"] = risk_service.RULES_CONFIG["risk_rules"] + make_rules(300, random.Random(1))
+        _shadow_evaluator = ShadowEvaluator({"rules.json": risk_service.RULES_CONFIG, "large.json": large})
+    return _shadow_evaluator
+
+
+@contextlib.contextmanager
+def checkout_client(shadow):
+    import risk_service
+    from fastapi.testclient import TestClient
+    from app import app
+
+    saved = risk_service.SHADOW_EVALUATOR
+    risk_service.SHADOW_EVALUATOR = shadow
+    try:
+        with TestClient(app) as client:
+            yield cycling(lambda t: client.post("/checkout", json=t), checkout_requests())
+    finally:
+        risk_service.SHADOW_EVALUATOR = saved
+
+
+@benchmark("checkout/p99", percentile=99)
+def checkout_p99():
+    with checkout_client(None) as op:
+        yield op
+
+
+@benchmark("checkout/p99_shadow", percentile=99)
+def checkout_p99_shadow():
+    with checkout_client(shadow_evaluator()) as op:
+        yield op
+
+
+def calibrate(op):
+    """Operations per repeat so that one repeat takes about TARGET_SECONDS"""
+    op()
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            op()
+        elapsed = time.perf_counter() - start
+        if elapsed >= TARGET_SECONDS / 5 or number >= 1 << 20:
+            break
+        number *= 2
+    return max(1, int(number * TARGET_SECONDS / elapsed))
+
+
+def measure(op, number, repeats, percentile=None):
+    """Per-operation seconds for each repeat, after one warm-up repeat
+
+    The garbage collector is off while timing, as in timeit.
+    """
+    gc.collect()
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        samples = []
+        if percentile is not None:
+            latencies = np.empty(number)
+            perf_counter = time.perf_counter
+            for _ in range(repeats + 1):
+                for i in range(number):
+                    start = perf_counter()
+                    op()
+                    latencies[i] = perf_counter() - start
+                samples.append(float(np.percentile(latencies, percentile)))
+            return samples[1:]
+        for _ in range(repeats + 1):
+            start = time.perf_counter()
+            for _ in range(number):
+                op()
+            samples.append((time.perf_counter() - start) / number)
+        return samples[1:]
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def summarize(samples_us):
+    samples = np.array(samples_us)
+    return {
+        "median": round(float(np.median(samples)), 4),
+        "mean": round(float(samples.mean()), 4),
+        "stdev": round(float(samples.std(ddof=1)) if len(samples) > 1 else 0.0, 4),
+        "min": round(float(samples.min()), 4)
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=BACKEND_DIR).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(names, repeats, rounds=4):
+    """Run every benchmark in each of `rounds` passes, spreading its repeats across them
+
+    Interleaving spreads slow drift of the machine (frequency, noisy
+    neighbours) over all samples, so it shows up as variance instead of
+    as a shift in whichever benchmark happened to run during it.
+    """
+    rounds = max(1, min(rounds, repeats))
+    numbers = {}
+    samples = {name: [] for name in names}
+    for r in range(rounds):
+        count = repeats // rounds + (1 if r < repeats % rounds else 0)
+        for name in names:
+            with BENCHMARKS[name]() as op:
+                if name not in numbers:
+                    numbers[name] = calibrate(op)
+                    if PERCENTILES[name] is not None:
+                        numbers[name] = max(numbers[name], LATENCY_MIN_OPS)
+                samples[name] += measure(op, numbers[name], count, PERCENTILES[name])
+
+    results = {}
+    for name in names:
+        samples_us = [round(s * 1e6, 4) for s in samples[name]]
+        results[name] = {"unit": "us", "number": numbers[name], "samples": samples_us, **summarize(samples_us)}
+        statistic = "mean"
+        if PERCENTILES[name] is not None:
+            statistic = results[name]["percentile"] = f"p{PERCENTILES[name]}"
+        print(f"{name:<24}{results[name]['median']:>12.2f} us  (±{results[name]['stdev']:.2f}, "
+              f"{statistic} of {numbers[name]} ops x {repeats})", flush=True)
+    return {
+        "meta": {
+            "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "repeats": repeats,
+            "rounds": rounds
+        },
+        "benchmarks": results
+    }
+
+
+def mann_whitney_p(a, b):
+    """Two-sided p-value of the Mann-Whitney U test (normal approximation with tie correction)"""
+    n1, n2 = len(a), len(b)
+    values = np.concatenate([a, b])
+    order = values.argsort(kind="mergesort")
+    ranks = np.empty(len(values))
+    sorted_values = values[order]
+    # Average ranks over ties
+    unique, first, counts = np.unique(sorted_values, return_index=True, return_counts=True)
+    average = first + (counts + 1) / 2
+    ranks[order] = np.repeat(average, counts)
+    u = ranks[:n1].sum() - n1 * (n1 + 1) / 2
+    n = n1 + n2
+    tie = (counts ** 3 - counts).sum() / (n * (n - 1)) if n > 1 else 0.0
+    sigma = math.sqrt(n1 * n2 / 12 * ((n + 1) - tie))
+    if sigma == 0:
+        return 1.0
+    z = (abs(u - n1 * n2 / 2) - 0.5) / sigma
+    return math.erfc(max(z, 0.0) / math.sqrt(2))
+
+
+def compare(baseline, current, threshold=0.05, alpha=0.01):
+    """Rows of (name, baseline median, current median, change, p, verdict)
+
+    alpha is Bonferroni-corrected for the number of benchmarks compared,
+    so a larger suite does not produce more false alarms.
+    """
+    names = [name for name in baseline["benchmarks"] if name in current["benchmarks"]]
+    alpha = alpha / max(1, len(names))
+    rows = []
+    for name in names:
+        base = baseline["benchmarks"][name]
+        result = current["benchmarks"][name]
+        change = result["median"] / base["median"] - 1
+        p = mann_whitney_p(np.array(base["samples"]), np.array(result["samples"]))
+        if p < alpha and change > threshold:
+            verdict = "regression"
+        elif p < alpha and change < -threshold:
+            verdict = "improvement"
+        else:
+            verdict = "unchanged"
+        rows.append((name, base["median"], result["median"], change, p, verdict))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Risk/LLM hot path microbenchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run benchmarks")
+    run_parser.add_argument("--filter", default="", help="only benchmarks whose name contains this")
+    run_parser.add_argument("--repeats", type=int, default=20)
+    run_parser.add_argument("--rounds", type=int, default=4, help="passes over all benchmarks")
+    run_parser.add_argument("--save", help="write results to this JSON file")
+
+    compare_parser = commands.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.05, help="relative median change")
+    compare_parser.add_argument("--alpha", type=float, default=0.01, help="family-wise significance level")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        names = [name for name in BENCHMARKS if args.filter in name]
+        results = run(names, args.repeats, args.rounds)
+        if args.save:
+            os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+            with open(args.save, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+            print(f"Saved {args.save}")
+        return
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, "r", encoding="utf-8") as f:
+        current = json.load(f)
+    rows = compare(baseline, current, args.threshold, args.alpha)
+    print(f"{'benchmark':<24}{'baseline':>12}{'current':>12}{'change':>9}{'p':>10}  verdict")
+    for name, base, result, change, p, verdict in rows:
+        print(f"{name:<24}{base:>12.2f}{result:>12.2f}{change:>+9.1%}{p:>10.2g}  {verdict}")
+    if any(row[-1] == "regression" for row in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Local TLS stub of the OpenAI-compatible chat completions API
+
+Generates a throwaway self-signed certificate for 127.0.0.1 with the
+openssl CLI and serves keep-alive HTTP/1.1 over TLS. Every accepted
+connection is counted, so callers can see whether connections are reused.
+"""
+
+import json
+import os
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_certificate(directory):
+    """Create a self-signed certificate for 127.0.0.1 and return (cert, key) paths"""
+    cert = os.path.join(directory, "stub.crt")
+    key = os.path.join(directory, "stub.key")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-keyout", key, "-out", cert, "-subj", "/CN=127.0.0.1",
+         "-addext", "subjectAltName=IP:127.0.0.1"],
+        check=True, capture_output=True
+    )
+    return cert, key
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b""):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        self._send(200)
+
+    def do_GET(self):
+        self._send(200, b"{}")
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        self.server.requests.append(request)
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        body = {
+            "id": "stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "风险分析：建议正常处理。"},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 120, "completion_tokens": 12, "total_tokens": 132}
+        }
+        self._send(200, json.dumps(body, ensure_ascii=False).encode("utf-8"))
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, certfile, keyfile, delay=0.0):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.connections = 0
+        self.requests = []
+        self.delay = delay
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(certfile, keyfile)
+        self.socket = context.wrap_socket(self.socket, server_side=True)
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        super().process_request(request, client_address)
+
+    @property
+    def base_url(self):
+        return f"https://127.0.0.1:{self.server_address[1]}"
+
+
+def start_stub(delay=0.0):
+    """Start a stub in a background thread; returns (server, cert path, temp dir)"""
+    tmp = tempfile.TemporaryDirectory()
+    cert, key = make_certificate(tmp.name)
+    server = StubServer(cert, key, delay)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, cert, tmp
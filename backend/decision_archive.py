@@ -0,0 +1,322 @@
+"""
+Columnar archive of checkout decisions with memory-mapped queries
+
+Audit log segments (see audit_log.py) are compacted into columnar
+segments: one directory per segment holding a .npy file per column and a
+meta.json with row count, dictionaries and per-column min/max stats.
+
+- numeric columns are fixed width (ts, amount, user_history, risk_score)
+- currency, payment_method, countries, risk_level and status are
+  dictionary-encoded as uint16 codes
+- reasons are a uint64 bitmask over the segment's reason dictionary
+
+Queries memory-map the columns, skip segments using the min/max stats and
+run vectorized filters and group-bys one segment at a time.
+
+Usage:
+    python decision_archive.py compact AUDIT_LOG_DIR ARCHIVE_DIR
+    python decision_archive.py query ARCHIVE_DIR --group-by ip_country,hour [--where payment_method=credit_card]
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from fx_rates import load_fx_table
+
+NUMERIC_COLUMNS = {
+    "ts": np.int64,
+    "amount": np.float64,
+    "user_history": np.int32,
+    "risk_score": np.int16
+}
+
+DICTIONARY_COLUMNS = ["currency", "payment_method", "ip_country", "card_country", "risk_level", "status"]
+
+BOOL_COLUMNS = ["requires_3ds", "llm_insight"]
+
+# Group-by keys derived from the ts column
+TIME_BUCKETS = {"hour": 3600, "day": 86400}
+
+MANIFEST = "manifest.json"
+
+
+def encode(values):
+    """Dictionary-encode a list of values into (codes, dictionary)"""
+    dictionary = {}
+    codes = np.fromiter((dictionary.setdefault(v, len(dictionary)) for v in values),
+                        dtype=np.uint16, count=len(values))
+    return codes, list(dictionary)
+
+
+def write_segment(records, directory):
+    """Write one columnar segment from decision records"""
+    os.makedirs(directory, exist_ok=True)
+    meta = {"rows": len(records), "dictionaries": {}, "stats": {}}
+
+    for name, dtype in NUMERIC_COLUMNS.items():
+        if name in ("amount", "user_history"):
+            values = [r["request"].get(name) or 0 for r in records]
+        else:
+            values = [r[name] for r in records]
+        column = np.array(values, dtype=dtype)
+        np.save(os.path.join(directory, f"{name}.npy"), column)
+        meta["stats"][name] = {"min": column.min().item(), "max": column.max().item()}
+
+    for name in DICTIONARY_COLUMNS:
+        values = [r[name] if name in r else r["request"].get(name) for r in records]
+        codes, dictionary = encode(values)
+        np.save(os.path.join(directory, f"{name}.npy"), codes)
+        meta["dictionaries"][name] = dictionary
+
+    np.save(os.path.join(directory, "requires_3ds.npy"), np.array([r["requires_3ds"] for r in records], dtype=bool))
+    np.save(os.path.join(directory, "llm_insight.npy"),
+            np.array([r["llm_insight"] is not None for r in records], dtype=bool))
+
+    reason_index = {}
+    masks = np.zeros(len(records), dtype=np.uint64)
+    for i, record in enumerate(records):
+        mask = 0
+        for reason in record["reasons"]:
+            bit = reason_index.setdefault(reason, len(reason_index))
+            if bit >= 64:
+                raise ValueError("一个分段最多支持64种风险原因")
+            mask |= 1 << bit
+        masks[i] = mask
+    np.save(os.path.join(directory, "reasons.npy"), masks)
+    meta["dictionaries"]["reasons"] = list(reason_index)
+
+    with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+
+def compact(audit_dir, archive_dir, segment_rows=1_000_000):
+    """Compact audit JSONL records not yet in the archive.
+
+    The manifest keeps, per audit file, the byte offset up to which it
+    has been compacted, so the segment the AuditWriter is still
+    appending to is picked up again on the next run. Only complete lines
+    are consumed; a batch being written is left for later. Returns the
+    number of records compacted.
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    manifest_path = os.path.join(archive_dir, MANIFEST)
+    manifest = {"offsets": {}, "segments": 0}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    offsets = manifest.setdefault("offsets", {})
+    # Files listed by older manifests were compacted whole
+    done = set(manifest.get("sources", []))
+
+    records = []
+    total = 0
+
+    def flush():
+        nonlocal records, total
+        if records:
+            write_segment(records, os.path.join(archive_dir, f"segment-{manifest['segments']:06d}"))
+            manifest["segments"] += 1
+            total += len(records)
+            records = []
+
+    for path in sorted(glob.glob(os.path.join(audit_dir, "audit-*.jsonl"))):
+        name = os.path.basename(path)
+        offset = offsets.get(name, 0)
+        if name in done or os.path.getsize(path) <= offset:
+            continue
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            records.append(json.loads(line))
+            if len(records) >= segment_rows:
+                flush()
+        offsets[name] = offset + end
+    flush()
+
+    with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(manifest_path + ".tmp", manifest_path)
+    return total
+
+
+class Segment:
+    """A memory-mapped columnar segment"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.rows = meta["rows"]
+        self.dictionaries = meta["dictionaries"]
+        self.stats = meta["stats"]
+        self._columns = {}
+
+    def column(self, name):
+        if name not in self._columns:
+            self._columns[name] = np.load(os.path.join(self.directory, f"{name}.npy"), mmap_mode="r")
+        return self._columns[name]
+
+    def overlaps(self, name, low, high):
+        """Whether the min/max stats allow values within [low, high]"""
+        stats = self.stats[name]
+        return not ((low is not None and stats["max"] < low) or (high is not None and stats["min"] > high))
+
+
+class DecisionArchive:
+    """Query API over the columnar segments of an archive directory"""
+
+    def __init__(self, archive_dir, fx_table=None):
+        # Amounts are summed in the base currency; without a rate file they are summed as stored
+        self.fx_table = fx_table if fx_table is not None else load_fx_table()
+        self.segments = [Segment(path) for path in sorted(glob.glob(os.path.join(archive_dir, "segment-*")))]
+
+    def _mask(self, segment, where, since, until):
+        """Vectorized row filter, or None if the segment cannot match"""
+        if not segment.overlaps("ts", since, until):
+            return None
+        mask = np.ones(segment.rows, dtype=bool)
+        if since is not None or until is not None:
+            ts = segment.column("ts")
+            if since is not None:
+                mask &= ts >= since
+            if until is not None:
+                mask &= ts < until
+        for name, value in where.items():
+            if name in DICTIONARY_COLUMNS:
+                dictionary = segment.dictionaries[name]
+                if value not in dictionary:
+                    return None
+                mask &= segment.column(name) == dictionary.index(value)
+            elif name in BOOL_COLUMNS:
+                mask &= segment.column(name) == bool(value)
+            elif name == "reason":
+                dictionary = segment.dictionaries["reasons"]
+                if value not in dictionary:
+                    return None
+                bit = np.uint64(1 << dictionary.index(value))
+                mask &= (segment.column("reasons") & bit) != 0
+            else:
+                raise ValueError(f"不支持的过滤字段: {name}")
+        return mask
+
+    def _keys(self, segment, name, mask):
+        """Group key codes for the selected rows and a decoder for them"""
+        if name in TIME_BUCKETS:
+            width = TIME_BUCKETS[name]
+            fmt = "%Y-%m-%dT%H:00" if name == "hour" else "%Y-%m-%d"
+            return segment.column("ts")[mask] // width, lambda code: time.strftime(fmt, time.gmtime(int(code) * width))
+        if name in DICTIONARY_COLUMNS:
+            dictionary = segment.dictionaries[name]
+            return segment.column(name)[mask], lambda code: dictionary[int(code)]
+        if name in BOOL_COLUMNS:
+            return segment.column(name)[mask], bool
+        raise ValueError(f"不支持的分组字段: {name}")
+
+    def _normalized_amounts(self, segment, mask):
+        """Amounts of the selected rows in the base currency, converted on the currency codes"""
+        amounts = segment.column("amount")[mask]
+        if not self.fx_table:
+            return amounts
+        return self.fx_table.normalize_encoded(amounts, segment.column("currency")[mask],
+                                               segment.dictionaries["currency"])
+
+    def query(self, group_by=(), where=None, since=None, until=None):
+        """Group selected decisions and aggregate count, 3DS rate, LLM rate, mean score and total amount.
+
+        since/until are unix timestamps (until is exclusive); where maps
+        dictionary/bool columns (or "reason") to a required value.
+        """
+        where = where or {}
+        totals = defaultdict(lambda: [0, 0, 0, 0, 0.0])
+
+        for segment in self.segments:
+            mask = self._mask(segment, where, since, until)
+            if mask is None or not mask.any():
+                continue
+            requires_3ds = segment.column("requires_3ds")[mask]
+            llm = segment.column("llm_insight")[mask]
+            scores = segment.column("risk_score")[mask].astype(np.int64)
+            amounts = self._normalized_amounts(segment, mask)
+
+            if group_by:
+                keys = [self._keys(segment, name, mask) for name in group_by]
+                stacked = np.column_stack([codes.astype(np.int64) for codes, _ in keys])
+                unique, inverse = np.unique(stacked, axis=0, return_inverse=True)
+                inverse = inverse.reshape(-1)
+            else:
+                keys = []
+                unique = np.zeros((1, 0), dtype=np.int64)
+                inverse = np.zeros(len(scores), dtype=np.int64)
+
+            counts = np.bincount(inverse, minlength=len(unique))
+            sums_3ds = np.bincount(inverse, weights=requires_3ds, minlength=len(unique))
+            sums_llm = np.bincount(inverse, weights=llm, minlength=len(unique))
+            sums_score = np.bincount(inverse, weights=scores, minlength=len(unique))
+            sums_amount = np.bincount(inverse, weights=amounts, minlength=len(unique))
+
+            for i, codes in enumerate(unique):
+                key = tuple(decode(code) for code, (_, decode) in zip(codes, keys))
+                total = totals[key]
+                total[0] += int(counts[i])
+                total[1] += int(sums_3ds[i])
+                total[2] += int(sums_llm[i])
+                total[3] += int(sums_score[i])
+                total[4] += float(sums_amount[i])
+
+        return [
+            {
+                **dict(zip(group_by, key)),
+                "count": count,
+                "requires_3ds_rate": n_3ds / count,
+                "llm_rate": n_llm / count,
+                "mean_score": score_sum / count,
+                "total_normalized_amount": amount_sum
+            }
+            for key, (count, n_3ds, n_llm, score_sum, amount_sum) in sorted(totals.items(), key=lambda item: str(item[0]))
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Columnar decision archive")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    compact_parser = commands.add_parser("compact", help="compact audit log segments")
+    compact_parser.add_argument("audit_dir")
+    compact_parser.add_argument("archive_dir")
+    compact_parser.add_argument("--segment-rows", type=int, default=1_000_000)
+
+    query_parser = commands.add_parser("query", help="group-by query over the archive")
+    query_parser.add_argument("archive_dir")
+    query_parser.add_argument("--group-by", default="", help="comma-separated, e.g. ip_country,hour")
+    query_parser.add_argument("--where", action="append", default=[], help="field=value, repeatable")
+    query_parser.add_argument("--since", type=int, help="unix timestamp")
+    query_parser.add_argument("--until", type=int, help="unix timestamp (exclusive)")
+    args = parser.parse_args()
+
+    if args.command == "compact":
+        count = compact(args.audit_dir, args.archive_dir, args.segment_rows)
+        print(f"Compacted {count} decisions")
+        return
+
+    where = {}
+    for item in args.where:
+        name, value = item.split("=", 1)
+        where[name] = value.lower() == "true" if name in BOOL_COLUMNS else value
+    group_by = [name for name in args.group_by.split(",") if name]
+    start = time.perf_counter()
+    rows = DecisionArchive(args.archive_dir).query(group_by, where, args.since, args.until)
+    for row in rows:
+        print(json.dumps(row, ensure_ascii=False))
+    print(f"{len(rows)} groups in {time.perf_counter() - start:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
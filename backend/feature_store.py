@@ -0,0 +1,280 @@
+"""
+Server-side user and card profiles for risk_check
+
+Aggregates per user_id and per card (transaction count, first seen,
+total amount, last IP country) are kept in an embedded SQLite file shared
+by all worker processes.
+
+Reads go through an in-process LRU cache; an entry is reloaded after
+ttl seconds so payments handled by other workers show up. Writes are
+write-behind: record() updates the cached profile at once and queues a
+delta, and a background thread upserts the queued deltas in one
+transaction every flush_interval seconds. Deltas are added in SQL, so
+workers flushing concurrently do not overwrite each other.
+
+Card numbers are stored as keyed BLAKE2b digests (FEATURE_STORE_KEY),
+never in clear. Card numbers have little entropy, so an unkeyed digest
+could be reversed by enumeration; the store refuses to run without a
+key of at least MIN_KEY_BYTES.
+
+Benchmark:
+    python benchmarks/bench_feature_store.py
+"""
+
+import atexit
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Profile fields: count, first_seen, total_amount, last_country
+EMPTY_PROFILE = (0, None, 0.0, None)
+
+UPSERT = """
+INSERT INTO profiles (kind, key, count, first_seen, total_amount, last_country)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (kind, key) DO UPDATE SET
+    count = count + excluded.count,
+    first_seen = min(first_seen, excluded.first_seen),
+    total_amount = total_amount + excluded.total_amount,
+    last_country = excluded.last_country
+"""
+
+
+def merge(profile, delta):
+    """Profile after adding a delta of later payments"""
+    count, first_seen, total_amount, last_country = profile
+    d_count, d_first_seen, d_total_amount, d_last_country = delta
+    if first_seen is None or (d_first_seen is not None and d_first_seen < first_seen):
+        first_seen = d_first_seen
+    return (count + d_count, first_seen, total_amount + d_total_amount, d_last_country or last_country)
+
+
+# Shortest accepted FEATURE_STORE_KEY; BLAKE2b takes keys of up to 64 bytes
+MIN_KEY_BYTES = 16
+
+
+class FeatureStore:
+    """File-backed user/card profiles with an LRU read-through cache and write-behind updates"""
+
+    def __init__(self, path, key, cache_size=100000, ttl=30.0, flush_interval=0.5):
+        if not MIN_KEY_BYTES <= len(key) <= 64:
+            raise ValueError(f"card hashing key must be {MIN_KEY_BYTES} to 64 bytes, got {len(key)}")
+        self.path = path
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.key = key
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS profiles (kind TEXT NOT NULL, key TEXT NOT NULL, "
+                         "count INTEGER NOT NULL, first_seen REAL, total_amount REAL NOT NULL, "
+                         "last_country TEXT, PRIMARY KEY (kind, key)) WITHOUT ROWID")
+        self.cache = OrderedDict()
+        self._start()
+        atexit.register(self.close)
+        # Threads do not survive fork; pre-forked workers get their own writer
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _start(self):
+        self.lock = threading.Lock()
+        # Held while a flush commits, so a cache miss never sees a delta both in the file and in flight
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.pending = {}
+        self.in_flight = {}
+        self.closed = False
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self.written = 0
+        self.flushes = 0
+        self.thread = threading.Thread(target=self._run, name="feature-store-writer", daemon=True)
+        self.thread.start()
+
+    def _after_fork(self):
+        if not self.closed:
+            # Deltas queued before the fork are flushed by the parent
+            self._start()
+
+    def _connection(self):
+        # Connections are per thread and per process (never reused after fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def card_key(self, card_number):
+        return hashlib.blake2b(card_number.encode(), key=self.key, digest_size=16).hexdigest()
+
+    def identities(self, transaction):
+        """(kind, key) pairs the transaction's profiles are stored under"""
+        ids = []
+        user_id = transaction.get('user_id')
+        if user_id:
+            ids.append(("user", str(user_id)))
+        card_number = transaction.get('card_number')
+        if card_number:
+            ids.append(("card", self.card_key(card_number)))
+        return ids
+
+    def profile(self, kind, key):
+        """Current profile, from the cache or loaded from the file"""
+        ident = (kind, key)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.cache.get(ident)
+            if entry is not None and now - entry[1] < self.ttl:
+                self.cache.move_to_end(ident)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        with self.flush_lock:
+            row = self._connection().execute(
+                "SELECT count, first_seen, total_amount, last_country FROM profiles WHERE kind = ? AND key = ?",
+                ident).fetchone()
+            with self.lock:
+                profile = tuple(row) if row else EMPTY_PROFILE
+                # Deltas not yet in the file
+                for queued in (self.in_flight, self.pending):
+                    if ident in queued:
+                        profile = merge(profile, queued[ident])
+                self.cache[ident] = [profile, now]
+                self.cache.move_to_end(ident)
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return profile
+
+    def features(self, transaction, now=None):
+        """Rule fields derived from the stored profiles; empty when the transaction has no identity
+
+        user_history and card_history are server-side payment counts;
+        user_history falls back to the card's count without a user_id.
+        """
+        ids = self.identities(transaction)
+        if not ids:
+            return {}
+        now = time.time() if now is None else now
+        features = {}
+        profiles = {kind: self.profile(kind, key) for kind, key in ids}
+        if "card" in profiles:
+            features["card_history"] = profiles["card"][0]
+        count, first_seen, total_amount, last_country = profiles.get("user") or profiles["card"]
+        features["user_history"] = count
+        features["profile_total_amount"] = total_amount
+        if first_seen is not None:
+            features["profile_age_days"] = (now - first_seen) / 86400
+        if last_country is not None:
+            features["profile_last_country"] = last_country
+        return features
+
+    def enrich(self, transaction):
+        """Copy of the transaction with the client-supplied profile fields replaced by stored ones"""
+        features = self.features(transaction)
+        return {**transaction, **features} if features else transaction
+
+    def record(self, transaction, ts=None):
+        """Add a successful payment to its profiles (write-behind)"""
+        ids = self.identities(transaction)
+        if not ids:
+            return
+        delta = (1, time.time() if ts is None else ts, float(transaction.get('amount') or 0),
+                 transaction.get('ip_country'))
+        with self.lock:
+            for ident in ids:
+                queued = self.pending.get(ident)
+                self.pending[ident] = merge(queued, delta) if queued else delta
+                entry = self.cache.get(ident)
+                if entry is not None:
+                    entry[0] = merge(entry[0], delta)
+            self.recorded += 1
+
+    def _run(self):
+        while not self.closed:
+            self.wakeup.wait(self.flush_interval)
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"Feature store flush failed, retrying: {e}")
+
+    def flush(self):
+        """Write queued deltas to the file in one transaction"""
+        with self.flush_lock:
+            with self.lock:
+                if not self.pending:
+                    return
+                self.in_flight, self.pending = self.pending, {}
+            batch = [ident + delta for ident, delta in self.in_flight.items()]
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(UPSERT, batch)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                # Put the deltas back so they are retried on the next flush
+                with self.lock:
+                    for ident, delta in self.in_flight.items():
+                        queued = self.pending.get(ident)
+                        self.pending[ident] = merge(delta, queued) if queued else delta
+                    self.in_flight = {}
+                raise
+            with self.lock:
+                self.in_flight = {}
+                self.written += len(batch)
+                self.flushes += 1
+
+    def close(self):
+        """Flush queued deltas and stop the writer"""
+        if self.closed:
+            return
+        self.closed = True
+        self.wakeup.set()
+        self.thread.join()
+        self.flush()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "path": self.path,
+                "cached": len(self.cache),
+                "cache_size": self.cache_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "recorded": self.recorded,
+                "pending": len(self.pending),
+                "written": self.written,
+                "flushes": self.flushes
+            }
+
+
+def load_feature_store():
+    """Create the feature store from environment variables, or None when FEATURE_STORE_PATH is unset
+
+    The store stays disabled, with an error logged, when FEATURE_STORE_KEY
+    is missing or too short.
+    """
+    path = os.getenv("FEATURE_STORE_PATH")
+    if not path:
+        return None
+    key = os.getenv("FEATURE_STORE_KEY", "").encode()
+    try:
+        return FeatureStore(
+            path,
+            key,
+            cache_size=int(os.getenv("FEATURE_CACHE_SIZE", "100000")),
+            ttl=float(os.getenv("FEATURE_CACHE_TTL", "30")),
+            flush_interval=float(os.getenv("FEATURE_FLUSH_INTERVAL", "0.5"))
+        )
+    except ValueError as e:
+        print(f"Feature store disabled, FEATURE_STORE_KEY is invalid: {e}")
+        return None
@@ -0,0 +1,168 @@
+"""
+FX rate table for currency-normalized amounts
+
+Rates come from a local JSON file (FX_RATES_FILE, fx_rates.json by
+default): {"base": "CNY", "as_of": "...", "rates": {"USD": 7.12, ...}},
+each rate being the value of one unit of the currency in the base
+currency.
+
+The table is held in an immutable snapshot. A background thread checks
+the file every refresh_interval seconds and, when it changed, builds a
+new snapshot and swaps the reference, so a reader that took a snapshot
+always sees one consistent table. An unreadable or invalid file keeps
+the previous snapshot.
+
+Amounts in currencies missing from the table are passed through
+unconverted and counted in stats()["unknown"].
+
+Only the column methods use NumPy and they import it themselves;
+risk_check goes through normalize() and never loads it.
+"""
+
+import json
+import os
+import threading
+import time
+from types import MappingProxyType
+
+
+class FXSnapshot:
+    """One immutable version of the rate table"""
+
+    __slots__ = ("base", "as_of", "rates", "mtime", "loaded_at")
+
+    def __init__(self, base, as_of, rates, mtime=None):
+        for currency, rate in rates.items():
+            if not isinstance(rate, (int, float)) or rate <= 0:
+                raise ValueError(f"invalid rate for {currency}: {rate!r}")
+        object.__setattr__(self, "base", base)
+        object.__setattr__(self, "as_of", as_of)
+        object.__setattr__(self, "rates", MappingProxyType({c: float(r) for c, r in rates.items()}))
+        object.__setattr__(self, "mtime", mtime)
+        object.__setattr__(self, "loaded_at", time.time())
+
+    def __setattr__(self, name, value):
+        raise AttributeError("FXSnapshot is immutable")
+
+    @classmethod
+    def load(cls, path):
+        mtime = os.stat(path).st_mtime_ns
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data.get("base", "CNY"), data.get("as_of"), data["rates"], mtime)
+
+
+class FXTable:
+    """Current FX snapshot of a rate file, refreshed in the background"""
+
+    def __init__(self, path, refresh_interval=60.0):
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.snapshot = FXSnapshot.load(path)
+        self.unknown = 0
+        self.reloads = 0
+        self.errors = 0
+        self._start()
+        # Threads do not survive fork; pre-forked workers get their own refresher
+        os.register_at_fork(after_in_child=self._start)
+
+    def _start(self):
+        self.stop = threading.Event()
+        if self.refresh_interval > 0:
+            self.thread = threading.Thread(target=self._run, name="fx-refresh", daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while not self.stop.wait(self.refresh_interval):
+            self.refresh()
+
+    def refresh(self, force=False):
+        """Load the file if it changed; returns True when a new snapshot was installed"""
+        try:
+            if not force and os.stat(self.path).st_mtime_ns == self.snapshot.mtime:
+                return False
+            snapshot = FXSnapshot.load(self.path)
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            self.errors += 1
+            print(f"FX rate reload failed, keeping rates as of {self.snapshot.as_of}: {e}")
+            return False
+        # A single reference assignment: readers see the old or the new table, never a mix
+        self.snapshot = snapshot
+        self.reloads += 1
+        return True
+
+    def normalize(self, amount, currency):
+        """Amount in the base currency"""
+        rate = self.snapshot.rates.get(currency)
+        if rate is None:
+            self.unknown += 1
+            return amount
+        return amount * rate
+
+    def normalize_column(self, amounts, currencies):
+        """Vectorized normalize() over an amount array and a sequence of currency codes
+
+        The currencies are dictionary-encoded first (a few distinct values
+        per chunk), then converted with normalize_encoded().
+        """
+        import numpy as np
+
+        index = {}
+        codes = np.fromiter((index.setdefault(currency, len(index)) for currency in currencies),
+                            dtype=np.intp, count=len(currencies))
+        return self.normalize_encoded(amounts, codes, list(index))
+
+    def normalize_encoded(self, amounts, codes, dictionary):
+        """normalize_column() for dictionary-encoded currencies, e.g. decision_archive.py segments"""
+        import numpy as np
+
+        rates = self.snapshot.rates
+        table = np.array([rates.get(currency, np.nan) for currency in dictionary], dtype=np.float64)
+        unknown = np.isnan(table)
+        if unknown.any():
+            self.unknown += int(np.count_nonzero(unknown[codes]))
+            table[unknown] = 1.0
+        return np.asarray(amounts, dtype=np.float64) * table[codes]
+
+    def normalize_rows(self, rows):
+        """Copies of transaction dicts with normalized_amount set, against a single snapshot
+
+        Same rule as risk_service.enrich(): a missing amount stays None.
+        Row dicts have to be walked in Python anyway, so this is a plain
+        dict lookup per row; columnar callers use normalize_column().
+        """
+        rates = self.snapshot.rates
+        result = []
+        unknown = 0
+        for row in rows:
+            amount = row.get("amount")
+            if amount is not None:
+                rate = rates.get(row.get("currency"))
+                if rate is None:
+                    unknown += 1
+                else:
+                    amount = amount * rate
+            result.append({**row, "normalized_amount": amount})
+        self.unknown += unknown
+        return result
+
+    def stats(self):
+        snapshot = self.snapshot
+        return {
+            "path": self.path,
+            "base": snapshot.base,
+            "as_of": snapshot.as_of,
+            "currencies": len(snapshot.rates),
+            "loaded_at": snapshot.loaded_at,
+            "reloads": self.reloads,
+            "errors": self.errors,
+            "unknown": self.unknown
+        }
+
+
+def load_fx_table():
+    """FX table from FX_RATES_FILE (default fx_rates.json); None when unset or the file is missing"""
+    path = os.getenv("FX_RATES_FILE", "fx_rates.json")
+    if not path or not os.path.exists(path):
+        return None
+    return FXTable(path, refresh_interval=float(os.getenv("FX_REFRESH_SECONDS", "60")))
@@ -20,6 +20,7 @@ class PaymentRequest(BaseModel):
     card_country: str = None
     ip_country: str = "CN"
     user_history: int = 0
+    merchant_id: str = None
 
 class ThreeDSVerifyRequest(BaseModel):
     transaction_id: str
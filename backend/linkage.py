@@ -0,0 +1,192 @@
+"""
+In-memory linkage index of cards, IP addresses, users and devices
+
+Every checkout links the identifiers it carries (card_number,
+ip_address, user_id, device_id) in a union-find structure, so a card
+reused from many IPs by many users ends up in one cluster. risk_check
+reads two rule fields from it:
+- cluster_size: number of identifiers in the transaction's cluster
+- cluster_3ds_failures: failed 3DS challenges in that cluster
+
+Updates are union by size with path halving, O(α(n)) amortized.
+
+Union-find cannot forget edges, so the index is kept in generations:
+a new generation starts every window/2 seconds (or once the newest
+holds max_nodes/2 identifiers) and is dropped once it is window seconds
+old (or holds max_nodes identifiers). Checkouts are linked into every
+live generation (normally two) and read from the oldest, so lookups see
+between window/2 and window seconds of history and memory stays bounded
+by about 1.5 x max_nodes identifiers.
+
+The index is per process; each pre-forked worker links the checkouts it
+serves.
+
+Benchmark:
+    python benchmarks/bench_linkage.py
+"""
+
+import os
+import threading
+import time
+
+# Transaction fields linked by the index
+IDENTIFIER_FIELDS = ("card_number", "ip_address", "user_id", "device_id")
+
+
+class UnionFind:
+    """Union-find over hashable keys, with a 3DS failure count per cluster"""
+
+    __slots__ = ("ids", "parent", "size", "failures", "started")
+
+    def __init__(self, started=0.0):
+        self.ids = {}
+        self.parent = []
+        self.size = []
+        self.failures = []
+        self.started = started
+
+    def __len__(self):
+        return len(self.parent)
+
+    def find(self, x):
+        parent = self.parent
+        while parent[x] != x:
+            # Path halving
+            parent[x] = x = parent[parent[x]]
+        return x
+
+    def link(self, keys):
+        """Put all keys in one cluster; returns its root
+
+        Union by size, with find() inlined since this runs on every checkout.
+        """
+        ids = self.ids
+        parent = self.parent
+        size = self.size
+        root = None
+        for key in keys:
+            x = ids.get(key)
+            if x is None:
+                x = ids[key] = len(parent)
+                parent.append(x)
+                size.append(1)
+                self.failures.append(0)
+            else:
+                while parent[x] != x:
+                    parent[x] = x = parent[parent[x]]
+            if root is None or x == root:
+                root = x
+                continue
+            if size[root] < size[x]:
+                root, x = x, root
+            parent[x] = root
+            size[root] += size[x]
+            self.failures[root] += self.failures[x]
+        return root
+
+    def cluster(self, keys):
+        """(size, failures) of the cluster the keys would form, without linking them"""
+        roots = set()
+        unseen = 0
+        for key in keys:
+            index = self.ids.get(key)
+            if index is None:
+                unseen += 1
+            else:
+                roots.add(self.find(index))
+        size = self.size
+        failures = self.failures
+        return unseen + sum(size[root] for root in roots), sum(failures[root] for root in roots)
+
+
+class LinkageIndex:
+    """Generational union-find of transaction identifiers with aging and bounded memory"""
+
+    def __init__(self, window=86400.0, max_nodes=1_000_000):
+        self.window = window
+        self.max_nodes = max_nodes
+        self.lock = threading.Lock()
+        self.generations = []
+        self.linked = 0
+        self.failures = 0
+        self.rotations = 0
+
+    @staticmethod
+    def keys(transaction):
+        keys = []
+        for field in IDENTIFIER_FIELDS:
+            value = transaction.get(field)
+            if value:
+                keys.append(hash((field, value)))
+        return keys
+
+    def _rotate(self, now):
+        generations = self.generations
+        while generations and (now - generations[0].started >= self.window or len(generations[0]) >= self.max_nodes):
+            generations.pop(0)
+            self.rotations += 1
+        if (not generations or now - generations[-1].started >= self.window / 2
+                or len(generations[-1]) >= self.max_nodes / 2):
+            generations.append(UnionFind(now))
+
+    def link(self, transaction, now=None):
+        """Link the identifiers of a checkout"""
+        keys = self.keys(transaction)
+        if not keys:
+            return
+        now = time.time() if now is None else now
+        with self.lock:
+            self._rotate(now)
+            for generation in self.generations:
+                generation.link(keys)
+            self.linked += 1
+
+    def record_3ds_failure(self, transaction, now=None):
+        """Count a failed 3DS challenge against the transaction's cluster"""
+        keys = self.keys(transaction)
+        if not keys:
+            return
+        now = time.time() if now is None else now
+        with self.lock:
+            self._rotate(now)
+            for generation in self.generations:
+                generation.failures[generation.link(keys)] += 1
+            self.failures += 1
+
+    def features(self, transaction):
+        """cluster_size and cluster_3ds_failures; empty when the transaction has no identifiers"""
+        keys = self.keys(transaction)
+        if not keys:
+            return {}
+        with self.lock:
+            if not self.generations:
+                return {"cluster_size": len(keys), "cluster_3ds_failures": 0}
+            size, failures = self.generations[0].cluster(keys)
+        return {"cluster_size": size, "cluster_3ds_failures": failures}
+
+    def enrich(self, transaction):
+        features = self.features(transaction)
+        return {**transaction, **features} if features else transaction
+
+    def stats(self):
+        with self.lock:
+            now = time.time()
+            return {
+                "window_seconds": self.window,
+                "max_nodes": self.max_nodes,
+                "linked": self.linked,
+                "3ds_failures": self.failures,
+                "rotations": self.rotations,
+                "generations": [{"age_seconds": round(now - generation.started, 1), "nodes": len(generation)}
+                                for generation in self.generations]
+            }
+
+
+def load_linkage_index():
+    """Create the linkage index from environment variables, or None unless LINKAGE_INDEX is enabled"""
+    if os.getenv("LINKAGE_INDEX", "false").lower() != "true":
+        return None
+    return LinkageIndex(
+        window=float(os.getenv("LINKAGE_WINDOW_HOURS", "24")) * 3600,
+        max_nodes=int(os.getenv("LINKAGE_MAX_NODES", "1000000"))
+    )
@@ -0,0 +1,218 @@
+"""
+Local logistic-regression gate for LLM analysis
+
+Trained offline with NumPy on labeled decisions (label 1 = fraud /
+needs review, 0 = legitimate) and stored as a small JSON file. Inside
+risk_check the model scores an LLM-band transaction in a few
+microseconds; the LLM is only called when the predicted probability
+falls in the uncertain band [low, high].
+
+NumPy is only imported by the training and evaluation functions, so
+loading a gate in the service (and Lambda cold starts) does not pay for
+it.
+
+Labeled records are JSONL, either transactions with a "label" field or
+audit log records ({"request": {...}, "risk_score": ..., "label": ...}).
+
+Usage:
+    python llm_gate.py train labeled.jsonl --out llm_gate.json [--low 0.1] [--high 0.9]
+    python llm_gate.py evaluate replay.jsonl --model llm_gate.json
+"""
+
+import argparse
+import json
+import math
+
+FEATURE_NAMES = [
+    "log_amount",
+    "log_user_history",
+    "new_user",
+    "cross_border",
+    "credit_card",
+    "alipay",
+    "wechat_pay",
+    "risk_score"
+]
+
+
+def extract_features(transaction, risk_score):
+    """Feature vector for one transaction, in FEATURE_NAMES order"""
+    user_history = transaction.get('user_history') or 0
+    card_country = transaction.get('card_country')
+    method = transaction.get('payment_method')
+    return [
+        math.log1p(max(transaction.get('amount') or 0, 0)),
+        math.log1p(max(user_history, 0)),
+        1.0 if user_history == 0 else 0.0,
+        1.0 if card_country and transaction.get('ip_country') != card_country else 0.0,
+        1.0 if method == 'credit_card' else 0.0,
+        1.0 if method == 'alipay' else 0.0,
+        1.0 if method == 'wechat_pay' else 0.0,
+        risk_score / 100
+    ]
+
+
+class LLMGate:
+    """Logistic regression with standardization folded into the weights"""
+
+    def __init__(self, weights, bias, low=0.1, high=0.9):
+        self.weights = tuple(weights)
+        self.bias = bias
+        self.low = low
+        self.high = high
+        self.checked = 0
+        self.skipped = 0
+
+    def predict(self, transaction, risk_score):
+        """Probability that the transaction is fraudulent"""
+        z = self.bias
+        for w, x in zip(self.weights, extract_features(transaction, risk_score)):
+            z += w * x
+        if z < -35:
+            return 0.0
+        return 1.0 / (1.0 + math.exp(-z))
+
+    def needs_llm(self, transaction, risk_score):
+        """Whether the local model is too uncertain to skip the LLM"""
+        self.checked += 1
+        if self.low <= self.predict(transaction, risk_score) <= self.high:
+            return True
+        self.skipped += 1
+        return False
+
+    def stats(self):
+        return {
+            "checked": self.checked,
+            "llm_skipped": self.skipped,
+            "skip_rate": self.skipped / self.checked if self.checked else 0.0,
+            "low": self.low,
+            "high": self.high
+        }
+
+    def to_dict(self):
+        return {
+            "features": FEATURE_NAMES,
+            "weights": [round(w, 6) for w in self.weights],
+            "bias": round(self.bias, 6),
+            "low": self.low,
+            "high": self.high
+        }
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data["features"] != FEATURE_NAMES:
+            raise ValueError("模型特征与当前版本不一致，请重新训练")
+        return cls(data["weights"], data["bias"], data["low"], data["high"])
+
+
+def load_llm_gate(path):
+    """Load the gate model from a JSON file, or None when no path is given"""
+    return LLMGate.load(path) if path else None
+
+
+def train(X, y, l2=1e-3, iterations=25, low=0.1, high=0.9):
+    """Fit a logistic regression with Newton's method (NumPy only)"""
+    import numpy as np
+
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    mean = X.mean(axis=0)
+    std = X.std(axis=0)
+    std[std == 0] = 1.0
+    Xs = np.hstack([np.ones((len(X), 1)), (X - mean) / std])
+
+    theta = np.zeros(Xs.shape[1])
+    penalty = l2 * np.eye(Xs.shape[1])
+    penalty[0, 0] = 0.0
+    for _ in range(iterations):
+        p = 1.0 / (1.0 + np.exp(-np.clip(Xs @ theta, -35, 35)))
+        gradient = Xs.T @ (p - y) / len(y) + penalty @ theta
+        hessian = (Xs * (p * (1 - p))[:, None]).T @ Xs / len(y) + penalty
+        step = np.linalg.solve(hessian, gradient)
+        theta -= step
+        if np.abs(step).max() < 1e-8:
+            break
+
+    weights = theta[1:] / std
+    bias = theta[0] - float((theta[1:] * mean / std).sum())
+    return LLMGate(weights.tolist(), float(bias), low, high)
+
+
+def load_labeled(path, engine):
+    """Read (features, labels, llm_band) arrays from a JSONL file"""
+    import numpy as np
+
+    X, y, band = [], [], []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            transaction = record.get("request", record)
+            risk_score = record.get("risk_score")
+            if risk_score is None:
+                risk_score = min(engine.evaluate(transaction)[0], engine.max_score)
+            X.append(extract_features(transaction, risk_score))
+            y.append(int(record.get("label", 0)))
+            band.append(risk_score > engine.threshold_llm)
+    return np.array(X), np.array(y), np.array(band, dtype=bool)
+
+
+def evaluate(gate, X, y, band):
+    """LLM-call reduction within the LLM band and accuracy of the skipped decisions"""
+    import numpy as np
+
+    z = X @ np.array(gate.weights) + gate.bias
+    p = 1.0 / (1.0 + np.exp(-np.clip(z, -35, 35)))
+    uncertain = (p >= gate.low) & (p <= gate.high)
+    skipped = band & ~uncertain
+    llm_calls_before = int(band.sum())
+    llm_calls_after = int((band & uncertain).sum())
+    correct = ((p >= 0.5) == (y == 1)) & skipped
+    return {
+        "transactions": len(y),
+        "llm_calls_before": llm_calls_before,
+        "llm_calls_after": llm_calls_after,
+        "llm_call_reduction": 1 - llm_calls_after / llm_calls_before if llm_calls_before else 0.0,
+        "skipped_accuracy": float(correct.sum() / skipped.sum()) if skipped.any() else None
+    }
+
+
+def main():
+    from rule_engine import RuleEngine
+
+    parser = argparse.ArgumentParser(description="Train or evaluate the local LLM gate")
+    commands = parser.add_subparsers(dest="command", required=True)
+    train_parser = commands.add_parser("train")
+    train_parser.add_argument("input")
+    train_parser.add_argument("--out", default="llm_gate.json")
+    train_parser.add_argument("--low", type=float, default=0.1)
+    train_parser.add_argument("--high", type=float, default=0.9)
+    train_parser.add_argument("--l2", type=float, default=1e-3)
+    evaluate_parser = commands.add_parser("evaluate")
+    evaluate_parser.add_argument("input")
+    evaluate_parser.add_argument("--model", default="llm_gate.json")
+    parser.add_argument("--rules", default="rules.json")
+    args = parser.parse_args()
+
+    with open(args.rules, "r", encoding="utf-8") as f:
+        engine = RuleEngine(json.load(f), sample_every=0)
+    X, y, band = load_labeled(args.input, engine)
+
+    if args.command == "train":
+        gate = train(X, y, l2=args.l2, low=args.low, high=args.high)
+        gate.save(args.out)
+        print(json.dumps(gate.to_dict(), indent=2))
+    else:
+        gate = LLMGate.load(args.model)
+    print(json.dumps(evaluate(gate, X, y, band), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Priority-aware admission control for LLM calls
+
+A token bucket (LLM_RATE_LIMIT calls/second, bursts of LLM_BURST) sits
+in front of the DeepSeek API. When no token is free, callers wait in a
+queue ordered by risk score, so transactions close to the 3DS line are
+served before low-risk ones. A caller whose estimated wait exceeds
+LLM_MAX_QUEUE_WAIT_MS is rejected immediately, and one that is overtaken
+by higher-risk callers gives up at the deadline; both then use the
+fallback analysis text instead of the LLM.
+"""
+
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+
+
+class LLMAdmission:
+    """Token bucket with a priority wait queue"""
+
+    def __init__(self, rate, burst=1, max_wait_ms=2000, window=1024):
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait_ms / 1000
+        self.window = window
+        self._start()
+        # Locks held by other threads at fork time would never be released
+        os.register_at_fork(after_in_child=self._start)
+
+    def _start(self):
+        self.cond = threading.Condition()
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.waiters = []
+        self.seq = itertools.count()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.max_queue_depth = 0
+        self.waits = deque(maxlen=self.window)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return now
+
+    def acquire(self, priority, max_wait=None):
+        """Wait for a call slot; returns False if none is available within max_wait seconds"""
+        max_wait = self.max_wait if max_wait is None else max_wait
+        with self.cond:
+            start = self._refill()
+            if not self.waiters and self.tokens >= 1:
+                self.tokens -= 1
+                self.admitted += 1
+                self.waits.append(0.0)
+                return True
+
+            # Callers with the same or higher priority are served first
+            ahead = sum(1 for waiter in self.waiters if -waiter[0] >= priority)
+            if (ahead + 1 - self.tokens) / self.rate > max_wait:
+                self.rejected += 1
+                return False
+
+            entry = (-priority, next(self.seq))
+            heapq.heappush(self.waiters, entry)
+            self.max_queue_depth = max(self.max_queue_depth, len(self.waiters))
+            deadline = start + max_wait
+            try:
+                while True:
+                    now = self._refill()
+                    if self.waiters[0] == entry and self.tokens >= 1:
+                        heapq.heappop(self.waiters)
+                        self.tokens -= 1
+                        self.admitted += 1
+                        self.waits.append(now - start)
+                        return True
+                    if now >= deadline:
+                        self.timed_out += 1
+                        return False
+                    timeout = deadline - now
+                    if self.waiters[0] == entry:
+                        timeout = min(timeout, (1 - self.tokens) / self.rate)
+                    self.cond.wait(timeout)
+            finally:
+                if entry in self.waiters:
+                    self.waiters.remove(entry)
+                    heapq.heapify(self.waiters)
+                # The next waiter may now be at the head of the queue
+                self.cond.notify_all()
+
+    def stats(self):
+        with self.cond:
+            waits = sorted(self.waits)
+            return {
+                "rate": self.rate,
+                "burst": self.burst,
+                "max_wait_ms": self.max_wait * 1000,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "queue_depth": len(self.waiters),
+                "max_queue_depth": self.max_queue_depth,
+                "wait_p50_ms": waits[len(waits) // 2] * 1000 if waits else 0.0,
+                "wait_p95_ms": waits[int(len(waits) * 0.95)] * 1000 if waits else 0.0,
+                "wait_max_ms": waits[-1] * 1000 if waits else 0.0
+            }
+
+    def reset(self):
+        with self.cond:
+            self._reset_stats()
+
+
+def load_llm_limiter():
+    """Create the limiter from environment variables, or None when LLM_RATE_LIMIT is unset or 0"""
+    rate = float(os.getenv("LLM_RATE_LIMIT", "0"))
+    if rate <= 0:
+        return None
+    return LLMAdmission(
+        rate,
+        burst=int(os.getenv("LLM_BURST", "5")),
+        max_wait_ms=float(os.getenv("LLM_MAX_QUEUE_WAIT_MS", "2000"))
+    )
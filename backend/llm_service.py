@@ -1,6 +1,12 @@
 import os
+import time
+import httpx
 from dotenv import load_dotenv
 from openai import OpenAI
+from openai.types.chat import ChatCompletion
+from llm_limiter import load_llm_limiter
+import tracing
+from prompt_templates import PROMPT_VERSION, TOKEN_USAGE, estimate_tokens, get_template, parse_batch
 
 # Load environment variables
 load_dotenv()
@@ -10,79 +16,160 @@ openai_api_key = os.getenv("OPENAI_API_KEY")
 openai_base_url = os.getenv("OPENAI_BASE_URL", "https://api.deepseek.com")
 openai_model = os.getenv("OPENAI_MODEL", "deepseek-chat")
 
-# Only initialize client if API key is available
+# Connection pool and warm-up settings
+llm_warmup = os.getenv("LLM_WARMUP", "false").lower() == "true"
+llm_max_connections = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+llm_max_keepalive = int(os.getenv("LLM_MAX_KEEPALIVE", "10"))
+llm_keepalive_expiry = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "120"))
+llm_timeout = float(os.getenv("LLM_TIMEOUT", "30"))
+# Print estimated and actual token counts for every LLM call
+llm_token_log = os.getenv("LLM_TOKEN_LOG", "true").lower() == "true"
+
 client = None
-if openai_api_key and openai_api_key != "your_openai_api_key_here":
-    client = OpenAI(
-        api_key=openai_api_key,
-        base_url=openai_base_url
+http_client = None
+warmup_ms = None
+
+# Token-bucket admission in front of the API, prioritized by risk score (LLM_RATE_LIMIT)
+LLM_LIMITER = load_llm_limiter()
+
+
+def init_client():
+    """Create the OpenAI client with explicit pool limits; warm it up if LLM_WARMUP is set"""
+    global client, http_client, warmup_ms
+    client = None
+    http_client = None
+    warmup_ms = None
+    # Only initialize client if API key is available
+    if openai_api_key and openai_api_key != "your_openai_api_key_here":
+        http_client = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=llm_max_connections,
+                max_keepalive_connections=llm_max_keepalive,
+                keepalive_expiry=llm_keepalive_expiry
+            ),
+            timeout=llm_timeout
+        )
+        client = OpenAI(
+            api_key=openai_api_key,
+            base_url=openai_base_url,
+            http_client=http_client
+        )
+        if llm_warmup:
+            warm_up()
+
+
+def warm_up():
+    """Pay DNS, TCP and TLS setup now by opening a pooled connection to OPENAI_BASE_URL"""
+    global warmup_ms
+    start = time.perf_counter()
+    # Resolve lazily imported resources and build the response models before the first request
+    client.chat.completions
+    ChatCompletion.construct(
+        id="warmup", object="chat.completion", created=0, model=openai_model,
+        choices=[{"index": 0, "message": {"role": "assistant", "content": ""}, "finish_reason": "stop"}],
+        usage={"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
     )
+    try:
+        http_client.head(openai_base_url)
+    except httpx.HTTPError as e:
+        print(f"LLM连接预热失败: {str(e)}")
+        return None
+    warmup_ms = (time.perf_counter() - start) * 1000
+    return warmup_ms
 
 
-def generate_llm_analysis(transaction, risk_score, reasons):
-    """Generate LLM analysis for risk assessment using DeepSeek"""
-    if not client:
-        # Fallback to mock analysis if client not initialized
-        return f"基于交易分析，该笔交易风险评分为{risk_score}，主要风险因素包括：{', '.join(reasons)}。建议{'加强监控' if risk_score > 50 else '正常处理'}。"
+init_client()
+# Pooled connections must not be shared with forked workers
+os.register_at_fork(after_in_child=init_client)
+
+
+def fallback_analysis(risk_score, reasons):
+    """Mock analysis text used when the LLM is not called"""
+    return f"基于交易分析，该笔交易风险评分为{risk_score}，主要风险因素包括：{', '.join(reasons)}。建议{'加强监控' if risk_score > 50 else '正常处理'}。"
+
+
+def _admit(risk_score):
+    """Wait for LLM admission; False means the caller should fall back"""
+    if not LLM_LIMITER:
+        return True
+    with tracing.span("llm_admission") as span:
+        admitted = LLM_LIMITER.acquire(risk_score)
+        span.set("admitted", admitted)
+    return admitted
+
+
+def _complete(template, messages, max_tokens, **attributes):
+    """Call the API with a rendered template, record token usage and return the answer text"""
+    estimated = sum(estimate_tokens(message["content"]) for message in messages)
     
-    try:
-        # Prepare transaction context for LLM
-        transaction_context = {
-            "amount": transaction.get('amount', 0),
-            "currency": transaction.get('currency', 'CNY'),
-            "payment_method": transaction.get('payment_method', 'unknown'),
-            "user_history": transaction.get('user_history', 0),
-            "ip_country": transaction.get('ip_country', 'unknown'),
-            "card_country": transaction.get('card_country', 'unknown')
-        }
-        
-        # Create prompt for LLM
-        prompt = f"""
-你是一个专业的支付风控分析师。请分析以下交易的风险情况：
-
-交易信息：
-- 金额: {transaction_context['amount']} {transaction_context['currency']}
-- 支付方式: {transaction_context['payment_method']}
-- 用户历史交易次数: {transaction_context['user_history']}
-- IP地址国家: {transaction_context['ip_country']}
-- 卡片国家: {transaction_context['card_country']}
-
-风险评分: {risk_score}/100
-风险因素: {', '.join(reasons)}
-
-请提供详细的风险分析，包括：
-1. 对主要风险因素的评估
-2. 潜在的欺诈风险
-3. 建议的处理措施
-
-请用中文回答，保持专业和简洁。
-"""
-        
-        # Call DeepSeek API
+    # Call DeepSeek API
+    with tracing.span("llm", template=template.key, est_prompt_tokens=estimated, **attributes) as span:
+        start = time.perf_counter()
         response = client.chat.completions.create(
             model=openai_model,
-            messages=[
-                {
-                    "role": "system",
-                    "content": "你是一个专业的支付风控分析师，擅长识别交易风险和提供风控建议。"
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            temperature=0.7,
-            max_tokens=500
+            messages=messages,
+            temperature=template.temperature,
+            max_tokens=max_tokens
         )
+        latency_ms = (time.perf_counter() - start) * 1000
         
-        # Extract and return analysis
-        analysis = response.choices[0].message.content.strip()
-        return analysis
+        usage = response.usage
+        if usage:
+            span.set("prompt_tokens", usage.prompt_tokens)
+            span.set("completion_tokens", usage.completion_tokens)
+    TOKEN_USAGE.record(template, estimated, usage, latency_ms)
+    if llm_token_log:
+        print(f"LLM调用 template={template.key} est_prompt={estimated} "
+              f"prompt={usage.prompt_tokens if usage else None} "
+              f"completion={usage.completion_tokens if usage else None} latency={latency_ms:.0f}ms")
+    
+    return response.choices[0].message.content.strip()
+
+
+def generate_llm_analysis(transaction, risk_score, reasons, risk_level="MEDIUM"):
+    """Generate LLM analysis for risk assessment using DeepSeek"""
+    if not client:
+        # Fallback to mock analysis if client not initialized
+        return fallback_analysis(risk_score, reasons)
+    
+    if not _admit(risk_score):
+        # Rate limited: waiting longer would exceed LLM_MAX_QUEUE_WAIT_MS
+        return fallback_analysis(risk_score, reasons)
+    
+    try:
+        # Compact, versioned prompt with a max_tokens budget per risk level
+        template = get_template(risk_level)
+        messages = template.render(transaction, risk_score, reasons)
+        return _complete(template, messages, template.max_tokens)
         
     except Exception as e:
         # Fallback to mock analysis if API call fails
         print(f"LLM API调用失败: {str(e)}")
-        return f"基于交易分析，该笔交易风险评分为{risk_score}，主要风险因素包括：{', '.join(reasons)}。建议{'加强监控' if risk_score > 50 else '正常处理'}。"
+        return fallback_analysis(risk_score, reasons)
+
+
+def generate_llm_batch_analysis(items):
+    """One LLM call analysing several (transaction, risk_score, reasons, risk_level) of an order
+
+    Returns one analysis per item; items the model did not answer get
+    the fallback analysis.
+    """
+    if len(items) == 1:
+        return [generate_llm_analysis(*items[0])]
+    fallbacks = [fallback_analysis(risk_score, reasons) for _, risk_score, reasons, _ in items]
+    if not client or not _admit(max(risk_score for _, risk_score, _, _ in items)):
+        return fallbacks
+    
+    try:
+        template = get_template("BATCH")
+        messages = template.render_batch([item[:3] for item in items])
+        answers = parse_batch(_complete(template, messages, template.max_tokens * len(items), batch=len(items)),
+                              len(items))
+        return [answer or fallback for answer, fallback in zip(answers, fallbacks)]
+        
+    except Exception as e:
+        print(f"LLM API调用失败: {str(e)}")
+        return fallbacks
 
 
 def get_llm_status():
@@ -91,5 +178,12 @@ def get_llm_status():
         "configured": bool(client),
         "model": openai_model,
         "base_url": openai_base_url,
+        "warmup_ms": warmup_ms,
+        "prompt_version": PROMPT_VERSION,
+        "pool": {
+            "max_connections": llm_max_connections,
+            "max_keepalive_connections": llm_max_keepalive,
+            "keepalive_expiry": llm_keepalive_expiry
+        },
         "api_key_provided": bool(openai_api_key and openai_api_key != "your_openai_api_key_here")
     }
\ No newline at end of file
@@ -0,0 +1,149 @@
+"""
+Latency-driven load shedding of the advisory LLM analysis
+
+The controller tracks /checkout latency and the number of in-flight
+checkouts. Once per SHED_INTERVAL seconds it compares the p95 latency of
+that interval with SHED_SLO_MS:
+
+- over the SLO (or more than SHED_MAX_IN_FLIGHT in flight): go up one level
+- below SHED_RECOVER_RATIO x SLO: come back down one level
+
+At level k (1..SHED_LEVELS) the effective requires_llm_insight threshold
+is raised by k x SHED_STEP, so only the riskiest transactions still get
+an LLM analysis. Above SHED_LEVELS every LLM-band transaction gets the
+fallback text. Payments and 3DS decisions are never affected.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class LoadShedder:
+    """Adaptive controller that degrades LLM insight while checkout is slow"""
+
+    def __init__(self, slo_ms, max_in_flight=64, step=10, levels=3, interval=1.0,
+                 recover_ratio=0.8, min_samples=20):
+        self.slo_ms = slo_ms
+        self.max_in_flight = max_in_flight
+        self.step = step
+        self.levels = levels
+        self.interval = interval
+        self.recover_ratio = recover_ratio
+        self.min_samples = min_samples
+        self._start()
+        # The lock may be held by another thread at fork time
+        os.register_at_fork(after_in_child=self._start)
+
+    def _start(self):
+        self.lock = threading.Lock()
+        self.level = 0
+        self.in_flight = 0
+        self.latencies = []
+        self.last_adjust = time.monotonic()
+        self.last_p95_ms = None
+        self.skipped = 0
+        self.fallbacks = 0
+        self.transitions = deque(maxlen=50)
+
+    @contextmanager
+    def track(self):
+        """Measure one checkout request"""
+        with self.lock:
+            self.in_flight += 1
+        self._maybe_adjust()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            latency_ms = (time.perf_counter() - start) * 1000
+            with self.lock:
+                self.in_flight -= 1
+                self.latencies.append(latency_ms)
+            self._maybe_adjust()
+
+    def _maybe_adjust(self):
+        now = time.monotonic()
+        if now - self.last_adjust < self.interval:
+            return
+        with self.lock:
+            if now - self.last_adjust < self.interval:
+                return
+            self.last_adjust = now
+            latencies, self.latencies = sorted(self.latencies), []
+            # Too few samples to judge latency: only the in-flight count counts
+            p95 = latencies[int(len(latencies) * 0.95)] if len(latencies) >= self.min_samples else None
+            self.last_p95_ms = p95
+
+            overloaded = self.in_flight > self.max_in_flight or (p95 is not None and p95 > self.slo_ms)
+            healthy = (self.in_flight <= self.max_in_flight * self.recover_ratio
+                       and (p95 is None or p95 < self.slo_ms * self.recover_ratio))
+            if overloaded and self.level <= self.levels:
+                self._transition(self.level + 1, p95)
+            elif healthy and self.level > 0:
+                self._transition(self.level - 1, p95)
+
+    def _transition(self, level, p95):
+        transition = {
+            "ts": time.time(),
+            "from": self.state_name(self.level),
+            "to": self.state_name(level),
+            "p95_ms": p95,
+            "in_flight": self.in_flight
+        }
+        self.level = level
+        self.transitions.append(transition)
+        p95_text = f"{p95:.1f}ms" if p95 is not None else "样本不足"
+        print(f"负载降级状态变化: {transition['from']} -> {transition['to']} "
+              f"(p95={p95_text}, 进行中={self.in_flight})")
+
+    def state_name(self, level):
+        if level == 0:
+            return "normal"
+        if level > self.levels:
+            return "fallback"
+        return f"raised_{level}"
+
+    def llm_action(self, risk_score, threshold_llm):
+        """Return "llm", "skip" (below the raised threshold) or "fallback" for an LLM-band transaction"""
+        level = self.level
+        if level == 0:
+            return "llm"
+        if level > self.levels:
+            self.fallbacks += 1
+            return "fallback"
+        if risk_score > threshold_llm + level * self.step:
+            return "llm"
+        self.skipped += 1
+        return "skip"
+
+    def stats(self):
+        with self.lock:
+            return {
+                "state": self.state_name(self.level),
+                "level": self.level,
+                "threshold_offset": min(self.level, self.levels) * self.step,
+                "slo_ms": self.slo_ms,
+                "last_p95_ms": self.last_p95_ms,
+                "in_flight": self.in_flight,
+                "llm_skipped": self.skipped,
+                "llm_fallbacks": self.fallbacks,
+                "transitions": list(self.transitions)
+            }
+
+
+def load_load_shedder():
+    """Create the controller from environment variables, or None when SHED_SLO_MS is unset or 0"""
+    slo_ms = float(os.getenv("SHED_SLO_MS", "0"))
+    if slo_ms <= 0:
+        return None
+    return LoadShedder(
+        slo_ms,
+        max_in_flight=int(os.getenv("SHED_MAX_IN_FLIGHT", "64")),
+        step=int(os.getenv("SHED_STEP", "10")),
+        levels=int(os.getenv("SHED_LEVELS", "3")),
+        interval=float(os.getenv("SHED_INTERVAL", "1")),
+        recover_ratio=float(os.getenv("SHED_RECOVER_RATIO", "0.8"))
+    )
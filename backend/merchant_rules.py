@@ -0,0 +1,179 @@
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from rule_engine import RISK_EVAL_MODE, RULE_STATS_SAMPLE_EVERY, RuleEngine
+
+# Directory of per-merchant rule sets named <merchant_id>.json
+MERCHANT_RULES_DIR = os.getenv("MERCHANT_RULES_DIR")
+
+# Maximum number of compiled merchant evaluators kept in memory
+MERCHANT_CACHE_SIZE = int(os.getenv("MERCHANT_CACHE_SIZE", "256"))
+
+# Largest merchant rule set that gets a decision table in table mode: 2**10 entries take about 0.2MB
+MERCHANT_TABLE_MAX_RULES = int(os.getenv("MERCHANT_TABLE_MAX_RULES", "10"))
+
+# Memory for the decision tables of all cached merchant evaluators
+MERCHANT_TABLE_MEMORY_MB = float(os.getenv("MERCHANT_TABLE_MEMORY_MB", "64"))
+
+# Rule stats sampling interval of merchant evaluators; changed with set_merchant_sample_every()
+MERCHANT_SAMPLE_EVERY = RULE_STATS_SAMPLE_EVERY
+
+# Maximum number of merchant ids remembered as having no rule set
+MERCHANT_MISSING_CACHE_SIZE = int(os.getenv("MERCHANT_MISSING_CACHE_SIZE", "65536"))
+
+MERCHANT_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class MerchantEngineCache:
+    """LRU of compiled merchant evaluators, bounded by count and by decision table memory
+
+    A merchant is compiled by one thread at a time; concurrent first
+    requests for it wait for that compile instead of repeating it.
+    """
+
+    def __init__(self, max_size, max_table_bytes):
+        self.max_size = max_size
+        self.max_table_bytes = max_table_bytes
+        self.lock = threading.Lock()
+        self.engines = OrderedDict()
+        self.compiling = {}
+        self.table_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, merchant_id, compile_engine):
+        with self.lock:
+            engine = self.engines.get(merchant_id)
+            if engine is not None:
+                self.engines.move_to_end(merchant_id)
+                self.hits += 1
+                return engine
+            compiling = self.compiling.setdefault(merchant_id, threading.Lock())
+
+        with compiling:
+            with self.lock:
+                engine = self.engines.get(merchant_id)
+                if engine is not None:
+                    self.hits += 1
+                    return engine
+                self.misses += 1
+            try:
+                engine = compile_engine(merchant_id)
+            except BaseException:
+                with self.lock:
+                    self.compiling.pop(merchant_id, None)
+                raise
+            with self.lock:
+                self._insert(merchant_id, engine)
+                self.compiling.pop(merchant_id, None)
+            return engine
+
+    def _insert(self, merchant_id, engine):
+        self.engines[merchant_id] = engine
+        self.table_bytes += table_bytes(engine)
+        while len(self.engines) > 1 and (len(self.engines) > self.max_size
+                                         or self.table_bytes > self.max_table_bytes):
+            _, evicted = self.engines.popitem(last=False)
+            self.table_bytes -= table_bytes(evicted)
+            self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.engines.clear()
+            self.table_bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+
+def table_bytes(engine):
+    return engine.decision_table.nbytes if engine.decision_table else 0
+
+
+ENGINE_CACHE = MerchantEngineCache(MERCHANT_CACHE_SIZE, int(MERCHANT_TABLE_MEMORY_MB * 1024 * 1024))
+
+# Merchants without a rule file. Kept apart from the engine LRU so that a
+# stream of unknown ids cannot evict compiled engines; cleared when full.
+_missing = set()
+
+# Merchants whose rule file could not be compiled, with the error. They use
+# the default rules until clear_merchant_cache(), so a bad file is parsed
+# once rather than on every request.
+_invalid = {}
+
+
+def _compile_merchant_engine(merchant_id):
+    """Compile a merchant's rule set; FileNotFoundError if it has none"""
+    with open(os.path.join(MERCHANT_RULES_DIR, f"{merchant_id}.json"), 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    return RuleEngine(config, sample_every=MERCHANT_SAMPLE_EVERY,
+                      table_max_rules=MERCHANT_TABLE_MAX_RULES if RISK_EVAL_MODE == "table" else None)
+
+
+def load_merchant_engine(merchant_id):
+    """Compile a merchant's rule set on first use; None if the merchant has none.
+
+    Missing rule sets are remembered in their own bounded set, so merchants
+    on the default rules cost one set lookup per risk_check. A rule file
+    that is not valid JSON or not a valid rule set is logged and the
+    merchant falls back to the default rules as well.
+    """
+    if (not MERCHANT_RULES_DIR or not MERCHANT_ID_PATTERN.match(merchant_id) or merchant_id in _missing
+            or merchant_id in _invalid):
+        return None
+    try:
+        return ENGINE_CACHE.get(merchant_id, _compile_merchant_engine)
+    except FileNotFoundError:
+        if len(_missing) >= MERCHANT_MISSING_CACHE_SIZE:
+            _missing.clear()
+        _missing.add(merchant_id)
+        return None
+    except (ValueError, SyntaxError, KeyError, TypeError, AttributeError) as e:
+        # json.JSONDecodeError and invalid expressions are ValueErrors
+        _invalid[merchant_id] = f"{type(e).__name__}: {e}"
+        print(f"Merchant rules for {merchant_id} are invalid, using default rules: {_invalid[merchant_id]}")
+        return None
+
+
+def cached_merchant_engine(merchant_id):
+    """The merchant's compiled evaluator if it is cached, without loading it"""
+    with ENGINE_CACHE.lock:
+        return ENGINE_CACHE.engines.get(merchant_id)
+
+
+def set_merchant_sample_every(sample_every):
+    """Rule stats sampling interval for cached and later compiled merchant evaluators"""
+    global MERCHANT_SAMPLE_EVERY
+    MERCHANT_SAMPLE_EVERY = sample_every
+    with ENGINE_CACHE.lock:
+        engines = list(ENGINE_CACHE.engines.values())
+    for engine in engines:
+        engine.sample_every = sample_every
+
+
+def clear_merchant_cache():
+    """Forget compiled engines, missing and invalid merchants so rule files are read again"""
+    ENGINE_CACHE.clear()
+    _missing.clear()
+    _invalid.clear()
+
+
+def merchant_cache_info():
+    cache = ENGINE_CACHE
+    return {
+        "rules_dir": MERCHANT_RULES_DIR,
+        "hits": cache.hits,
+        "misses": cache.misses,
+        "evictions": cache.evictions,
+        "size": len(cache.engines),
+        "max_size": cache.max_size,
+        "table_bytes": cache.table_bytes,
+        "max_table_bytes": cache.max_table_bytes,
+        "missing": len(_missing),
+        "invalid": dict(_invalid),
+        "sample_every": MERCHANT_SAMPLE_EVERY
+    }
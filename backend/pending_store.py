@@ -0,0 +1,60 @@
+import json
+import os
+import sqlite3
+import threading
+from collections.abc import MutableMapping
+
+
+class SqlitePendingStore(MutableMapping):
+    """Pending 3DS transactions in a SQLite file shared by all worker processes.
+
+    Behaves like the in-memory dict it replaces, so a /3ds-verify request
+    can be served by a different worker than the /checkout that created
+    the entry. Values must be JSON-serializable.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS pending (id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+
+    def _connection(self):
+        # Connections are per thread and per process (never reused after fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def __getitem__(self, key):
+        row = self._connection().execute("SELECT data FROM pending WHERE id = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return json.loads(row[0])
+
+    def __setitem__(self, key, value):
+        self._connection().execute("INSERT OR REPLACE INTO pending (id, data) VALUES (?, ?)",
+                                   (key, json.dumps(value, ensure_ascii=False)))
+
+    def __delitem__(self, key):
+        if self._connection().execute("DELETE FROM pending WHERE id = ?", (key,)).rowcount == 0:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return self._connection().execute("SELECT 1 FROM pending WHERE id = ?", (key,)).fetchone() is not None
+
+    def __iter__(self):
+        return iter([row[0] for row in self._connection().execute("SELECT id FROM pending")])
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM pending").fetchone()[0]
+
+
+def load_pending_store():
+    """Shared SQLite store when PENDING_STORE_PATH is set, otherwise a plain dict"""
+    path = os.getenv("PENDING_STORE_PATH")
+    return SqlitePendingStore(path) if path else {}
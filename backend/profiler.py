@@ -0,0 +1,175 @@
+"""
+On-demand statistical stack sampler for live workers
+
+Request handlers tag their thread with the route while they run
+(PROFILER.route("/checkout")). While a profiling session is active, a
+background thread wakes every PROFILE_INTERVAL_MS, reads the stacks of
+the tagged threads with sys._current_frames() and counts them per route.
+Sessions end after N seconds or N tagged requests.
+
+When no session is running there is no sampler thread and route() is a
+shared no-op context manager, so the profiler is safe to leave armed.
+
+Results are collapsed stacks ("frame;frame;frame count", the input of
+flamegraph.pl / speedscope) plus the top functions by self time.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+
+_IDLE = nullcontext()
+
+
+class _RouteTag:
+    __slots__ = ("profiler", "route", "thread_id")
+
+    def __init__(self, profiler, route):
+        self.profiler = profiler
+        self.route = route
+
+    def __enter__(self):
+        self.thread_id = threading.get_ident()
+        self.profiler.threads[self.thread_id] = self.route
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profiler.threads.pop(self.thread_id, None)
+        self.profiler._request_done()
+        return False
+
+
+class SamplingProfiler:
+    """Samples the stacks of threads currently serving a tagged route"""
+
+    def __init__(self, interval_ms=5, max_depth=128):
+        self.interval = interval_ms / 1000
+        self.max_depth = max_depth
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self.lock = threading.Lock()
+        self.running = False
+        self.threads = {}
+        self.labels = {}
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.result = None
+        self.max_requests = None
+        self.requests_done = 0
+
+    def route(self, name):
+        """Context manager tagging the current thread with a route while a session runs"""
+        if not self.running:
+            return _IDLE
+        return _RouteTag(self, name)
+
+    def _request_done(self):
+        with self.lock:
+            self.requests_done += 1
+            if self.max_requests and self.requests_done >= self.max_requests:
+                self.stop_event.set()
+
+    def start(self, seconds=None, requests=None, max_seconds=60):
+        """Begin a session; returns False if one is already running"""
+        with self.lock:
+            if self.running:
+                return False
+            self.running = True
+            self.max_requests = requests
+            self.requests_done = 0
+            self.duration = min(seconds or max_seconds, max_seconds)
+            self.stacks = {}
+            self.sample_count = 0
+            self.sample_seconds = 0.0
+            self.stop_event = threading.Event()
+            self.result = None
+            self.thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+            self.thread.start()
+            return True
+
+    def wait(self):
+        """Block until the current session ends and return its result"""
+        thread = self.thread
+        if thread:
+            thread.join()
+        return self.result
+
+    def _label(self, code):
+        label = self.labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            self.labels[code] = label
+        return label
+
+    def _run(self):
+        started = time.perf_counter()
+        deadline = started + self.duration
+        while not self.stop_event.is_set() and time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            if self.threads:
+                frames = sys._current_frames()
+                for thread_id, route in list(self.threads.items()):
+                    frame = frames.get(thread_id)
+                    stack = []
+                    while frame is not None and len(stack) < self.max_depth:
+                        stack.append(self._label(frame.f_code))
+                        frame = frame.f_back
+                    if stack:
+                        counts = self.stacks.setdefault(route, Counter())
+                        counts[";".join(reversed(stack))] += 1
+                self.sample_count += 1
+            self.sample_seconds += time.perf_counter() - t0
+            self.stop_event.wait(self.interval)
+
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.running = False
+            self.threads.clear()
+            self.result = self._summarize(elapsed)
+
+    def _summarize(self, elapsed):
+        interval_ms = self.interval * 1000
+        routes = {}
+        for route, counts in self.stacks.items():
+            total = sum(counts.values())
+            self_samples = Counter()
+            for stack, count in counts.items():
+                self_samples[stack.rsplit(";", 1)[-1]] += count
+            routes[route] = {
+                "samples": total,
+                "top_self": [
+                    {
+                        "function": function,
+                        "samples": count,
+                        "self_ms": round(count * interval_ms, 1),
+                        "percent": round(100 * count / total, 1)
+                    }
+                    for function, count in self_samples.most_common(20)
+                ],
+                "collapsed": [f"{stack} {count}" for stack, count in counts.most_common()]
+            }
+        return {
+            "elapsed_seconds": round(elapsed, 3),
+            "interval_ms": interval_ms,
+            "requests": self.requests_done,
+            "sampling_passes": self.sample_count,
+            # Share of wall time the sampler itself held the GIL
+            "sampler_overhead": round(self.sample_seconds / elapsed, 5) if elapsed else 0.0,
+            "routes": routes
+        }
+
+
+def collapsed_text(result):
+    """flamegraph.pl input with the route as the root frame"""
+    lines = []
+    for route, data in result["routes"].items():
+        lines.extend(f"{route};{line}" for line in data["collapsed"])
+    return "\n".join(lines) + "\n"
+
+
+PROFILER = SamplingProfiler(float(os.getenv("PROFILE_INTERVAL_MS", "5")))
@@ -0,0 +1,214 @@
+"""
+Versioned prompt templates for LLM risk analysis, with token accounting
+
+Templates are registered per (version, risk level). Each one carries
+its own max_tokens budget and temperature, so low-risk explanations stay
+short and only HIGH risk gets room for a longer answer. PROMPT_VERSION
+selects the active version; "v1" is the original verbose prompt, kept
+so the two can be compared on live traffic.
+
+The BATCH templates analyse the transactions of one order in a single
+call, one numbered answer line per transaction (parse_batch).
+
+Prompt tokens are estimated locally before each call; actual usage from
+the responses is aggregated per template in TOKEN_USAGE.
+"""
+
+import os
+import re
+import threading
+
+PROMPT_VERSION = os.getenv("PROMPT_VERSION", "v2")
+
+_CJK = re.compile(r"[　-〿一-鿿＀-￯]")
+
+
+def estimate_tokens(text):
+    """Rough token count: ~0.6 tokens per CJK character, ~1 per 4 other characters"""
+    cjk = len(_CJK.findall(text))
+    return int(cjk * 0.6 + (len(text) - cjk) / 4) + 1
+
+
+class PromptTemplate:
+    """A system/user prompt pair with its generation budget"""
+
+    def __init__(self, version, risk_level, system, user, max_tokens, temperature):
+        self.version = version
+        self.risk_level = risk_level
+        self.system = system
+        self.user = user
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+
+    @property
+    def key(self):
+        return f"{self.version}/{self.risk_level}"
+
+    def _format(self, transaction, risk_score, reasons):
+        return self.user.format(
+            amount=transaction.get('amount', 0),
+            currency=transaction.get('currency', 'CNY'),
+            payment_method=transaction.get('payment_method', 'unknown'),
+            user_history=transaction.get('user_history', 0),
+            ip_country=transaction.get('ip_country', 'unknown'),
+            card_country=transaction.get('card_country', 'unknown'),
+            risk_score=risk_score,
+            reasons=', '.join(reasons)
+        )
+
+    def render(self, transaction, risk_score, reasons):
+        """Chat messages for one transaction"""
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": self._format(transaction, risk_score, reasons)}
+        ]
+
+    def render_batch(self, items):
+        """Chat messages for several (transaction, risk_score, reasons), one numbered line each"""
+        lines = [f"{n}. {self._format(*item)}" for n, item in enumerate(items, 1)]
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": "\n".join(lines)}
+        ]
+
+
+TEMPLATES = {}
+
+
+def register(template):
+    TEMPLATES[(template.version, template.risk_level)] = template
+    return template
+
+
+def get_template(risk_level, version=None):
+    """Template for a risk level, falling back to the version's MEDIUM template"""
+    version = version or PROMPT_VERSION
+    return TEMPLATES.get((version, risk_level)) or TEMPLATES[(version, "MEDIUM")]
+
+
+_NUMBERED_LINE = re.compile(r"^\s*(\d+)\s*[.、:：)）]\s*(.+?)\s*$")
+
+
+def parse_batch(text, count):
+    """Answers of a BATCH call by line number; items the model skipped are None"""
+    answers = [None] * count
+    for line in text.splitlines():
+        match = _NUMBERED_LINE.match(line)
+        if match and 1 <= int(match.group(1)) <= count and answers[int(match.group(1)) - 1] is None:
+            answers[int(match.group(1)) - 1] = match.group(2)
+    return answers
+
+
+_V1_USER = """
+你是一个专业的支付风控分析师。请分析以下交易的风险情况：
+
+交易信息：
+- 金额: {amount} {currency}
+- 支付方式: {payment_method}
+- 用户历史交易次数: {user_history}
+- IP地址国家: {ip_country}
+- 卡片国家: {card_country}
+
+风险评分: {risk_score}/100
+风险因素: {reasons}
+
+请提供详细的风险分析，包括：
+1. 对主要风险因素的评估
+2. 潜在的欺诈风险
+3. 建议的处理措施
+
+请用中文回答，保持专业和简洁。
+"""
+
+for level in ("LOW", "MEDIUM", "HIGH"):
+    register(PromptTemplate(
+        "v1", level,
+        system="你是一个专业的支付风控分析师，擅长识别交易风险和提供风控建议。",
+        user=_V1_USER,
+        max_tokens=500,
+        temperature=0.7
+    ))
+
+_V2_SYSTEM = "你是支付风控分析师，用中文简洁作答。"
+_V2_FACTS = "交易:{amount}{currency},{payment_method},历史{user_history}笔,IP{ip_country},卡{card_country}\n评分{risk_score}/100,因素:{reasons}\n"
+
+register(PromptTemplate(
+    "v2", "LOW",
+    system=_V2_SYSTEM,
+    user=_V2_FACTS + "一句话说明风险与处理建议。",
+    max_tokens=80,
+    temperature=0.2
+))
+register(PromptTemplate(
+    "v2", "MEDIUM",
+    system=_V2_SYSTEM,
+    user=_V2_FACTS + "两句话：主要风险、建议措施。",
+    max_tokens=150,
+    temperature=0.3
+))
+register(PromptTemplate(
+    "v2", "HIGH",
+    system=_V2_SYSTEM,
+    user=_V2_FACTS + "分三点：风险因素评估、可能的欺诈手法、处理措施。每点不超过两句。",
+    max_tokens=300,
+    temperature=0.3
+))
+
+# Several transactions of one order in a single call; max_tokens is per transaction
+_BATCH_SYSTEM = ("你是支付风控分析师，用中文简洁作答。每行是一笔交易，"
+                 "请按相同编号逐行回答，格式为“编号. 主要风险与建议措施”，每行不超过两句。")
+_BATCH_ITEM = "交易:{amount}{currency},{payment_method},历史{user_history}笔,IP{ip_country},卡{card_country};评分{risk_score}/100,因素:{reasons}"
+
+for version, temperature in (("v1", 0.7), ("v2", 0.3)):
+    register(PromptTemplate(
+        version, "BATCH",
+        system=_BATCH_SYSTEM,
+        user=_BATCH_ITEM,
+        max_tokens=100,
+        temperature=temperature
+    ))
+
+
+class TokenUsage:
+    """Thread-safe per-template aggregate of token usage and latency"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.templates = {}
+
+    def reset(self):
+        with self.lock:
+            self.templates = {}
+
+    def record(self, template, estimated_prompt_tokens, usage, latency_ms):
+        with self.lock:
+            stats = self.templates.setdefault(template.key, {
+                "calls": 0,
+                "estimated_prompt_tokens": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "latency_ms": 0.0
+            })
+            stats["calls"] += 1
+            stats["estimated_prompt_tokens"] += estimated_prompt_tokens
+            if usage:
+                stats["prompt_tokens"] += usage.prompt_tokens or 0
+                stats["completion_tokens"] += usage.completion_tokens or 0
+            stats["latency_ms"] += latency_ms
+
+    def snapshot(self):
+        """Totals and per-call averages per template"""
+        with self.lock:
+            result = {}
+            for key, stats in sorted(self.templates.items()):
+                calls = stats["calls"]
+                result[key] = {
+                    **stats,
+                    "avg_prompt_tokens": stats["prompt_tokens"] / calls,
+                    "avg_completion_tokens": stats["completion_tokens"] / calls,
+                    "avg_latency_ms": stats["latency_ms"] / calls
+                }
+            return {"prompt_version": PROMPT_VERSION, "templates": result}
+
+
+TOKEN_USAGE = TokenUsage()
@@ -0,0 +1,226 @@
+"""
+Replay historical transactions through risk_check (LLM disabled)
+
+Streams a JSONL or CSV file in chunks and scores the chunks in a process
+pool. Only per-chunk aggregates travel back to the parent, and at most
+2 chunks per worker are in flight, so memory stays flat for any file size.
+
+Usage:
+    python replay.py transactions.jsonl [--rules rules.json] [--workers 8]
+    python replay.py transactions.csv --chunk-size 20000 --json report.json
+
+CSV input must have a header row and no quoted multi-line fields.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import risk_service
+from decision_table import DECISION_TABLE_MAX_RULES
+from rule_engine import RuleEngine
+
+# Defaults applied by PaymentRequest for fields missing from a record
+PAYMENT_DEFAULTS = {
+    "currency": "CNY",
+    "card_number": None,
+    "card_country": None,
+    "ip_country": "CN",
+    "user_history": 0,
+    "merchant_id": None
+}
+
+# Column types for CSV input (JSONL values are used as-is)
+CSV_TYPES = {
+    "amount": float,
+    "user_history": int
+}
+
+
+def read_chunks(path, chunk_size):
+    """Yield (format, header, lines) chunks of raw input lines"""
+    fmt = "csv" if path.endswith(".csv") else "jsonl"
+    stream = sys.stdin if path == "-" else open(path, "r", encoding="utf-8", newline="")
+    try:
+        header = None
+        if fmt == "csv":
+            header = next(csv.reader([stream.readline()]))
+        chunk = []
+        for line in stream:
+            chunk.append(line)
+            if len(chunk) >= chunk_size:
+                yield fmt, header, chunk
+                chunk = []
+        if chunk:
+            yield fmt, header, chunk
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def parse_lines(fmt, header, lines, summary=None):
+    """Turn raw lines into transaction dicts in the PaymentRequest shape
+
+    With a summary, lines that cannot be parsed (invalid JSON, a
+    non-numeric amount in CSV, ...) are skipped and counted in
+    summary["errors"]; without one they raise.
+    """
+    if fmt == "csv":
+        for row in csv.reader(lines):
+            if not row:
+                continue
+            try:
+                record = {}
+                for key, value in zip(header, row):
+                    if value == "":
+                        continue
+                    convert = CSV_TYPES.get(key)
+                    record[key] = convert(value) if convert else value
+            except ValueError:
+                if summary is None:
+                    raise
+                summary["errors"] += 1
+                continue
+            yield {**PAYMENT_DEFAULTS, **record}
+    else:
+        for line in lines:
+            if line.strip():
+                try:
+                    record = json.loads(line)
+                    transaction = {**PAYMENT_DEFAULTS, **record}
+                except (ValueError, TypeError):
+                    if summary is None:
+                        raise
+                    summary["errors"] += 1
+                    continue
+                yield transaction
+
+
+def new_summary():
+    return {
+        "count": 0,
+        "errors": 0,
+        "requires_3ds": 0,
+        "llm_band": 0,
+        "score_histogram": Counter(),
+        "risk_levels": Counter(),
+        "reasons": Counter()
+    }
+
+
+def merge_summary(total, part):
+    """Add a partial summary into the running total"""
+    for key in ("count", "errors", "requires_3ds", "llm_band"):
+        total[key] += part[key]
+    for key in ("score_histogram", "risk_levels", "reasons"):
+        total[key].update(part[key])
+    return total
+
+
+def init_worker(rules_path, mode="full"):
+    """Process pool initializer: optionally swap in a candidate rules file, with a decision table in table mode"""
+    if rules_path:
+        with open(rules_path, "r", encoding="utf-8") as f:
+            risk_service.RULES_CONFIG = json.load(f)
+    risk_service.RULE_ENGINE = RuleEngine(risk_service.RULES_CONFIG, sample_every=0,
+                                          table_max_rules=DECISION_TABLE_MAX_RULES if mode == "table" else None)
+
+
+def score_chunk(chunk, mode, bucket_width):
+    """Score one chunk and return its aggregate summary"""
+    fmt, header, lines = chunk
+    summary = new_summary()
+    threshold_llm = risk_service.RULE_ENGINE.threshold_llm
+    histogram = summary["score_histogram"]
+    levels = summary["risk_levels"]
+    reasons = summary["reasons"]
+
+    transactions = list(parse_lines(fmt, header, lines, summary))
+    try:
+        # One FX snapshot for the whole chunk; on bad amounts risk_check normalizes (and rejects) per row
+        transactions = risk_service.normalize_amounts(transactions)
+    except (TypeError, ValueError):
+        pass
+
+    for transaction in transactions:
+        try:
+            risk = risk_service.risk_check(transaction, mode=mode, llm=False)
+        except (TypeError, KeyError, ValueError):
+            summary["errors"] += 1
+            continue
+        summary["count"] += 1
+        score = risk["risk_score"]
+        histogram[score // bucket_width * bucket_width] += 1
+        levels[risk["risk_level"]] += 1
+        reasons.update(risk["reasons"])
+        if risk["requires_3ds"]:
+            summary["requires_3ds"] += 1
+        if score > threshold_llm:
+            summary["llm_band"] += 1
+    return summary
+
+
+def replay(path, rules_path=None, workers=None, chunk_size=10000, mode="full", bucket_width=10):
+    """Replay a file and return the aggregated summary"""
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = workers * 2
+    total = new_summary()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(rules_path, mode)) as pool:
+        in_flight = set()
+        for chunk in read_chunks(path, chunk_size):
+            if len(in_flight) >= max_in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    merge_summary(total, future.result())
+            in_flight.add(pool.submit(score_chunk, chunk, mode, bucket_width))
+        for future in in_flight:
+            merge_summary(total, future.result())
+    return total
+
+
+def build_report(summary, elapsed):
+    """Convert a summary into a JSON-serializable report"""
+    count = summary["count"] or 1
+    return {
+        "transactions": summary["count"],
+        "errors": summary["errors"],
+        "elapsed_seconds": round(elapsed, 3),
+        "transactions_per_second": round(summary["count"] / elapsed) if elapsed else None,
+        "requires_3ds_rate": summary["requires_3ds"] / count,
+        "llm_band_rate": summary["llm_band"] / count,
+        "risk_levels": {level: n / count for level, n in summary["risk_levels"].most_common()},
+        "score_histogram": dict(sorted(summary["score_histogram"].items())),
+        "reasons": dict(summary["reasons"].most_common())
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay transactions through risk_check")
+    parser.add_argument("input", help="JSONL or CSV file ('-' reads JSONL from stdin)")
+    parser.add_argument("--rules", help="candidate rules file (defaults to rules.json)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument("--mode", default="full", choices=["full", "fast", "table"])
+    parser.add_argument("--bucket-width", type=int, default=10, help="score histogram bucket width")
+    parser.add_argument("--json", dest="json_path", help="write the report to this file")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    summary = replay(args.input, args.rules, args.workers, args.chunk_size, args.mode, args.bucket_width)
+    report = build_report(summary, time.perf_counter() - start)
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
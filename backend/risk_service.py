@@ -1,6 +1,16 @@
 import json
 import os
-from llm_service import generate_llm_analysis
+from llm_service import fallback_analysis, generate_llm_analysis, generate_llm_batch_analysis
+from llm_gate import load_llm_gate
+from load_shedding import load_load_shedder
+import tracing
+from decision_table import DECISION_TABLE_MAX_RULES
+from rule_engine import RISK_EVAL_MODE, RULE_STATS_SAMPLE_EVERY, RuleEngine
+from shadow import load_shadow_evaluator
+from merchant_rules import load_merchant_engine
+from feature_store import load_feature_store
+from linkage import load_linkage_index
+from fx_rates import load_fx_table
 
 # Load risk rules from JSON file
 RULES_FILE = "rules.json"
@@ -53,73 +63,169 @@ else:
     }
 
 
-def risk_check(transaction):
-    """Risk assessment function using configurable rules"""
-    risk_score = 0
-    reasons = []
-    
-    # Apply risk rules from configuration
-    for rule in RULES_CONFIG.get('risk_rules', []):
-        rule_name = rule.get('name')
-        operator = rule.get('operator')
-        field = rule.get('field')
-        threshold = rule.get('threshold')
-        score = rule.get('score', 0)
-        message = rule.get('message')
-        fields = rule.get('fields', [])
-        
-        # Evaluate rule based on operator
-        rule_applies = False
-        
-        if operator == 'gt' and field and field in transaction:
-            rule_applies = transaction[field] > threshold
-        elif operator == 'lt' and field and field in transaction:
-            rule_applies = transaction[field] < threshold
-        elif operator == 'eq' and field and field in transaction:
-            rule_applies = transaction[field] == threshold
-        elif operator == 'not_eq' and fields:
-            if len(fields) == 2 and all(f in transaction for f in fields):
-                rule_applies = transaction[fields[0]] != transaction[fields[1]]
-        elif operator == 'gte' and field and field in transaction:
-            rule_applies = transaction[field] >= threshold
-        elif operator == 'lte' and field and field in transaction:
-            rule_applies = transaction[field] <= threshold
-        
-        if rule_applies:
-            risk_score += score
-            if message:
-                reasons.append(message)
-    
-    # Calculate risk level
-    risk_levels = RULES_CONFIG.get('risk_levels', {})
-    if risk_score > risk_levels.get('high', 60):
-        risk_level = "HIGH"
-    elif risk_score > risk_levels.get('medium', 30):
-        risk_level = "MEDIUM"
-    else:
-        risk_level = "LOW"
-    
-    # Check if 3DS is required
-    requires_3ds = risk_score > RULES_CONFIG.get('thresholds', {}).get('requires_3ds', 40)
+# Compiled evaluator for RULES_CONFIG; rule stats are sampled on one in N calls. In table
+# mode its decision table is built here, before workers are forked
+RULE_ENGINE = RuleEngine(RULES_CONFIG, sample_every=RULE_STATS_SAMPLE_EVERY,
+                         table_max_rules=DECISION_TABLE_MAX_RULES if RISK_EVAL_MODE == "table" else None)
+
+# Candidate rules files scored in the background against live traffic
+SHADOW_EVALUATOR = load_shadow_evaluator(os.getenv("SHADOW_RULES", ""),
+                                         int(os.getenv("SHADOW_QUEUE_SIZE", "10000")),
+                                         int(os.getenv("SHADOW_BATCH_SIZE", "8")))
+
+# Local model that decides which LLM-band transactions really need the LLM
+LLM_GATE = load_llm_gate(os.getenv("LLM_GATE_MODEL"))
+
+# Degrades LLM insight while /checkout latency is over its SLO (SHED_SLO_MS)
+LOAD_SHEDDER = load_load_shedder()
+
+# FX rates for normalized_amount (the amount in the base currency), refreshed in the background
+FX_TABLE = load_fx_table()
+
+# Server-side user/card profiles replacing client-supplied user_history (FEATURE_STORE_PATH)
+FEATURE_STORE = load_feature_store()
+
+# Union-find of cards, IPs, users and devices linked by checkouts (LINKAGE_INDEX=true)
+LINKAGE_INDEX = load_linkage_index()
+
+
+def get_rule_engine(merchant_id=None):
+    """Compiled evaluator for a merchant, falling back to RULES_CONFIG"""
+    if merchant_id:
+        engine = load_merchant_engine(merchant_id)
+        if engine:
+            return engine
+    return RULE_ENGINE
+
+
+def normalize_amounts(transactions):
+    """Copies of the transactions with normalized_amount set, for a whole batch or chunk at once"""
+    if FX_TABLE:
+        return FX_TABLE.normalize_rows(transactions)
+    return [{**transaction, "normalized_amount": transaction.get('amount')} for transaction in transactions]
+
+
+def enrich(transaction):
+    """Add normalized_amount and the server-side profile and linkage fields read by the rules
+
+    normalized_amount is kept when the caller already set it (see
+    normalize_amounts); it is the raw amount when no FX table is loaded.
+    """
+    if 'normalized_amount' not in transaction:
+        amount = transaction.get('amount')
+        if FX_TABLE and amount is not None:
+            amount = FX_TABLE.normalize(amount, transaction.get('currency'))
+        transaction = {**transaction, 'normalized_amount': amount}
+    if FEATURE_STORE:
+        with tracing.span("feature_store"):
+            transaction = FEATURE_STORE.enrich(transaction)
+    if LINKAGE_INDEX:
+        with tracing.span("linkage"):
+            transaction = LINKAGE_INDEX.enrich(transaction)
+    return transaction
+
+
+def risk_check(transaction, mode=None, llm=True):
+    """Risk assessment function using configurable rules
+
+    mode overrides RISK_EVAL_MODE for this call; pass "full" when the
+    complete list of reasons is needed (e.g. for audits). llm=False skips
+    the LLM analysis (llm_insight is None), e.g. for offline replay.
+    """
+    mode = mode or RISK_EVAL_MODE
+    with tracing.span("enrichment"):
+        transaction = enrich(transaction)
+    with tracing.span("risk_rules") as span:
+        engine = get_rule_engine(transaction.get('merchant_id'))
+        # Score, reasons, risk level and whether 3DS / LLM insight are required
+        risk_score, reasons, risk_level, requires_3ds, requires_llm = engine.decide(
+            transaction, mode, explain_llm=llm)
+        span.set("risk_score", risk_score)
     
-    # LLM enhancement
-    requires_llm = risk_score > RULES_CONFIG.get('thresholds', {}).get('requires_llm_insight', 30)
-    if requires_llm:
-        llm_insight = generate_llm_analysis(transaction, risk_score, reasons)
-    else:
-        llm_insight = None
+    # LLM enhancement, shed under load and skipped when the local gate model is confident
+    llm_insight = None
+    if requires_llm and llm:
+        with tracing.span("llm_insight") as span:
+            action = choose_llm_action(transaction, risk_score, engine)
+            if action == "fallback":
+                llm_insight = fallback_analysis(risk_score, reasons)
+            elif action == "llm":
+                llm_insight = generate_llm_analysis(transaction, risk_score, reasons, risk_level)
+            span.set("action", action)
     
+    return finish_risk(transaction, engine, risk_score, reasons, risk_level, requires_3ds, llm_insight, mode)
+
+
+def choose_llm_action(transaction, risk_score, engine):
+    """Pick "llm", "fallback" or "skip" for an LLM-band transaction"""
+    action = LOAD_SHEDDER.llm_action(risk_score, engine.threshold_llm) if LOAD_SHEDDER else "llm"
+    if action == "llm" and LLM_GATE and not LLM_GATE.needs_llm(transaction, min(risk_score, engine.max_score)):
+        return "fallback"
+    return action
+
+
+def finish_risk(transaction, engine, risk_score, reasons, risk_level, requires_3ds, llm_insight, mode):
+    """Build the risk result and hand it to the shadow evaluator"""
     # Cap risk score at max
-    max_score = RULES_CONFIG.get('max_score', 100)
-    risk_score = min(risk_score, max_score)
+    risk_score = min(risk_score, engine.max_score)
     
-    return {
+    risk = {
         "risk_score": risk_score,
         "risk_level": risk_level,
         "requires_3ds": requires_3ds,
         "reasons": reasons,
         "llm_insight": llm_insight
     }
+    
+    # Shadow rule sets never affect the returned decision
+    if SHADOW_EVALUATOR:
+        # A fast-mode score only covers the rules evaluated before the decision settled
+        SHADOW_EVALUATOR.submit(transaction, risk, partial_score=mode == "fast")
+    
+    return risk
+
+
+def risk_check_batch(transactions, mode=None, llm=True):
+    """risk_check for the payments of one order
+
+    Each merchant's evaluator is looked up once for the batch, and the
+    transactions that get LLM insight share a single LLM call.
+    """
+    mode = mode or RISK_EVAL_MODE
+    with tracing.span("enrichment", batch=len(transactions)):
+        transactions = [enrich(transaction) for transaction in normalize_amounts(transactions)]
+    with tracing.span("risk_rules", batch=len(transactions)):
+        engines = {}
+        scored = []
+        for transaction in transactions:
+            merchant_id = transaction.get('merchant_id')
+            engine = engines.get(merchant_id)
+            if engine is None:
+                engine = engines[merchant_id] = get_rule_engine(merchant_id)
+            scored.append((engine,) + engine.decide(transaction, mode, explain_llm=llm))
+    
+    insights = [None] * len(transactions)
+    if llm:
+        grouped = []
+        with tracing.span("llm_insight", batch=len(transactions)) as span:
+            for i, (engine, risk_score, reasons, risk_level, _, requires_llm) in enumerate(scored):
+                if not requires_llm:
+                    continue
+                action = choose_llm_action(transactions[i], risk_score, engine)
+                if action == "fallback":
+                    insights[i] = fallback_analysis(risk_score, reasons)
+                elif action == "llm":
+                    grouped.append(i)
+            if grouped:
+                analyses = generate_llm_batch_analysis(
+                    [(transactions[i], scored[i][1], scored[i][2], scored[i][3]) for i in grouped])
+                for i, analysis in zip(grouped, analyses):
+                    insights[i] = analysis
+            span.set("llm_items", len(grouped))
+    
+    return [finish_risk(transaction, engine, risk_score, reasons, risk_level, requires_3ds, insight, mode)
+            for transaction, (engine, risk_score, reasons, risk_level, requires_3ds, _), insight
+            in zip(transactions, scored, insights)]
 
 
 def verify_3ds(transaction, risk_result):
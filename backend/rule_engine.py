@@ -0,0 +1,322 @@
+import operator
+import os
+import time
+
+from decision_table import compile_decision_table
+from rule_expressions import ExpressionSet, compile_expression
+
+# Comparison operators supported by single-field rules
+FIELD_OPERATORS = {
+    'gt': operator.gt,
+    'lt': operator.lt,
+    'eq': operator.eq,
+    'gte': operator.ge,
+    'lte': operator.le,
+}
+
+# "full" evaluates every rule; "fast" orders rules by observed stats and exits early;
+# "table" looks the decision up in a precomputed table (see decision_table.py)
+RISK_EVAL_MODE = os.getenv("RISK_EVAL_MODE", "full")
+
+# Default sampling interval for per-rule stats (0 disables them); timing every call
+# makes evaluate() about 65% slower
+RULE_STATS_SAMPLE_EVERY = int(os.getenv("RULE_STATS_SAMPLE_EVERY", "100"))
+
+# Re-sort the evaluation order after this many sampled fast-mode evaluations
+REORDER_INTERVAL = 1000
+
+
+def compile_rule(rule):
+    """Compile a rule from rules.json into a predicate over a transaction"""
+    op = rule.get('operator')
+    field = rule.get('field')
+    threshold = rule.get('threshold')
+    fields = rule.get('fields', [])
+
+    if op in FIELD_OPERATORS and field:
+        compare = FIELD_OPERATORS[op]
+
+        def predicate(transaction):
+            return field in transaction and compare(transaction[field], threshold)
+        return predicate
+
+    if op == 'expr':
+        return compile_expression(rule['expression'])
+
+    if op == 'not_eq' and fields and len(fields) == 2:
+        left, right = fields
+
+        def predicate(transaction):
+            return left in transaction and right in transaction and transaction[left] != transaction[right]
+        return predicate
+
+    # Unknown or incomplete rules never apply, as in the original loop
+    return lambda transaction: False
+
+
+class CompiledRule:
+    """A compiled risk rule together with its observed hit/cost stats"""
+
+    __slots__ = ('index', 'name', 'score', 'message', 'predicate', 'evaluations', 'hits', 'total_ns')
+
+    def __init__(self, index, rule):
+        self.index = index
+        self.name = rule.get('name')
+        self.score = rule.get('score', 0)
+        self.message = rule.get('message')
+        self.predicate = compile_rule(rule)
+        self.evaluations = 0
+        self.hits = 0
+        self.total_ns = 0
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.evaluations if self.evaluations else 0.0
+
+    @property
+    def avg_ns(self):
+        return self.total_ns / self.evaluations if self.evaluations else 0.0
+
+    def reset(self):
+        self.evaluations = 0
+        self.hits = 0
+        self.total_ns = 0
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "score": self.score,
+            "evaluations": self.evaluations,
+            "hits": self.hits,
+            "hit_rate": round(self.hit_rate, 6),
+            "total_ns": self.total_ns,
+            "avg_ns": round(self.avg_ns, 1)
+        }
+
+
+class RuleEngine:
+    """Evaluates a rules.json config against transactions.
+
+    Three evaluation modes are supported:
+
+    - ``full``: every rule is evaluated in config order, so ``reasons`` is
+      complete. This is what the LLM prompt and audits rely on.
+    - ``fast``: rules are evaluated in an order learned from the collected
+      stats and evaluation stops as soon as risk level, 3DS and LLM outcome
+      can no longer change. The returned score and reasons then only cover
+      the rules evaluated so far.
+    - ``table``: the outcome of every combination of rule hits is
+      precomputed (see decision_table.py), so a transaction is scored by
+      evaluating the conditions into a bit vector and one table lookup.
+      Results are the same as ``full``. The table is built in the
+      constructor when ``table_max_rules`` is given; engines without one
+      (no cap, or a rule set over the cap) fall back to ``full``.
+
+    Expression rules ("operator": "expr") are compiled together into one
+    function (see rule_expressions.py) that runs first, in every mode.
+
+    Per-rule stats are only collected on one in ``sample_every`` calls
+    (0 disables them), so the counters can stay on in production.
+    """
+
+    def __init__(self, config, sample_every=1, table_max_rules=None):
+        self.config = config
+        rule_configs = config.get('risk_rules', [])
+        self.rules = [CompiledRule(i, rule) for i, rule in enumerate(rule_configs)]
+
+        # Expression rules are evaluated together, sharing common subexpressions
+        expression_rules = [(i, rule.get('score', 0), rule['expression'])
+                            for i, rule in enumerate(rule_configs) if rule.get('operator') == 'expr']
+        self.expressions = ExpressionSet(expression_rules) if expression_rules else None
+        expression_indices = {i for i, _, _ in expression_rules}
+        self.simple_rules = [rule for rule in self.rules if rule.index not in expression_indices]
+        self.expression_calls = 0
+        self.expression_ns = 0
+        self.messages = [rule.message for rule in self.rules]
+
+        risk_levels = config.get('risk_levels', {})
+        thresholds = config.get('thresholds', {})
+        self.high = risk_levels.get('high', 60)
+        self.medium = risk_levels.get('medium', 30)
+        self.threshold_3ds = thresholds.get('requires_3ds', 40)
+        self.threshold_llm = thresholds.get('requires_llm_insight', 30)
+        self.max_score = config.get('max_score', 100)
+
+        self.sample_every = sample_every
+        self.calls = 0
+        self.sampled_calls = 0
+        self._set_order(list(self.simple_rules))
+        # Built up front so no request pays for it; None without a cap or above it
+        self.decision_table = None if table_max_rules is None else compile_decision_table(self, table_max_rules)
+
+    def _set_order(self, order):
+        """Install an evaluation order with the positive/negative score still reachable after each position"""
+        n = len(order)
+        pos_after = [0] * (n + 1)
+        neg_after = [0] * (n + 1)
+        for i in range(n - 1, -1, -1):
+            score = order[i].score
+            pos_after[i] = pos_after[i + 1] + max(score, 0)
+            neg_after[i] = neg_after[i + 1] + min(score, 0)
+        # Swapped as one tuple so concurrent evaluations never mix two orders
+        self._plan = (order, pos_after, neg_after)
+
+    @property
+    def order(self):
+        return self._plan[0]
+
+    def reorder(self):
+        """Order rules so the decision settles with the least evaluation time.
+
+        Every evaluated rule narrows the still-reachable score range by its
+        weight whether it hits or not, so rules are sorted by weight per
+        nanosecond. The observed hit rate breaks ties, putting rules that
+        usually fire (and push the score across thresholds) first.
+        """
+        def priority(rule):
+            cost = rule.avg_ns or 1.0
+            return (abs(rule.score) / cost, rule.hit_rate)
+
+        self._set_order(sorted(self.simple_rules, key=priority, reverse=True))
+
+    def classify(self, risk_score):
+        """Map a raw score to (risk_level, requires_3ds, requires_llm)"""
+        if risk_score > self.high:
+            risk_level = "HIGH"
+        elif risk_score > self.medium:
+            risk_level = "MEDIUM"
+        else:
+            risk_level = "LOW"
+        return risk_level, risk_score > self.threshold_3ds, risk_score > self.threshold_llm
+
+    def _lookup(self, transaction):
+        """Decision table entry (score, reasons, risk_level, requires_3ds, requires_llm), or None without a table"""
+        table = self.decision_table
+        if table is None:
+            return None
+        index = table.index(transaction)
+        self.calls += 1
+        if self.sample_every > 0 and self.calls % self.sample_every == 0:
+            self.sampled_calls += 1
+            table.counts[index] += 1
+        return table.entries[index]
+
+    def decide(self, transaction, mode="full", explain_llm=True):
+        """evaluate() and classify() together: (risk_score, reasons, risk_level, requires_3ds, requires_llm)"""
+        if mode == "table":
+            entry = self._lookup(transaction)
+            if entry is not None:
+                return entry[0], list(entry[1]), entry[2], entry[3], entry[4]
+        risk_score, reasons = self.evaluate(transaction, mode, explain_llm)
+        return (risk_score, reasons) + self.classify(risk_score)
+
+    def _settled(self, low, high, explain_llm):
+        """Whether every score in [low, high] leads to the same decision"""
+        if self.classify(low) != self.classify(high):
+            return False
+        # The LLM prompt needs the complete list of reasons
+        return not (explain_llm and low > self.threshold_llm)
+
+    def evaluate(self, transaction, mode="full", explain_llm=True):
+        """Return (risk_score, reasons) before capping at max_score"""
+        if mode == "table":
+            entry = self._lookup(transaction)
+            if entry is not None:
+                return entry[0], list(entry[1])
+        early_exit = mode == "fast"
+        if early_exit:
+            rules, pos_after, neg_after = self._plan
+        else:
+            rules = self.simple_rules
+        risk_score = 0
+        hit_rules = []
+        perf_counter_ns = time.perf_counter_ns
+
+        self.calls += 1
+        sampled = self.sample_every > 0 and self.calls % self.sample_every == 0
+        if sampled:
+            self.sampled_calls += 1
+
+        if self.expressions:
+            if sampled:
+                start = perf_counter_ns()
+                risk_score, hit_indices = self.expressions.evaluate(transaction)
+                self.expression_ns += perf_counter_ns() - start
+                self.expression_calls += 1
+                for index in hit_indices:
+                    self.rules[index].hits += 1
+            else:
+                risk_score, hit_indices = self.expressions.evaluate(transaction)
+
+        for i, rule in enumerate(rules):
+            if sampled:
+                start = perf_counter_ns()
+                applies = rule.predicate(transaction)
+                rule.total_ns += perf_counter_ns() - start
+                rule.evaluations += 1
+                if applies:
+                    rule.hits += 1
+            else:
+                applies = rule.predicate(transaction)
+
+            if applies:
+                risk_score += rule.score
+                hit_rules.append(rule)
+
+            if early_exit and self._settled(risk_score + neg_after[i + 1],
+                                            risk_score + pos_after[i + 1],
+                                            explain_llm):
+                break
+
+        if early_exit and sampled and self.sampled_calls % REORDER_INTERVAL == 0:
+            self.reorder()
+
+        # Keep reasons in config order regardless of evaluation order
+        if self.expressions:
+            indices = hit_indices + [rule.index for rule in hit_rules]
+            indices.sort()
+            messages = self.messages
+            reasons = [messages[i] for i in indices if messages[i]]
+        else:
+            if early_exit:
+                hit_rules.sort(key=lambda rule: rule.index)
+            reasons = [rule.message for rule in hit_rules if rule.message]
+        return risk_score, reasons
+
+    def stats(self):
+        """Snapshot of the per-rule counters in config order"""
+        if self.expressions:
+            # Expression rules are timed as one block; the cost is split evenly
+            share_ns = self.expression_ns // len(self.expressions.rules)
+            for index, _, _ in self.expressions.rules:
+                self.rules[index].evaluations = self.expression_calls
+                self.rules[index].total_ns = share_ns
+        rules = [rule.to_dict() for rule in self.rules]
+        table = self.decision_table
+        if table:
+            # Table lookups count a hit for every rule whose bit is set in the entry
+            lookups, hits = table.hits()
+            for bit, index in enumerate(table.bit_rules):
+                rules[index]["evaluations"] += lookups
+                rules[index]["hits"] += hits[bit]
+                rules[index]["hit_rate"] = round(rules[index]["hits"] / rules[index]["evaluations"], 6) \
+                    if rules[index]["evaluations"] else 0.0
+        return {
+            "calls": self.calls,
+            "sampled_calls": self.sampled_calls,
+            "sample_every": self.sample_every,
+            "order": [rule.name for rule in self.order],
+            "decision_table": {"entries": len(table), "lookups": sum(table.counts)} if table else None,
+            "rules": rules
+        }
+
+    def reset_stats(self):
+        """Clear all counters; the current evaluation order is kept"""
+        for rule in self.rules:
+            rule.reset()
+        self.expression_calls = 0
+        self.expression_ns = 0
+        self.calls = 0
+        self.sampled_calls = 0
+        if self.decision_table:
+            self.decision_table.reset()
@@ -0,0 +1,206 @@
+"""
+Composite rule expressions compiled to Python code
+
+A rule with "operator": "expr" carries a Python-syntax boolean
+expression over transaction fields:
+
+    {"name": "new_user_big_cross_border", "operator": "expr", "score": 30,
+     "expression": "amount > 5000 and user_history == 0 and ip_country != card_country",
+     "message": "新用户大额跨境交易"}
+
+Supported: and / or / not, + - * / // %, comparisons (including chained
+ones and in / not in with a tuple or list of constants), field names and
+constants. Anything else is rejected when the rules are loaded.
+
+All expression rules of a rule set are compiled together into a single
+function with ast. Every subexpression that occurs more than once,
+within a rule or across rules, is evaluated once per transaction into a
+local variable, and rules that AND the same condition are grouped under
+a single test of it. Missing fields are None. A rule whose evaluation touches
+a failing operation (e.g. None > 5000, or division by zero) does not
+apply, like a single-field rule whose field is missing.
+"""
+
+import ast
+
+ALLOWED_NODES = (
+    ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub, ast.UAdd,
+    ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod,
+    ast.Compare, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.In, ast.NotIn,
+    ast.Name, ast.Load, ast.Constant, ast.Tuple, ast.List
+)
+
+# Subexpressions worth sharing (names and constants are already cheap)
+SHAREABLE_NODES = (ast.BoolOp, ast.UnaryOp, ast.BinOp, ast.Compare)
+
+ERRORS = (TypeError, ArithmeticError)
+
+# Python allows 20 nested try blocks; each shared condition adds one
+MAX_NESTING = 16
+
+
+class _Error:
+    """Value of a shared subexpression that failed; any use of it raises TypeError"""
+
+    __slots__ = ()
+
+    def _fail(self, *args):
+        raise TypeError("表达式子项计算失败")
+
+    __bool__ = __eq__ = __ne__ = __lt__ = __le__ = __gt__ = __ge__ = _fail
+    __add__ = __radd__ = __sub__ = __rsub__ = __mul__ = __rmul__ = _fail
+    __truediv__ = __rtruediv__ = __floordiv__ = __rfloordiv__ = __mod__ = __rmod__ = _fail
+    __neg__ = __pos__ = __contains__ = __hash__ = _fail
+
+
+ERROR = _Error()
+
+
+def parse_expression(expression):
+    """Parse and validate an expression; raises ValueError on unsupported syntax"""
+    try:
+        tree = ast.parse(expression, mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"表达式语法错误: {expression} ({e.msg})")
+    for node in ast.walk(tree):
+        if not isinstance(node, ALLOWED_NODES):
+            raise ValueError(f"表达式不支持 {type(node).__name__}: {expression}")
+        if isinstance(node, (ast.Tuple, ast.List)) and not all(isinstance(e, ast.Constant) for e in node.elts):
+            raise ValueError(f"in / not in 只支持常量列表: {expression}")
+    return tree.body
+
+
+def _code(node):
+    """Source of one AND-ed condition, parenthesized when it is an and/or itself"""
+    code = ast.unparse(node)
+    return f"({code})" if isinstance(node, ast.BoolOp) else code
+
+
+def _subexpressions(node):
+    for child in ast.walk(node):
+        if isinstance(child, SHAREABLE_NODES):
+            yield ast.dump(child)
+
+
+class _Rewriter(ast.NodeTransformer):
+    """Renames fields to locals and replaces shared subexpressions with their variable"""
+
+    def __init__(self, fields, shared, definitions):
+        self.fields = fields
+        self.shared = shared
+        self.definitions = definitions
+
+    def visit_Name(self, node):
+        return ast.Name(id=self.fields[node.id], ctx=ast.Load())
+
+    def visit_List(self, node):
+        return ast.Tuple(elts=node.elts, ctx=ast.Load())
+
+    def generic_visit(self, node):
+        key = ast.dump(node) if isinstance(node, SHAREABLE_NODES) else None
+        if key in self.shared and self.shared[key] in self.definitions:
+            return ast.Name(id=self.shared[key], ctx=ast.Load())
+        node = super().generic_visit(node)
+        if key in self.shared:
+            # Children were defined first, so definitions stay in dependency order
+            self.definitions[self.shared[key]] = ast.unparse(node)
+            return ast.Name(id=self.shared[key], ctx=ast.Load())
+        return node
+
+
+class ExpressionSet:
+    """Expression rules of one rule set, compiled into one function.
+
+    evaluate(transaction) returns (score, hit_indices) where hit_indices
+    are the indices of the rules (as passed in) that apply, in no
+    particular order.
+    """
+
+    def __init__(self, rules, share=True):
+        self.rules = list(rules)
+        trees = [parse_expression(expression) for _, _, expression in self.rules]
+
+        fields = {}
+        for tree in trees:
+            for node in ast.walk(tree):
+                if isinstance(node, ast.Name) and node.id not in fields:
+                    fields[node.id] = f"f_{len(fields)}"
+
+        counts = {}
+        for tree in trees:
+            for key in _subexpressions(tree):
+                counts[key] = counts.get(key, 0) + 1
+        shared = {}
+        if share:
+            for key, count in counts.items():
+                if count > 1:
+                    shared[key] = f"s_{len(shared)}"
+
+        definitions = {}
+        rewriter = _Rewriter(fields, shared, definitions)
+        # Each rule as a list of AND-ed conditions
+        conjuncts = []
+        for tree in trees:
+            parts = tree.values if isinstance(tree, ast.BoolOp) and isinstance(tree.op, ast.And) else [tree]
+            conjuncts.append([_code(rewriter.visit(part)) for part in parts])
+
+        lines = ["def evaluate(t):"]
+        lines += [f"    {local} = t.get({field!r})" for field, local in fields.items()]
+        for name, code in definitions.items():
+            lines += [
+                "    try:",
+                f"        {name} = {code}",
+                "    except ERRORS:",
+                f"        {name} = ERROR"
+            ]
+        lines += ["    score = 0", "    hits = []"]
+        leaves = [(index, score, parts) for (index, score, _), parts in zip(self.rules, conjuncts)]
+        lines += _emit(leaves, 1, share)
+        lines.append("    return score, hits")
+
+        self.source = "\n".join(lines) + "\n"
+        self.fields = list(fields)
+        self.shared_count = len(shared)
+        namespace = {"__builtins__": {}, "ERROR": ERROR, "ERRORS": ERRORS}
+        exec(compile(self.source, "<rule expressions>", "exec"), namespace)
+        self.evaluate = namespace["evaluate"]
+
+
+def _emit(leaves, depth, factor):
+    """Code for a group of rules, branching on the condition most of them share.
+
+    A rule applies only if all of its AND-ed conditions are true and none
+    of them fails, whatever their order, so a shared condition can be
+    tested once for the whole group. Conditions of one rule that are not
+    shared stay in their original order.
+    """
+    indent = "    " * depth
+    lines = []
+    while leaves:
+        counts = {}
+        if factor and (depth - 1) // 2 < MAX_NESTING:
+            for _, _, parts in leaves:
+                for part in set(parts):
+                    counts[part] = counts.get(part, 0) + 1
+        common = max(counts, key=counts.get) if counts else None
+        if common is None or counts[common] < 2:
+            for index, score, parts in leaves:
+                body = [f"{indent}score += {score!r}", f"{indent}hits.append({index!r})"]
+                if parts:
+                    condition = " and ".join(parts)
+                    body = [f"{indent}try:", f"{indent}    if {condition}:"] + \
+                           ["        " + line for line in body] + [f"{indent}except ERRORS:", f"{indent}    pass"]
+                lines += body
+            return lines
+        inside = [(i, sc, [p for p in parts if p != common]) for i, sc, parts in leaves if common in parts]
+        leaves = [leaf for leaf in leaves if common not in leaf[2]]
+        lines += [f"{indent}try:", f"{indent}    if {common}:"]
+        lines += _emit(inside, depth + 2, factor)
+        lines += [f"{indent}except ERRORS:", f"{indent}    pass"]
+    return lines
+
+
+def compile_expression(expression):
+    """Standalone predicate for a single expression (no sharing across rules)"""
+    evaluate = ExpressionSet([(0, 0, expression)]).evaluate
+    return lambda transaction: bool(evaluate(transaction)[1])
@@ -0,0 +1,70 @@
+"""
+Dump per-rule profiling counters from a running checkout server
+
+Usage:
+    python rule_stats.py [--url URL] [--token TOKEN] [--sort hits|hit_rate|avg_ns|total_ns] [--merchant ID]
+    python rule_stats.py --reset
+    python rule_stats.py --sample-every 100
+"""
+
+import argparse
+import json
+import os
+
+import requests
+
+BASE_URL = "http://127.0.0.1:8000"
+
+
+def fetch_stats(base_url, token, reset=False, sample_every=None, merchant_id=None):
+    """Call the /admin/rule-stats endpoints and return the stats snapshot"""
+    headers = {"X-Admin-Token": token or ""}
+    params = {"merchant_id": merchant_id} if merchant_id else {}
+    if sample_every is not None:
+        response = requests.post(f"{base_url}/admin/rule-stats/sampling",
+                                 params={"sample_every": sample_every}, headers=headers)
+    elif reset:
+        response = requests.post(f"{base_url}/admin/rule-stats/reset", params=params, headers=headers)
+    else:
+        response = requests.get(f"{base_url}/admin/rule-stats", params=params, headers=headers)
+    response.raise_for_status()
+    return response.json()
+
+
+def format_stats(stats, sort_key="total_ns"):
+    """Render a stats snapshot as a text table"""
+    lines = [
+        f"calls: {stats['calls']}  sampled: {stats['sampled_calls']}  sample_every: {stats['sample_every']}",
+        f"evaluation order (fast mode): {', '.join(stats['order'])}",
+        "",
+        f"{'rule':<24}{'score':>7}{'evals':>12}{'hits':>12}{'hit_rate':>10}{'avg_ns':>10}{'total_ns':>14}"
+    ]
+    for rule in sorted(stats['rules'], key=lambda r: r[sort_key], reverse=True):
+        lines.append(
+            f"{str(rule['name']):<24}{rule['score']:>7}{rule['evaluations']:>12}{rule['hits']:>12}"
+            f"{rule['hit_rate']:>10.2%}{rule['avg_ns']:>10.0f}{rule['total_ns']:>14}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dump per-rule risk_check counters")
+    parser.add_argument("--url", default=BASE_URL)
+    parser.add_argument("--token", default=os.getenv("ADMIN_TOKEN"))
+    parser.add_argument("--sort", default="total_ns", choices=["hits", "hit_rate", "avg_ns", "total_ns", "evaluations"])
+    parser.add_argument("--reset", action="store_true", help="reset counters after printing them")
+    parser.add_argument("--sample-every", type=int, help="set the sampling interval (0 disables stats)")
+    parser.add_argument("--json", action="store_true", help="print the raw JSON snapshot")
+    parser.add_argument("--merchant", help="stats of a loaded merchant rule set instead of rules.json")
+    args = parser.parse_args()
+
+    stats = fetch_stats(args.url, args.token, sample_every=args.sample_every, merchant_id=args.merchant)
+    print(json.dumps(stats, indent=2, ensure_ascii=False) if args.json else format_stats(stats, args.sort))
+
+    if args.reset:
+        fetch_stats(args.url, args.token, reset=True, merchant_id=args.merchant)
+        print("\nCounters reset.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Pre-fork multi-worker server
+
+The master process imports the app once (rules.json, compiled rule
+engines and any lookup tables loaded at import), freezes the GC so those
+objects stay in shared copy-on-write pages, binds the listening socket
+and then forks N uvicorn workers that accept on the shared socket.
+Pending 3DS transactions live in a SQLite file shared by all workers
+(PENDING_STORE_PATH), so /3ds-verify may land on any worker.
+
+Usage:
+    python serve.py --workers 4 [--host 0.0.0.0] [--port 8000]
+
+Send SIGUSR1 to the master to print RSS/PSS per worker.
+"""
+
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+import uvicorn
+
+
+def memory_usage(pid):
+    """Return RSS, PSS and shared/private memory of a process in KB (Linux only)"""
+    usage = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty"):
+                    usage[key.lower()] = int(rest.split()[0])
+    except OSError:
+        pass
+    return usage
+
+
+def print_memory_report(master_pid, workers):
+    """Print per-process memory; PSS splits shared pages between processes"""
+    print(f"{'process':<18}{'rss_kb':>10}{'pss_kb':>10}{'shared_kb':>12}{'private_kb':>12}", flush=True)
+    for name, pid in [("master", master_pid)] + [(f"worker-{i}", pid) for i, pid in enumerate(workers)]:
+        usage = memory_usage(pid)
+        if not usage:
+            continue
+        shared = usage.get("shared_clean", 0) + usage.get("shared_dirty", 0)
+        private = usage.get("private_clean", 0) + usage.get("private_dirty", 0)
+        print(f"{name + ' (' + str(pid) + ')':<18}{usage['rss']:>10}{usage['pss']:>10}{shared:>12}{private:>12}",
+              flush=True)
+
+
+def run_worker(app, sock, log_level):
+    """Serve requests on the inherited socket until terminated"""
+    signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+    config = uvicorn.Config(app, log_level=log_level, access_log=False)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-fork multi-worker server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args()
+
+    # Workers must share pending 3DS transactions
+    os.environ.setdefault("PENDING_STORE_PATH", os.path.join(tempfile.gettempdir(), "smart-checkout-pending.db"))
+
+    # Preload everything read-only in the master
+    from app import app, shutdown
+    gc.collect()
+    gc.freeze()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    master_pid = os.getpid()
+    workers = []
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(app, sock, args.log_level)
+            finally:
+                # os._exit() skips atexit: flush buffered audit records and profile deltas first
+                try:
+                    shutdown()
+                finally:
+                    os._exit(0)
+        return pid
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGUSR1, lambda signum, frame: print_memory_report(master_pid, workers))
+
+    workers.extend(spawn() for _ in range(args.workers))
+    print(f"Serving on http://{args.host}:{args.port} with {args.workers} workers (master {master_pid})", flush=True)
+
+    while workers:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        if pid in workers:
+            index = workers.index(pid)
+            if stopping:
+                workers.pop(index)
+            else:
+                # Replace a crashed worker
+                print(f"Worker {pid} exited, restarting", file=sys.stderr, flush=True)
+                time.sleep(0.1)
+                workers[index] = spawn()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import json
+import os
+import queue
+import threading
+import time
+from collections import Counter
+
+from rule_engine import RuleEngine
+
+
+class ShadowEvaluator:
+    """Scores candidate rule configs against live traffic off the request path.
+
+    submit() only does a non-blocking put into a bounded queue; when the
+    queue is full the transaction is dropped and counted, so the request
+    path never waits. A daemon thread scores every shadow config (full
+    mode, no LLM) and aggregates disagreements with the production result.
+
+    The thread scores at most batch_size queued transactions, then
+    sleeps for zero seconds to release the GIL. Otherwise a backlog is
+    drained in one go and request threads wait for the interpreter's
+    switch interval (5ms) to run again.
+
+    Production results from fast mode settle the risk level and 3DS
+    outcome but not the score, so they are left out of the score delta.
+    """
+
+    def __init__(self, configs, queue_size=10000, batch_size=8):
+        self.engines = {name: RuleEngine(config, sample_every=0) for name, config in configs.items()}
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self._start()
+        # Threads do not survive fork; pre-forked workers get their own
+        os.register_at_fork(after_in_child=self._start)
+
+    def _start(self):
+        self.queue = queue.Queue(maxsize=self.queue_size)
+        self.lock = threading.Lock()
+        self.dropped = 0
+        self._reset_stats()
+        self.thread = threading.Thread(target=self._run, name="shadow-evaluator", daemon=True)
+        self.thread.start()
+
+    def _reset_stats(self):
+        self.submitted = 0
+        self.evaluated = 0
+        self.stats = {
+            name: {
+                "level_flips": Counter(),
+                "3ds_added": 0,
+                "3ds_removed": 0,
+                "score_delta_sum": 0,
+                "scored": 0,
+                "errors": 0,
+                "last_error": None
+            }
+            for name in self.engines
+        }
+
+    def submit(self, transaction, risk, partial_score=False):
+        """Queue a scored transaction for shadow evaluation without blocking
+
+        partial_score marks a production score from fast mode, which is
+        not compared with the shadow scores.
+        """
+        score = None if partial_score else risk["risk_score"]
+        try:
+            self.queue.put_nowait((transaction, risk["risk_level"], risk["requires_3ds"], score))
+            self.submitted += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            with self.lock:
+                for item in batch:
+                    self._evaluate(*item)
+            time.sleep(0)
+
+    def _evaluate(self, transaction, level, requires_3ds, score):
+        for name, engine in self.engines.items():
+            stats = self.stats[name]
+            try:
+                shadow_score, _ = engine.evaluate(transaction)
+                shadow_level, shadow_3ds, _ = engine.classify(shadow_score)
+            except Exception as e:
+                # A candidate that fails on live data must not stop the other candidates
+                stats["errors"] += 1
+                stats["last_error"] = f"{type(e).__name__}: {e}"
+                continue
+            if shadow_level != level:
+                stats["level_flips"][f"{level}->{shadow_level}"] += 1
+            if shadow_3ds and not requires_3ds:
+                stats["3ds_added"] += 1
+            elif requires_3ds and not shadow_3ds:
+                stats["3ds_removed"] += 1
+            if score is not None:
+                stats["score_delta_sum"] += min(shadow_score, engine.max_score) - score
+                stats["scored"] += 1
+        self.evaluated += 1
+
+    def snapshot(self):
+        """Aggregated disagreement stats per shadow config"""
+        with self.lock:
+            configs = {}
+            for name, stats in self.stats.items():
+                # Rates cover the transactions this config could score
+                evaluated = (self.evaluated - stats["errors"]) or 1
+                level_flips = sum(stats["level_flips"].values())
+                flips_3ds = stats["3ds_added"] + stats["3ds_removed"]
+                configs[name] = {
+                    "level_flips": dict(stats["level_flips"]),
+                    "level_flip_rate": level_flips / evaluated,
+                    "3ds_added": stats["3ds_added"],
+                    "3ds_removed": stats["3ds_removed"],
+                    "3ds_flip_rate": flips_3ds / evaluated,
+                    "mean_score_delta": stats["score_delta_sum"] / stats["scored"] if stats["scored"] else None,
+                    "errors": stats["errors"],
+                    "last_error": stats["last_error"]
+                }
+            return {
+                "submitted": self.submitted,
+                "evaluated": self.evaluated,
+                "dropped": self.dropped,
+                "queue_depth": self.queue.qsize(),
+                "configs": configs
+            }
+
+    def reset(self):
+        with self.lock:
+            self.dropped = 0
+            self._reset_stats()
+
+
+def load_shadow_evaluator(paths, queue_size=10000, batch_size=8):
+    """Build a ShadowEvaluator from comma-separated rules file paths, or None"""
+    configs = {}
+    for path in filter(None, (p.strip() for p in paths.split(","))):
+        with open(path, 'r', encoding='utf-8') as f:
+            configs[os.path.basename(path)] = json.load(f)
+    return ShadowEvaluator(configs, queue_size, batch_size) if configs else None
@@ -0,0 +1,126 @@
+"""
+Streaming NDJSON risk scoring
+
+score_stream() turns a chunked NDJSON request body (one transaction per
+line) into NDJSON result lines, in input order, while the body is still
+arriving. Results for the lines of one input chunk are written out
+together, so the response is not one HTTP chunk per event.
+
+Without LLM insight scoring is CPU-only and runs inline. With LLM
+insight each line is scored in the default thread pool, with at most
+max_in_flight lines outstanding; when the window is full the oldest line
+is awaited before more of the body is read. The response side is pulled
+by the server, so a client that stops reading also stops the input.
+Memory therefore stays bounded by one input chunk plus the window,
+whatever the length of the stream.
+
+Each line is scored in a fresh context, so with tracing enabled every
+event gets its own root trace instead of growing the request's.
+"""
+
+import asyncio
+import contextvars
+import json
+import os
+from collections import deque
+
+from starlette.requests import ClientDisconnect
+from starlette.responses import StreamingResponse
+
+# Lines scored concurrently in the thread pool when LLM insight is on
+STREAM_MAX_IN_FLIGHT = int(os.getenv("STREAM_MAX_IN_FLIGHT", "32"))
+
+# Longest accepted input line; the stream ends with an error line beyond it
+STREAM_MAX_LINE_BYTES = int(os.getenv("STREAM_MAX_LINE_BYTES", "65536"))
+
+
+def _error(number, message):
+    return (json.dumps({"line": number, "error": message}, ensure_ascii=False) + "\n").encode()
+
+
+def score_line(score, number, line):
+    """One NDJSON result line for one input line"""
+    try:
+        event = json.loads(line)
+    except ValueError:
+        return _error(number, "无效的JSON")
+    try:
+        result = score(event)
+    except (ValueError, TypeError) as e:
+        return _error(number, f"无效的交易: {str(e).splitlines()[0]}")
+    return (json.dumps({"line": number, **result}, ensure_ascii=False) + "\n").encode()
+
+
+async def score_stream(chunks, score, in_threads=False, max_in_flight=STREAM_MAX_IN_FLIGHT,
+                       max_line_bytes=STREAM_MAX_LINE_BYTES):
+    """Yield NDJSON result bytes for an async iterator of NDJSON body chunks
+
+    score(event) returns a dict for one parsed line and raises ValueError
+    or TypeError for invalid events. in_threads runs it in the thread
+    pool (for scoring that may block, e.g. on the LLM).
+    """
+    loop = asyncio.get_running_loop()
+    # Result lines (bytes) and thread pool futures, in input order
+    window = deque()
+    buffer = b""
+    number = 0
+    more = True
+
+    while more:
+        try:
+            chunk = await chunks.__anext__()
+        except StopAsyncIteration:
+            # Score a last line that has no trailing newline
+            more = False
+            chunk = b"\n"
+        buffer += chunk
+        lines = []
+        if b"\n" in chunk:
+            *lines, buffer = buffer.split(b"\n")
+
+        ready = []
+        for line in lines:
+            if not line.strip():
+                continue
+            number += 1
+            if not in_threads:
+                window.append(contextvars.Context().run(score_line, score, number, line))
+                continue
+            if len(window) >= max_in_flight:
+                # Backpressure: stop reading until the oldest line is scored
+                ready.append(await _result(window.popleft()))
+            window.append(loop.run_in_executor(None, contextvars.Context().run,
+                                               score_line, score, number, line))
+        if len(buffer) > max_line_bytes:
+            window.append(_error(number + 1, f"单行超过{max_line_bytes}字节"))
+            more = False
+
+        while window and (isinstance(window[0], bytes) or window[0].done()):
+            ready.append(await _result(window.popleft()))
+        if ready:
+            yield b"".join(ready)
+
+    while window:
+        yield await _result(window.popleft())
+
+
+async def _result(item):
+    return item if isinstance(item, bytes) else await item
+
+
+class NDJSONStreamingResponse(StreamingResponse):
+    """StreamingResponse for a body iterator that is still reading the request body.
+
+    StreamingResponse normally watches receive() for a client disconnect
+    while it streams, which would take the body chunks away from
+    request.stream(). Here the body iterator is the only reader, and a
+    disconnect shows up as ClientDisconnect from request.stream().
+    """
+
+    media_type = "application/x-ndjson"
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.stream_response(send)
+        except (ClientDisconnect, OSError):
+            pass
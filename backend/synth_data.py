@@ -0,0 +1,361 @@
+"""
+Seedable synthetic transactions for benchmarks, replay and gate training
+
+Generates PaymentRequest-shaped transactions in blocks of numpy columns:
+- amount: log-normal body with a Pareto tail
+- payment_method, currency and (ip_country, card_country) pairs from
+  configurable mixes
+- user_history: a share of new users, geometric otherwise
+- injected fraud: card-testing bursts (one card, many tiny credit card
+  payments from a foreign IP) and cross-border spikes (a window where
+  domestic cards are used from foreign IPs for larger amounts)
+
+Every row also has "ts" (unix seconds, Poisson arrivals), "label" (1
+for injected fraud, as read by llm_gate.py train) and "pattern" (none,
+card_testing or cross_border). The same seed, config and row count give
+byte-identical output in every format.
+
+Output formats:
+- jsonl: one JSON object per line (replay.py, /risk/stream)
+- csv: header row plus one line per transaction (replay.py)
+- columnar: segment directories with one .npy file per column and a
+  meta.json holding the dictionaries, like decision_archive.py
+
+Usage:
+    python synth_data.py jsonl transactions.jsonl --rows 1000000 --seed 42
+    python synth_data.py columnar synth_dir --rows 10000000 --config synth.json
+"""
+
+import argparse
+import copy
+import json
+import os
+import time
+
+import numpy as np
+
+# Rows generated per block; part of the output definition, so changing it changes the data
+BLOCK_ROWS = 65536
+
+DEFAULT_CONFIG = {
+    "start_ts": 1760000000,
+    "rate_per_second": 200,
+    "amount": {
+        "median": 260,
+        "sigma": 1.1,
+        "tail_share": 0.02,
+        "tail_min": 5000,
+        "tail_alpha": 1.6,
+        "max": 500000
+    },
+    "payment_method": {"alipay": 0.45, "wechat_pay": 0.35, "credit_card": 0.2},
+    "currency": {"CNY": 0.94, "USD": 0.04, "HKD": 0.02},
+    # ip_country/card_country
+    "country_pairs": {"CN/CN": 0.86, "HK/CN": 0.03, "CN/HK": 0.02, "US/US": 0.03, "US/CN": 0.02,
+                      "JP/JP": 0.02, "CN/US": 0.02},
+    "user_history": {"new_share": 0.12, "mean": 15},
+    # 0 leaves merchant_id empty
+    "merchants": 0,
+    "card_pool": 200000,
+    "fraud": {
+        "card_testing": {"bursts_per_million": 300, "length": [5, 40], "amount": [1, 20],
+                         "ip_countries": ["US", "RU", "NG", "BR", "VN"]},
+        "cross_border": {"spikes_per_million": 20, "length": [200, 2000], "share": 0.5,
+                         "amount_factor": 4, "ip_countries": ["US", "RU", "NG", "BR", "VN"]}
+    }
+}
+
+PATTERNS = ["none", "card_testing", "cross_border"]
+
+# Column order of the jsonl/csv output
+FIELDS = ["ts", "amount", "currency", "payment_method", "card_number", "card_country", "ip_country",
+          "user_history", "merchant_id", "label", "pattern"]
+
+# Columns stored as dictionary codes in columnar output
+DICTIONARY_COLUMNS = ["currency", "payment_method", "card_country", "ip_country", "merchant_id", "pattern"]
+
+
+def load_config(path=None):
+    """DEFAULT_CONFIG with the keys of a JSON file merged in (nested dicts are merged too)"""
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            _merge(config, json.load(f))
+    return config
+
+
+def _merge(base, override):
+    # Mixes are replaced as a whole so that values can be removed
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict) and key not in (
+                "payment_method", "currency", "country_pairs"):
+            _merge(base[key], value)
+        else:
+            base[key] = value
+
+
+def _mix(mix):
+    """(values, probabilities) of a {value: weight} mix"""
+    values = list(mix)
+    weights = np.array([mix[v] for v in values], dtype=np.float64)
+    return values, weights / weights.sum()
+
+
+class TransactionGenerator:
+    """Deterministic stream of transaction blocks for one seed and config.
+
+    Blocks are dicts of numpy arrays: numeric columns as values,
+    dictionary columns as int codes into self.dictionaries.
+    """
+
+    def __init__(self, seed=0, config=None):
+        self.seed = seed
+        self.config = config or load_config()
+        self.rng = np.random.default_rng(seed)
+        self.next_ts = float(self.config["start_ts"])
+
+        self.methods, self.method_p = _mix(self.config["payment_method"])
+        self.currencies, self.currency_p = _mix(self.config["currency"])
+        pairs, self.pair_p = _mix(self.config["country_pairs"])
+        fraud = self.config["fraud"]
+        foreign = sorted(set(fraud["card_testing"]["ip_countries"]) | set(fraud["cross_border"]["ip_countries"]))
+        countries = sorted({c for pair in pairs for c in pair.split("/")} | set(foreign) | {"CN"})
+        self.country_code = {c: i for i, c in enumerate(countries)}
+        self.pair_ip = np.array([self.country_code[p.split("/")[0]] for p in pairs])
+        self.pair_card = np.array([self.country_code[p.split("/")[1]] for p in pairs])
+        merchants = self.config["merchants"]
+        self.dictionaries = {
+            "currency": self.currencies,
+            "payment_method": self.methods,
+            "card_country": countries,
+            "ip_country": countries,
+            "merchant_id": [None] + [f"m_{i:05d}" for i in range(1, merchants + 1)],
+            "pattern": PATTERNS
+        }
+        self.credit_card = self.methods.index("credit_card") if "credit_card" in self.methods else None
+        # Card numbers are "4" followed by 15 digits; 0 means no card
+        self.cards = 4 * 10 ** 15 + self.rng.integers(0, 10 ** 15, self.config["card_pool"], dtype=np.int64)
+
+    def block(self, rows=BLOCK_ROWS):
+        """Generate the next block of rows"""
+        rng = self.rng
+        config = self.config
+        amount_config = config["amount"]
+
+        gaps = rng.exponential(1.0 / config["rate_per_second"], rows)
+        ts = self.next_ts + np.cumsum(gaps)
+        self.next_ts = float(ts[-1])
+
+        amount = rng.lognormal(np.log(amount_config["median"]), amount_config["sigma"], rows)
+        tail = rng.random(rows) < amount_config["tail_share"]
+        amount[tail] = amount_config["tail_min"] * (1 + rng.pareto(amount_config["tail_alpha"], int(tail.sum())))
+        amount = np.round(np.clip(amount, 0.01, amount_config["max"]), 2)
+
+        method = rng.choice(len(self.methods), rows, p=self.method_p).astype(np.uint16)
+        currency = rng.choice(len(self.currencies), rows, p=self.currency_p).astype(np.uint16)
+        pair = rng.choice(len(self.pair_p), rows, p=self.pair_p)
+        ip_country = self.pair_ip[pair].astype(np.uint16)
+        card_country = self.pair_card[pair].astype(np.uint16)
+
+        history_config = config["user_history"]
+        user_history = rng.geometric(1.0 / history_config["mean"], rows).astype(np.int32)
+        user_history[rng.random(rows) < history_config["new_share"]] = 0
+
+        card_number = np.zeros(rows, dtype=np.int64)
+        if self.credit_card is not None:
+            cards = method == self.credit_card
+            card_number[cards] = self.cards[rng.integers(0, len(self.cards), int(cards.sum()))]
+
+        merchants = config["merchants"]
+        if merchants:
+            merchant_id = ((rng.zipf(1.3, rows) - 1) % merchants + 1).astype(np.uint16)
+        else:
+            merchant_id = np.zeros(rows, dtype=np.uint16)
+
+        block = {
+            "ts": ts.astype(np.int64),
+            "amount": amount,
+            "currency": currency,
+            "payment_method": method,
+            "card_number": card_number,
+            "card_country": card_country,
+            "ip_country": ip_country,
+            "user_history": user_history,
+            "merchant_id": merchant_id,
+            "label": np.zeros(rows, dtype=np.uint8),
+            "pattern": np.zeros(rows, dtype=np.uint16)
+        }
+        self._card_testing(block, rows)
+        self._cross_border(block, rows)
+        return block
+
+    def _windows(self, per_million, length, rows):
+        """Random [start, end) windows for injected patterns"""
+        rng = self.rng
+        count = rng.poisson(per_million * rows / 1e6)
+        starts = rng.integers(0, rows, count)
+        lengths = rng.integers(length[0], length[1] + 1, count)
+        return [(int(s), int(min(s + n, rows))) for s, n in zip(starts, lengths)]
+
+    def _card_testing(self, block, rows):
+        if self.credit_card is None:
+            return
+        rng = self.rng
+        pattern = self.config["fraud"]["card_testing"]
+        foreign = [self.country_code[c] for c in pattern["ip_countries"]]
+        low, high = pattern["amount"]
+        for start, end in self._windows(pattern["bursts_per_million"], pattern["length"], rows):
+            n = end - start
+            block["payment_method"][start:end] = self.credit_card
+            block["card_number"][start:end] = self.cards[rng.integers(0, len(self.cards))]
+            block["card_country"][start:end] = rng.choice(self.pair_card)
+            block["ip_country"][start:end] = rng.choice(foreign)
+            block["amount"][start:end] = np.round(rng.uniform(low, high, n), 2)
+            block["user_history"][start:end] = 0
+            block["label"][start:end] = 1
+            block["pattern"][start:end] = PATTERNS.index("card_testing")
+
+    def _cross_border(self, block, rows):
+        rng = self.rng
+        pattern = self.config["fraud"]["cross_border"]
+        foreign = np.array([self.country_code[c] for c in pattern["ip_countries"]])
+        domestic = self.country_code["CN"]
+        for start, end in self._windows(pattern["spikes_per_million"], pattern["length"], rows):
+            hit = start + np.flatnonzero(rng.random(end - start) < pattern["share"])
+            hit = hit[block["pattern"][hit] == 0]
+            block["card_country"][hit] = domestic
+            block["ip_country"][hit] = foreign[rng.integers(0, len(foreign), len(hit))]
+            block["amount"][hit] = np.minimum(np.round(block["amount"][hit] * pattern["amount_factor"], 2),
+                                              self.config["amount"]["max"])
+            block["label"][hit] = 1
+            block["pattern"][hit] = PATTERNS.index("cross_border")
+
+    def blocks(self, rows):
+        """Blocks covering exactly rows rows"""
+        while rows > 0:
+            n = min(rows, BLOCK_ROWS)
+            block = self.block(BLOCK_ROWS)
+            if n < BLOCK_ROWS:
+                block = {name: column[:n] for name, column in block.items()}
+            yield block
+            rows -= n
+
+    def decoded(self, block):
+        """Python lists per field in the PaymentRequest shape (None for missing values)"""
+        columns = {}
+        for name in FIELDS:
+            column = block[name]
+            if name in DICTIONARY_COLUMNS:
+                dictionary = self.dictionaries[name]
+                columns[name] = [dictionary[code] for code in column.tolist()]
+            elif name == "card_number":
+                columns[name] = [str(card) if card else None for card in column.tolist()]
+            else:
+                columns[name] = column.tolist()
+        return columns
+
+    def transactions(self, rows):
+        """Transaction dicts, one at a time"""
+        for block in self.blocks(rows):
+            columns = self.decoded(block)
+            for values in zip(*(columns[name] for name in FIELDS)):
+                yield dict(zip(FIELDS, values))
+
+
+def _text_columns(generator, block, null, quote):
+    """Each field as a list of values for %s formatting (strings already quoted, numbers as is)"""
+    columns = []
+    for name in FIELDS:
+        column = block[name]
+        if name in DICTIONARY_COLUMNS:
+            text = [null if value is None else quote % value for value in generator.dictionaries[name]]
+            columns.append(list(map(text.__getitem__, column.tolist())))
+        elif name == "card_number":
+            columns.append([quote % card if card else null for card in column.tolist()])
+        else:
+            columns.append(column.tolist())
+    return columns
+
+
+def write_jsonl(generator, rows, path):
+    """Write rows as JSONL; values are plain ASCII, so lines are formatted directly"""
+    template = "{" + ", ".join(f'"{name}": %s' for name in FIELDS) + "}\n"
+    with open(path, "w", encoding="utf-8") as f:
+        for block in generator.blocks(rows):
+            f.writelines([template % values for values in zip(*_text_columns(generator, block, "null", '"%s"'))])
+
+
+def write_csv(generator, rows, path):
+    """Write rows as CSV with a header; missing values are empty"""
+    template = ",".join(["%s"] * len(FIELDS)) + "\n"
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write(",".join(FIELDS) + "\n")
+        for block in generator.blocks(rows):
+            f.writelines([template % values for values in zip(*_text_columns(generator, block, "", "%s"))])
+
+
+def write_columnar(generator, rows, directory, segment_rows=1_048_576):
+    """Write segment directories of .npy columns plus meta.json (rounded up to whole blocks)"""
+    os.makedirs(directory, exist_ok=True)
+    pending = []
+
+    def flush(index):
+        segment = os.path.join(directory, f"segment-{index:05d}")
+        os.makedirs(segment, exist_ok=True)
+        count = 0
+        for name in FIELDS:
+            column = np.concatenate([block[name] for block in pending])
+            np.save(os.path.join(segment, f"{name}.npy"), column)
+            count = len(column)
+        meta = {"rows": count, "dictionaries": {name: generator.dictionaries[name] for name in DICTIONARY_COLUMNS}}
+        with open(os.path.join(segment, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        pending.clear()
+
+    index = 0
+    buffered = 0
+    for block in generator.blocks(rows):
+        pending.append(block)
+        buffered += len(block["ts"])
+        if buffered >= segment_rows:
+            flush(index)
+            index += 1
+            buffered = 0
+    if pending:
+        flush(index)
+
+
+def read_columnar(directory):
+    """Yield (columns, meta) per segment, columns memory-mapped"""
+    for name in sorted(os.listdir(directory)):
+        segment = os.path.join(directory, name)
+        if not name.startswith("segment-"):
+            continue
+        with open(os.path.join(segment, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        columns = {field: np.load(os.path.join(segment, f"{field}.npy"), mmap_mode="r") for field in FIELDS}
+        yield columns, meta
+
+
+WRITERS = {"jsonl": write_jsonl, "csv": write_csv, "columnar": write_columnar}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic transactions")
+    parser.add_argument("format", choices=sorted(WRITERS))
+    parser.add_argument("output", help="file (jsonl, csv) or directory (columnar)")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--config", help="JSON file overriding DEFAULT_CONFIG")
+    args = parser.parse_args()
+
+    generator = TransactionGenerator(args.seed, load_config(args.config))
+    start = time.perf_counter()
+    WRITERS[args.format](generator, args.rows, args.output)
+    elapsed = time.perf_counter() - start
+    print(f"Wrote {args.rows} transactions to {args.output} in {elapsed:.2f}s "
+          f"({args.rows / elapsed:,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
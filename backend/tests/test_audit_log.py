@@ -0,0 +1,147 @@
+"""
+Test script for the batched decision audit log
+Checks batching, segment rotation, card masking, the drop-on-full backpressure policy and full scores in fast mode
+"""
+
+import glob
+import json
+import os
+import sys
+import tempfile
+sys.path.append('.')
+
+from audit_log import AuditWriter, decision_record
+
+PAYMENT_REQUEST = {
+    "amount": 6000.0,
+    "currency": "CNY",
+    "payment_method": "credit_card",
+    "card_number": "4111111111111111",
+    "card_country": "CN",
+    "ip_country": "US",
+    "user_history": 0
+}
+
+RISK = {
+    "risk_score": 60,
+    "risk_level": "MEDIUM",
+    "requires_3ds": True,
+    "reasons": ["大额交易", "新用户", "跨境交易"],
+    "llm_insight": None
+}
+
+
+def read_records(directory):
+    records = []
+    for path in sorted(glob.glob(os.path.join(directory, "audit-*.jsonl"))):
+        with open(path, "r", encoding="utf-8") as f:
+            records.extend(json.loads(line) for line in f)
+    return records
+
+
+def test_records_written_and_rotated():
+    """All records reach disk across several size-rotated segments"""
+    print("Testing audit log batching and rotation...")
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = AuditWriter(tmp, batch_size=100, segment_bytes=20000, flush_interval=0.05)
+        for i in range(1000):
+            assert writer.enqueue(decision_record(PAYMENT_REQUEST, RISK, "success", f"CC_{i}"))
+        writer.close()
+
+        records = read_records(tmp)
+        segments = glob.glob(os.path.join(tmp, "audit-*.jsonl"))
+        print(f"Stats: {writer.stats()}, segments: {len(segments)}")
+        assert len(records) == 1000
+        assert {r["transaction_id"] for r in records} == {f"CC_{i}" for i in range(1000)}
+        assert len(segments) > 1
+        assert records[0]["request"]["card_number"] == "************1111"
+        assert records[0]["reasons"] == RISK["reasons"]
+    print("✓ Records are batched and segments rotate by size")
+
+
+def test_drop_when_full():
+    """A full buffer drops records after max_block_ms instead of blocking the caller"""
+    print("Testing audit log backpressure...")
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = AuditWriter(tmp, capacity=10, batch_size=1000, flush_interval=60, max_block_ms=1)
+        results = [writer.enqueue(decision_record(PAYMENT_REQUEST, RISK, "success")) for _ in range(15)]
+        writer.close()
+        print(f"Stats: {writer.stats()}")
+        assert results.count(False) == 5
+        assert writer.stats()["dropped"] == 5
+        assert len(read_records(tmp)) == 10
+    print("✓ Overflow is dropped and counted")
+
+
+def test_write_error_keeps_writer_running():
+    """A failed write loses only its batch; the writer thread keeps going on a new segment"""
+    print("Testing audit log write errors...")
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = AuditWriter(tmp, batch_size=10, flush_interval=0.05)
+        write = writer._write
+        failures = []
+
+        def failing_write(batch):
+            if not failures:
+                failures.append(len(batch))
+                # Leave a partial line behind, as a write cut short by a full disk would
+                writer._rotate()
+                writer.segment.write(b'{"transaction_id": "CC_')
+                raise OSError(28, "No space left on device")
+            write(batch)
+
+        writer._write = failing_write
+        for i in range(50):
+            assert writer.enqueue(decision_record(PAYMENT_REQUEST, RISK, "success", f"CC_{i}"))
+        writer.close()
+        stats = writer.stats()
+        print(f"Stats: {stats}")
+        assert stats["write_errors"] == 1
+        assert stats["dropped"] == failures[0] == 10
+        segments = sorted(glob.glob(os.path.join(tmp, "audit-*.jsonl")))
+        # The damaged segment is left alone; later batches go to a fresh one
+        records = []
+        for path in segments[1:]:
+            with open(path, "r", encoding="utf-8") as f:
+                records.extend(json.loads(line) for line in f)
+        assert len(records) == stats["written"] == 40
+    print("✓ Write errors are counted and the writer recovers")
+
+
+def test_fast_mode_audited_in_full():
+    """With RISK_EVAL_MODE=fast, audited checkouts still carry the full score and reasons"""
+    print("Testing audited scores in fast mode...")
+    import app as app_module
+    import risk_service
+
+    transaction = {"amount": 100.0, "payment_method": "alipay", "user_history": 3,
+                   "ip_country": "US", "card_country": "CN"}
+    payment_request = app_module.PaymentRequest(**transaction).model_dump()
+    fast = risk_service.risk_check(payment_request, mode="fast", llm=False)
+    print(f"Fast mode: {fast['risk_score']} {fast['reasons']}")
+    assert (fast["risk_score"], fast["reasons"]) == (0, [])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        saved = (app_module.AUDIT_WRITER, app_module.RISK_EVAL_MODE)
+        app_module.AUDIT_WRITER = AuditWriter(tmp, flush_interval=0.01)
+        app_module.RISK_EVAL_MODE = "fast"
+        try:
+            response = app_module.process_payment(payment_request)
+            app_module.AUDIT_WRITER.close()
+        finally:
+            app_module.AUDIT_WRITER, app_module.RISK_EVAL_MODE = saved
+        records = read_records(tmp)
+        print(f"Audited: {records[0]['risk_score']} {records[0]['reasons']}")
+        assert response["status"] == "success"
+        assert (records[0]["risk_score"], records[0]["reasons"]) == (25, ["跨境交易"])
+    print("✓ Audit records are scored in full mode")
+
+
+if __name__ == "__main__":
+    test_records_written_and_rotated()
+    print()
+    test_drop_when_full()
+    print()
+    test_write_error_keeps_writer_running()
+    print()
+    test_fast_mode_audited_in_full()
@@ -0,0 +1,153 @@
+"""
+Test script for /checkout/batch
+Checks batched scoring against risk_check, the single LLM call per order and the shared 3DS challenge
+"""
+
+import sys
+import time
+from types import SimpleNamespace
+sys.path.append('.')
+
+import llm_service
+from app import checkout_batch, complete_3ds_payment, pending_transactions, process_batch, BatchCheckoutRequest
+from fastapi import HTTPException
+from prompt_templates import parse_batch
+from risk_service import risk_check, risk_check_batch
+
+LOW = {"amount": 100, "currency": "CNY", "payment_method": "alipay", "user_history": 5,
+       "ip_country": "CN", "card_country": "CN"}
+# amount + new user: LLM band, no 3DS
+MEDIUM = {"amount": 6000, "currency": "CNY", "payment_method": "wechat_pay", "user_history": 0,
+          "ip_country": "CN", "card_country": "CN"}
+# amount + new user + cross border: LLM band and 3DS
+HIGH = {"amount": 6000, "currency": "CNY", "payment_method": "credit_card", "card_number": "4111111111111111",
+        "user_history": 0, "ip_country": "US", "card_country": "CN"}
+
+
+class FakeClient:
+    """Answers every numbered line of the prompt after a fixed latency"""
+
+    def __init__(self, latency=0.02):
+        self.latency = latency
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, model, messages, temperature, max_tokens):
+        self.calls += 1
+        time.sleep(self.latency)
+        lines = messages[-1]["content"].splitlines()
+        numbered = [line for line in lines if line[:1].isdigit()]
+        content = "\n".join(f"{n}. 分析{n}" for n in range(1, len(numbered) + 1)) if numbered else "单笔分析"
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+                               usage=SimpleNamespace(prompt_tokens=100, completion_tokens=20))
+
+
+class MockRequest:
+    def __init__(self, transaction_id, verification_code, card_number):
+        self.transaction_id = transaction_id
+        self.verification_code = verification_code
+        self.card_number = card_number
+
+
+def test_parse_batch():
+    """Answers are matched to items by number; missing ones are None"""
+    print("Testing batch answer parsing...")
+    answers = parse_batch("1. 风险较低\n\n3、新用户大额，建议人工复核\n7. 多余\n1. 重复", 3)
+    print(f"Answers: {answers}")
+    assert answers == ["风险较低", None, "新用户大额，建议人工复核"]
+    print("✓ Batch answers are parsed by line number")
+
+
+def test_batch_matches_single():
+    """Batched scoring gives the same decisions as one risk_check per payment"""
+    print("Testing batched scoring...")
+    transactions = [LOW, MEDIUM, HIGH, dict(LOW, amount=8000)]
+    batch = risk_check_batch([dict(t) for t in transactions], llm=False)
+    single = [risk_check(dict(t), llm=False) for t in transactions]
+    assert batch == single
+    print(f"Scores: {[risk['risk_score'] for risk in batch]}")
+    print("✓ Batch scores match risk_check")
+
+
+def test_one_llm_call_per_order():
+    """LLM-band payments of an order share one API call"""
+    print("Testing grouped LLM analysis...")
+    transactions = [MEDIUM, HIGH, LOW, dict(MEDIUM, amount=9000), dict(HIGH, ip_country="JP")]
+    saved = llm_service.client, llm_service.llm_token_log
+    try:
+        llm_service.client = FakeClient()
+        llm_service.llm_token_log = False
+        start = time.perf_counter()
+        single = [risk_check(dict(t)) for t in transactions]
+        single_ms = (time.perf_counter() - start) * 1000
+        single_calls = llm_service.client.calls
+
+        llm_service.client = FakeClient()
+        start = time.perf_counter()
+        batch = risk_check_batch([dict(t) for t in transactions])
+        batch_ms = (time.perf_counter() - start) * 1000
+        batch_calls = llm_service.client.calls
+    finally:
+        llm_service.client, llm_service.llm_token_log = saved
+
+    print(f"Per-payment: {single_calls} LLM calls, {single_ms:.0f}ms; batch: {batch_calls} call, {batch_ms:.0f}ms")
+    assert single_calls == 4 and batch_calls == 1
+    assert [risk["llm_insight"] for risk in batch] == ["分析1", "分析2", None, "分析3", "分析4"]
+    assert [risk["risk_score"] for risk in batch] == [risk["risk_score"] for risk in single]
+    print("✓ One LLM call covers the order")
+
+
+def test_shared_3ds_challenge():
+    """Payments needing 3DS are held under one transaction ID; the rest are routed"""
+    print("Testing shared 3DS challenge...")
+    response = process_batch([dict(LOW), dict(HIGH), dict(MEDIUM), dict(HIGH, payment_method="alipay")])
+    items = response["items"]
+    print(f"Batch status: {response['status']}, items: {[item['status'] for item in items]}")
+    assert response["status"] == "pending_3ds"
+    assert [item["status"] for item in items] == ["success", "pending_3ds", "success", "pending_3ds"]
+    assert items[1]["transaction_id"] == items[3]["transaction_id"] == response["transaction_id"]
+    assert items[0]["transaction_id"].startswith("ALI_") and items[2]["transaction_id"].startswith("WX_")
+
+    result = complete_3ds_payment(MockRequest(response["transaction_id"], "123456", "4111111111111111"))
+    print(f"3DS result: {result['items']}")
+    assert result["success"] and result["status"] == "success"
+    assert [item["index"] for item in result["items"]] == [1, 3]
+    assert result["items"][0]["transaction_id"].startswith("CC_")
+    assert result["items"][1]["transaction_id"].startswith("ALI_")
+    assert response["transaction_id"] not in pending_transactions
+
+    response = process_batch([dict(LOW), dict(LOW, payment_method="paypal")])
+    assert response["status"] == "partial" and response["transaction_id"] is None
+
+    # Held payments that cannot all be routed complete as partial, or failed when none can
+    response = process_batch([dict(HIGH), dict(HIGH, payment_method="paypal")])
+    result = complete_3ds_payment(MockRequest(response["transaction_id"], "123456", "4111111111111111"))
+    print(f"Mixed 3DS result: {result['status']}, {[item['status'] for item in result['items']]}")
+    assert result["status"] == "partial"
+    assert [item["status"] for item in result["items"]] == ["success", "failed"]
+    response = process_batch([dict(HIGH, payment_method="paypal"), dict(HIGH, payment_method="paypal")])
+    result = complete_3ds_payment(MockRequest(response["transaction_id"], "123456", "4111111111111111"))
+    assert result["status"] == "failed"
+    print("✓ One challenge completes the held payments")
+
+
+def test_request_limits():
+    """Empty and oversized batches are rejected"""
+    print("Testing batch limits...")
+    for size in (0, 51):
+        try:
+            checkout_batch(BatchCheckoutRequest(payments=[LOW] * size))
+        except HTTPException as e:
+            print(f"{size} payments: {e.detail}")
+            assert e.status_code == 400
+        else:
+            raise AssertionError(f"accepted {size} payments")
+    print("✓ Batch size is validated")
+
+
+if __name__ == "__main__":
+    test_parse_batch()
+    test_batch_matches_single()
+    test_one_llm_call_per_order()
+    test_shared_3ds_challenge()
+    test_request_limits()
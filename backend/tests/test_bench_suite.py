@@ -0,0 +1,79 @@
+"""
+Test script for the microbenchmark regression suite
+Checks the Mann-Whitney comparison, regression verdicts and a short run of real benchmarks
+"""
+
+import json
+import os
+import sys
+sys.path.append('.')
+
+import numpy as np
+
+from benchmarks.suite import BENCHMARKS, compare, mann_whitney_p, run
+
+
+def results(**samples):
+    return {"benchmarks": {name.replace("_", "/"): {"median": float(np.median(values)), "samples": list(values)}
+                           for name, values in samples.items()}}
+
+
+def test_mann_whitney():
+    """p-values are small for shifted samples and large for samples from the same distribution"""
+    print("Testing Mann-Whitney U...")
+    rng = np.random.default_rng(0)
+    same = mann_whitney_p(rng.normal(10, 1, 20), rng.normal(10, 1, 20))
+    shifted = mann_whitney_p(rng.normal(10, 1, 20), rng.normal(12, 1, 20))
+    ties = mann_whitney_p(np.full(20, 5.0), np.full(20, 5.0))
+    print(f"Same: p={same:.3f}, shifted: p={shifted:.2g}, all ties: p={ties}")
+    assert same > 0.05 and shifted < 1e-4 and ties == 1.0
+    # Separated samples of 20: exact two-sided p is 2/C(40,20) ~ 1.5e-11, the approximation is close
+    assert mann_whitney_p(np.arange(20.0), np.arange(20.0) + 100) < 1e-6
+    print("✓ Mann-Whitney p-values behave as expected")
+
+
+def test_compare_verdicts():
+    """Regressions need both a significant test and a slowdown above the threshold"""
+    print("Testing compare verdicts...")
+    rng = np.random.default_rng(1)
+    base = results(a_slow=rng.normal(100, 3, 20), b_small=rng.normal(100, 3, 20),
+                   c_noisy=rng.normal(100, 40, 5), d_fast=rng.normal(100, 3, 20), e_missing=[1.0])
+    current = results(a_slow=rng.normal(120, 3, 20), b_small=rng.normal(102, 3, 20),
+                      c_noisy=rng.normal(130, 40, 5), d_fast=rng.normal(80, 3, 20))
+    rows = {row[0]: row for row in compare(base, current, threshold=0.05, alpha=0.01)}
+    for row in rows.values():
+        print(row)
+    assert rows["a/slow"][-1] == "regression"
+    assert rows["b/small"][-1] == "unchanged"
+    assert rows["c/noisy"][-1] == "unchanged"
+    assert rows["d/fast"][-1] == "improvement"
+    assert "e/missing" not in rows
+    print("✓ Only significant slowdowns above the threshold are regressions")
+
+
+def test_short_run():
+    """A short run of the pure-Python benchmarks produces a comparable result file"""
+    print("Testing a short run...")
+    names = ["risk_check/small", "pending_store/dict"]
+    assert set(BENCHMARKS) >= set(names) | {"llm/analysis_stub", "checkout/inprocess"}
+    first = run(names, repeats=4, rounds=2)
+    second = json.loads(json.dumps(run(names, repeats=4, rounds=2)))
+    assert first["meta"]["rounds"] == 2
+    for name in names:
+        assert len(first["benchmarks"][name]["samples"]) == 4 and first["benchmarks"][name]["median"] > 0
+    assert {row[0] for row in compare(first, second)} == set(names)
+
+    # The checkout benchmark must time accepted payments, not validation errors
+    with BENCHMARKS["checkout/inprocess"]() as op:
+        assert all(op().status_code == 200 for _ in range(64))
+
+    baseline = os.path.join("benchmarks", "baselines", "baseline.json")
+    with open(baseline, "r", encoding="utf-8") as f:
+        assert set(json.load(f)["benchmarks"]) == set(BENCHMARKS)
+    print("✓ Results round-trip through JSON and compare")
+
+
+if __name__ == "__main__":
+    test_mann_whitney()
+    test_compare_verdicts()
+    test_short_run()
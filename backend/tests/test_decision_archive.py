@@ -0,0 +1,163 @@
+"""
+Test script for the columnar decision archive
+Compacts audit log records and checks group-by queries against a plain Python aggregation
+"""
+
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+sys.path.append('.')
+
+from audit_log import AuditWriter, decision_record
+from decision_archive import DecisionArchive, compact
+from fx_rates import FXTable
+
+BASE_TS = 1_760_000_000 // 3600 * 3600
+
+
+def make_records(n, seed=5):
+    rng = random.Random(seed)
+    records = []
+    for i in range(n):
+        requires_3ds = rng.random() < 0.3
+        request = {
+            "amount": rng.choice([100.0, 6000.0]),
+            "currency": "CNY",
+            "payment_method": rng.choice(["credit_card", "alipay"]),
+            "card_number": "4111111111111111",
+            "card_country": rng.choice(["CN", "US", None]),
+            "ip_country": rng.choice(["CN", "US", "JP"]),
+            "user_history": rng.choice([0, 4])
+        }
+        risk = {
+            "risk_score": 60 if requires_3ds else 15,
+            "risk_level": "MEDIUM" if requires_3ds else "LOW",
+            "requires_3ds": requires_3ds,
+            "reasons": ["大额交易", "跨境交易"] if requires_3ds else ["新用户"],
+            "llm_insight": "分析" if requires_3ds else None
+        }
+        record = decision_record(request, risk, "pending_3ds" if requires_3ds else "success")
+        record["ts"] = BASE_TS + rng.randrange(0, 5 * 3600)
+        records.append(record)
+    return records
+
+
+def test_compact_and_query():
+    """3DS rate by ip_country by hour matches a direct aggregation"""
+    print("Testing columnar archive compaction and queries...")
+    records = make_records(5000)
+    with tempfile.TemporaryDirectory() as tmp:
+        audit_dir = os.path.join(tmp, "audit")
+        archive_dir = os.path.join(tmp, "archive")
+        os.makedirs(audit_dir)
+        for part in range(2):
+            with open(os.path.join(audit_dir, f"audit-part-{part}.jsonl"), "w", encoding="utf-8") as f:
+                for record in records[part * 2500:(part + 1) * 2500]:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+        assert compact(audit_dir, archive_dir, segment_rows=1500) == 5000
+        # Already compacted sources are skipped
+        assert compact(audit_dir, archive_dir) == 0
+
+        archive = DecisionArchive(archive_dir)
+        print(f"Segments: {len(archive.segments)}")
+        rows = archive.query(group_by=["ip_country", "hour"], where={"payment_method": "credit_card"})
+
+        expected = {}
+        for record in records:
+            if record["request"]["payment_method"] != "credit_card":
+                continue
+            key = (record["request"]["ip_country"], (record["ts"] - BASE_TS) // 3600)
+            count, n_3ds = expected.get(key, (0, 0))
+            expected[key] = (count + 1, n_3ds + record["requires_3ds"])
+
+        assert len(rows) == len(expected)
+        assert sum(row["count"] for row in rows) == sum(c for c, _ in expected.values())
+        assert sum(row["requires_3ds_rate"] * row["count"] for row in rows) == \
+            sum(n for _, n in expected.values())
+        print(json.dumps(rows[:3], indent=2, ensure_ascii=False))
+
+        since = BASE_TS + 3600
+        filtered = archive.query(where={"reason": "跨境交易"}, since=since, until=since + 3600)
+        direct = sum(1 for r in records if "跨境交易" in r["reasons"] and since <= r["ts"] < since + 3600)
+        assert filtered[0]["count"] == direct
+        assert filtered[0]["requires_3ds_rate"] == 1.0
+    print("✓ Columnar archive queries match direct aggregation")
+
+
+def test_compact_live_segment():
+    """Records appended to a segment after it was compacted are archived on the next run"""
+    print("Testing incremental compaction of a live segment...")
+    records = make_records(300, seed=6)
+    with tempfile.TemporaryDirectory() as tmp:
+        audit_dir = os.path.join(tmp, "audit")
+        archive_dir = os.path.join(tmp, "archive")
+        # One hour-long segment that stays open across both compactions
+        writer = AuditWriter(audit_dir, batch_size=50, flush_interval=0.01)
+        try:
+            for record in records[:200]:
+                writer.enqueue(record)
+            while writer.stats()["written"] < 200:
+                time.sleep(0.01)
+            assert compact(audit_dir, archive_dir) == 200
+
+            for record in records[200:]:
+                writer.enqueue(record)
+            while writer.stats()["written"] < 300:
+                time.sleep(0.01)
+            segments = [name for name in os.listdir(audit_dir) if name.startswith("audit-")]
+            assert len(segments) == 1
+            # A batch still being written is left for the next run
+            with open(os.path.join(audit_dir, segments[0]), "ab") as f:
+                f.write(b'{"ts": 1')
+            assert compact(audit_dir, archive_dir) == 100
+            assert compact(audit_dir, archive_dir) == 0
+        finally:
+            writer.close()
+
+        archive = DecisionArchive(archive_dir)
+        rows = archive.query(group_by=["status"])
+        print(rows)
+        assert sum(row["count"] for row in rows) == 300
+    print("✓ Live segments are compacted incrementally")
+
+
+def test_query_normalized_amount():
+    """Group totals of amounts are converted to the base currency on the dictionary codes"""
+    print("Testing normalized amount totals...")
+    rates = {"CNY": 1.0, "USD": 7.0, "JPY": 0.05}
+    records = make_records(2000, seed=7)
+    rng = random.Random(8)
+    for record in records:
+        record["request"]["currency"] = rng.choice(["CNY", "USD", "JPY", "XYZ"])
+    with tempfile.TemporaryDirectory() as tmp:
+        audit_dir = os.path.join(tmp, "audit")
+        archive_dir = os.path.join(tmp, "archive")
+        os.makedirs(audit_dir)
+        with open(os.path.join(audit_dir, "audit-part-0.jsonl"), "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        compact(audit_dir, archive_dir, segment_rows=700)
+        rates_path = os.path.join(tmp, "fx.json")
+        with open(rates_path, "w", encoding="utf-8") as f:
+            json.dump({"base": "CNY", "rates": rates}, f)
+        fx_table = FXTable(rates_path, refresh_interval=0)
+
+        rows = DecisionArchive(archive_dir, fx_table).query(group_by=["payment_method"])
+        print(rows)
+        for row in rows:
+            # Unknown currencies are summed unconverted
+            expected = sum(r["request"]["amount"] * rates.get(r["request"]["currency"], 1.0)
+                           for r in records if r["request"]["payment_method"] == row["payment_method"])
+            assert abs(row["total_normalized_amount"] - expected) < 1e-6
+        assert fx_table.stats()["unknown"] == sum(r["request"]["currency"] == "XYZ" for r in records)
+    print("✓ Amount totals are in the base currency")
+
+
+if __name__ == "__main__":
+    test_compact_and_query()
+    test_compact_live_segment()
+    test_query_normalized_amount()
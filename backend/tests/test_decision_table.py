@@ -0,0 +1,116 @@
+"""
+Test script for the precomputed decision table mode
+Checks that table lookups give the same decisions as full evaluation, the fallback and the stats
+"""
+
+import json
+import random
+import sys
+sys.path.append('.')
+
+import risk_service
+from decision_table import DECISION_TABLE_MAX_RULES
+from rule_engine import RuleEngine
+
+with open('rules.json', 'r', encoding='utf-8') as f:
+    RULES_CONFIG = json.load(f)
+
+MIXED_RULES = RULES_CONFIG["risk_rules"] + [
+    {"name": "big_new_card", "operator": "expr", "score": 30, "message": "新用户大额信用卡",
+     "expression": "amount > 3000 and user_history == 0 and payment_method == 'credit_card'"},
+    {"name": "loyal", "field": "user_history", "operator": "gte", "threshold": 10, "score": -20, "message": None},
+    {"name": "unsupported", "field": "amount", "operator": "between", "threshold": [1, 2], "score": 99},
+    {"name": "wallet", "operator": "expr", "score": 5, "message": "钱包支付",
+     "expression": "payment_method in ('alipay', 'wechat_pay')"}
+]
+
+
+def random_transaction(rng):
+    transaction = {
+        "amount": rng.choice([100, 3000, 5000, 6000, 20000]),
+        "payment_method": rng.choice(["credit_card", "alipay", "wechat_pay"]),
+        "card_country": rng.choice(["CN", "US"]),
+        "ip_country": rng.choice(["CN", "US", "JP"]),
+        "user_history": rng.choice([0, 0, 1, 5, 20])
+    }
+    # Missing fields must not apply, as in full mode
+    for field in list(transaction):
+        if rng.random() < 0.1:
+            del transaction[field]
+    return transaction
+
+
+def test_table_matches_full():
+    """Every decision from the table equals the full evaluation, for simple and mixed rule sets"""
+    print("Testing table lookups against full evaluation...")
+    rng = random.Random(7)
+    for rules in (RULES_CONFIG["risk_rules"], MIXED_RULES):
+        engine = RuleEngine({**RULES_CONFIG, "risk_rules": rules}, table_max_rules=DECISION_TABLE_MAX_RULES)
+        table = engine.decision_table
+        print(table.source)
+        # The unsupported rule never applies and takes no bit
+        assert len(table) == 2 ** (len(rules) if rules is RULES_CONFIG["risk_rules"] else len(rules) - 1)
+        for _ in range(3000):
+            transaction = random_transaction(rng)
+            assert engine.decide(transaction, "table") == engine.decide(transaction, "full"), transaction
+            assert engine.evaluate(transaction, "table") == engine.evaluate(transaction, "full")
+
+    # Comparison errors surface the same way (None > 5000)
+    engine = RuleEngine(RULES_CONFIG, table_max_rules=DECISION_TABLE_MAX_RULES)
+    for mode in ("full", "table"):
+        try:
+            engine.decide({"amount": None}, mode)
+            assert False, "None amount must raise"
+        except TypeError:
+            pass
+    print("✓ Table decisions match full evaluation")
+
+
+def test_fallback():
+    """Rule sets too large to tabulate are evaluated in full"""
+    print("Testing fallback to full evaluation...")
+    many = [{"name": f"amount_{i}", "field": "amount", "operator": "gt", "threshold": i * 100, "score": 3,
+             "message": f"金额>{i * 100}"} for i in range(20)]
+    engine = RuleEngine({**RULES_CONFIG, "risk_rules": many}, table_max_rules=DECISION_TABLE_MAX_RULES)
+    assert engine.decision_table is None
+    transaction = {"amount": 1050}
+    assert engine.decide(transaction, "table") == engine.decide(transaction, "full")
+    assert engine.decide(transaction, "table")[0] == 33
+    assert engine.stats()["decision_table"] is None
+    # Engines built without a cap have no table
+    assert RuleEngine(RULES_CONFIG).decision_table is None
+    print("✓ Large rule sets fall back to full evaluation")
+
+
+def test_stats_and_risk_check():
+    """Table lookups feed the per-rule hit counts; risk_check accepts mode="table\""""
+    print("Testing stats and risk_check integration...")
+    engine = RuleEngine(RULES_CONFIG, table_max_rules=DECISION_TABLE_MAX_RULES)
+    hit_all = {"amount": 6000, "user_history": 0, "ip_country": "US", "card_country": "CN"}
+    engine.decide(hit_all, "table")
+    engine.decide({"amount": 100, "user_history": 3, "ip_country": "CN", "card_country": "CN"}, "table")
+    stats = engine.stats()
+    print(stats)
+    assert stats["decision_table"] == {"entries": 8, "lookups": 2}
+    assert [(rule["evaluations"], rule["hits"]) for rule in stats["rules"]] == [(2, 1)] * 3
+    engine.reset_stats()
+    assert engine.stats()["decision_table"]["lookups"] == 0
+
+    saved = risk_service.RULE_ENGINE
+    risk_service.RULE_ENGINE = RuleEngine(RULES_CONFIG, table_max_rules=DECISION_TABLE_MAX_RULES)
+    try:
+        table = risk_service.risk_check({**hit_all, "payment_method": "credit_card"}, mode="table", llm=False)
+        full = risk_service.risk_check({**hit_all, "payment_method": "credit_card"}, mode="full", llm=False)
+        print(table)
+        assert table == full and table["risk_level"] == "MEDIUM" and table["requires_3ds"]
+        batch = risk_service.risk_check_batch([hit_all, {"amount": 10}], mode="table", llm=False)
+        assert [risk["risk_score"] for risk in batch] == [60, 0]
+    finally:
+        risk_service.RULE_ENGINE = saved
+    print("✓ Stats and risk_check work in table mode")
+
+
+if __name__ == "__main__":
+    test_table_matches_full()
+    test_fallback()
+    test_stats_and_risk_check()
@@ -0,0 +1,146 @@
+"""
+Test script for the server-side user/card feature store
+Checks write-behind aggregates, read-through caching, sharing between workers and the risk_check/checkout integration
+"""
+
+import os
+import sys
+import tempfile
+sys.path.append('.')
+
+from fastapi.testclient import TestClient
+
+import app as app_module
+import risk_service
+import feature_store
+from feature_store import FeatureStore
+
+KEY = b"test-card-hash-key-0123456789"
+
+PAYMENT = {"user_id": "alice", "card_number": "4111111111111111", "amount": 120.0,
+           "payment_method": "credit_card", "ip_country": "CN", "card_country": "CN"}
+
+
+def test_write_behind_and_read_through():
+    """Recorded payments are visible at once, and to other workers after a flush"""
+    print("Testing write-behind aggregates...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "profiles.db")
+        store = FeatureStore(path, KEY, flush_interval=3600)
+        assert store.features({"amount": 10}) == {}
+        assert store.features(PAYMENT)["user_history"] == 0
+
+        store.record(PAYMENT, ts=1000)
+        store.record({**PAYMENT, "amount": 80.0, "ip_country": "JP"}, ts=2000)
+        store.record({**PAYMENT, "user_id": "bob"}, ts=3000)
+        # Cached profile updated in place; bob is loaded with the queued delta merged in
+        features = store.features(PAYMENT, now=1000 + 86400)
+        print(features)
+        assert features == {"card_history": 3, "user_history": 2, "profile_total_amount": 200.0,
+                            "profile_age_days": 1.0, "profile_last_country": "JP"}
+        assert store.features({**PAYMENT, "user_id": "bob"})["user_history"] == 1
+
+        # Another worker sees nothing until the flush, then the same aggregates
+        other = FeatureStore(path, KEY, ttl=0)
+        assert other.features(PAYMENT)["user_history"] == 0
+        store.flush()
+        assert other.features(PAYMENT, now=1000 + 86400) == features
+        print(store.stats())
+        assert store.stats()["written"] == 3 and store.stats()["pending"] == 0
+
+        # Both workers flushing the same profiles add up
+        store.record(PAYMENT)
+        other.record(PAYMENT)
+        store.close()
+        other.close()
+        third = FeatureStore(path, KEY)
+        assert third.features(PAYMENT)["user_history"] == 4
+        assert third.features(PAYMENT)["card_history"] == 5
+        third.close()
+
+        with open(path, "rb") as f:
+            assert b"4111111111111111" not in f.read()
+    print("✓ Aggregates are correct before and after write-behind flushes")
+
+
+def test_lru_eviction():
+    """The cache keeps the most recently used profiles"""
+    print("Testing LRU eviction...")
+    with tempfile.TemporaryDirectory() as tmp:
+        store = FeatureStore(os.path.join(tmp, "profiles.db"), KEY, cache_size=2)
+        for user in ("a", "b", "a", "c", "a"):
+            store.profile("user", user)
+        stats = store.stats()
+        print(stats)
+        assert list(store.cache) == [("user", "c"), ("user", "a")]
+        assert stats["hits"] == 2 and stats["misses"] == 3
+        store.close()
+    print("✓ Least recently used profiles are evicted")
+
+
+def test_checkout_uses_stored_history():
+    """The client-supplied user_history is ignored; successful payments build the profile"""
+    print("Testing checkout integration...")
+    saved = (risk_service.FEATURE_STORE, app_module.FEATURE_STORE)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = FeatureStore(os.path.join(tmp, "profiles.db"), KEY)
+        risk_service.FEATURE_STORE = app_module.FEATURE_STORE = store
+        try:
+            client = TestClient(app_module.app)
+            request = {"user_id": "carol", "amount": 100, "payment_method": "alipay", "user_history": 50}
+            first = client.post("/checkout", json=request).json()
+            print(first)
+            assert first["status"] == "success" and "新用户" in first["reasons"]
+
+            second = client.post("/checkout", json={**request, "user_history": 0}).json()
+            print(second)
+            assert "新用户" not in second["reasons"]
+            assert store.features(request)["user_history"] == 2
+
+            # No identity: the client value is used as before
+            anonymous = risk_service.risk_check({"amount": 100, "payment_method": "alipay", "user_history": 3},
+                                                llm=False)
+            assert "新用户" not in anonymous["reasons"]
+        finally:
+            risk_service.FEATURE_STORE, app_module.FEATURE_STORE = saved
+            store.close()
+    print("✓ risk_check reads the server-side profile")
+
+
+def test_key_required():
+    """Without a card hashing key of at least 16 bytes the store is not enabled"""
+    print("Testing FEATURE_STORE_KEY validation...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "profiles.db")
+        for key in (b"", b"short"):
+            try:
+                FeatureStore(path, key)
+                assert False, f"key {key!r} must be rejected"
+            except ValueError as e:
+                print(e)
+
+        saved = {name: os.environ.get(name) for name in ("FEATURE_STORE_PATH", "FEATURE_STORE_KEY")}
+        os.environ["FEATURE_STORE_PATH"] = path
+        try:
+            os.environ.pop("FEATURE_STORE_KEY", None)
+            assert feature_store.load_feature_store() is None
+            os.environ["FEATURE_STORE_KEY"] = ""
+            assert feature_store.load_feature_store() is None
+            os.environ["FEATURE_STORE_KEY"] = KEY.decode()
+            store = feature_store.load_feature_store()
+            assert store is not None
+            store.close()
+        finally:
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+    print("✓ Unkeyed card hashing is refused")
+
+
+if __name__ == "__main__":
+    test_write_behind_and_read_through()
+    test_lru_eviction()
+    test_checkout_uses_stored_history()
+    test_key_required()
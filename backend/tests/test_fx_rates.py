@@ -0,0 +1,154 @@
+"""
+Test script for currency-normalized amounts
+Checks rate lookups, the row/column/encoded paths, snapshot refresh and the risk_check integration
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+sys.path.append('.')
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+import app as app_module
+import risk_service
+from fx_rates import FXSnapshot, FXTable
+from rule_engine import RuleEngine
+
+RATES = {"base": "CNY", "as_of": "2026-10-01", "rates": {"CNY": 1.0, "USD": 7.0, "JPY": 0.05}}
+
+
+def write_rates(path, rates):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(rates, f)
+
+
+def test_normalize_paths():
+    """normalize(), normalize_rows(), normalize_column() and normalize_encoded() agree"""
+    print("Testing normalization paths...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "fx.json")
+        write_rates(path, RATES)
+        table = FXTable(path, refresh_interval=0)
+        assert table.normalize(100, "USD") == 700.0
+        assert table.normalize(6000, "JPY") == 300.0
+        # Unknown currencies pass through unconverted and are counted
+        assert table.normalize(100, "XYZ") == 100
+        assert table.stats()["unknown"] == 1
+
+        rows = [{"amount": 100, "currency": "USD"}, {"amount": 6000, "currency": "JPY"},
+                {"amount": 50, "currency": "XYZ"}, {"amount": 10}]
+        normalized = table.normalize_rows(rows)
+        assert [row["normalized_amount"] for row in normalized] == [700.0, 300.0, 50, 10]
+        assert "normalized_amount" not in rows[0]
+        assert table.stats()["unknown"] == 3
+        # A missing amount stays missing instead of becoming 0
+        assert table.normalize_rows([{"amount": None, "currency": "USD"}])[0]["normalized_amount"] is None
+        assert table.stats()["unknown"] == 3
+
+        column = table.normalize_column(np.array([100.0, 6000.0, 50.0]), ["USD", "JPY", "XYZ"])
+        assert column.tolist() == [700.0, 300.0, 50.0]
+        encoded = table.normalize_encoded(np.array([100.0, 6000.0, 50.0, 1.0]), np.array([1, 2, 3, 0]),
+                                          ["CNY", "USD", "JPY", "XYZ"])
+        assert encoded.tolist() == [700.0, 300.0, 50.0, 1.0]
+        assert table.stats()["unknown"] == 5
+    print("✓ All paths give the same amounts")
+
+
+def test_refresh():
+    """A changed file installs a new snapshot; an invalid one keeps the old rates"""
+    print("Testing snapshot refresh...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "fx.json")
+        write_rates(path, RATES)
+        table = FXTable(path, refresh_interval=0)
+        old = table.snapshot
+        assert table.refresh() is False
+
+        write_rates(path, {**RATES, "as_of": "2026-10-02", "rates": {**RATES["rates"], "USD": 7.5}})
+        os.utime(path, ns=(old.mtime + 10**9, old.mtime + 10**9))
+        assert table.refresh() is True
+        assert table.snapshot is not old and table.normalize(100, "USD") == 750.0
+        # A reader holding the old snapshot still sees a consistent table
+        assert old.rates["USD"] == 7.0
+
+        write_rates(path, {**RATES, "rates": {"USD": -1}})
+        assert table.refresh(force=True) is False
+        print(table.stats())
+        assert table.normalize(100, "USD") == 750.0 and table.stats()["errors"] == 1
+        try:
+            old.rates["USD"] = 8.0
+            assert False, "snapshot rates must be read-only"
+        except TypeError:
+            pass
+        try:
+            FXSnapshot("CNY", None, {"USD": 0})
+            assert False, "non-positive rates must be rejected"
+        except ValueError:
+            pass
+    print("✓ Refresh swaps snapshots and keeps the last good one")
+
+
+def test_risk_check_integration():
+    """Rules on normalized_amount see the amount in CNY for checkout and batch scoring"""
+    print("Testing risk_check integration...")
+    config = dict(risk_service.RULES_CONFIG)
+    config["risk_rules"] = [
+        {"name": "large_normalized", "field": "normalized_amount", "operator": "gt", "threshold": 5000,
+         "score": 40, "message": "折算金额过大"}
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "fx.json")
+        write_rates(path, RATES)
+        saved = (risk_service.RULE_ENGINE, risk_service.FX_TABLE, app_module.FX_TABLE, app_module.ADMIN_TOKEN)
+        risk_service.RULE_ENGINE = RuleEngine(config)
+        risk_service.FX_TABLE = app_module.FX_TABLE = FXTable(path, refresh_interval=0)
+        app_module.ADMIN_TOKEN = "test-admin"
+        try:
+            jpy = {"amount": 6000, "currency": "JPY", "payment_method": "credit_card"}
+            usd = {"amount": 1000, "currency": "USD", "payment_method": "credit_card"}
+            assert "折算金额过大" not in risk_service.risk_check(jpy, llm=False)["reasons"]
+            assert "折算金额过大" in risk_service.risk_check(usd, llm=False)["reasons"]
+            batch = risk_service.risk_check_batch([jpy, usd], llm=False)
+            assert ["折算金额过大" in risk["reasons"] for risk in batch] == [False, True]
+            # Batch and single scoring treat a missing amount the same way
+            missing = {"amount": None, "currency": "USD"}
+            assert risk_service.normalize_amounts([missing])[0]["normalized_amount"] is None
+            assert risk_service.enrich(missing)["normalized_amount"] is None
+
+            client = TestClient(app_module.app)
+            headers = {"X-Admin-Token": "test-admin"}
+            stats = client.get("/admin/fx-rates", headers=headers).json()
+            print(stats)
+            assert stats["base"] == "CNY" and stats["currencies"] == 3
+            write_rates(path, {"rates": "broken"})
+            assert client.post("/admin/fx-rates/reload", headers=headers).status_code == 400
+        finally:
+            risk_service.RULE_ENGINE, risk_service.FX_TABLE, app_module.FX_TABLE, app_module.ADMIN_TOKEN = saved
+    print("✓ normalized_amount is scored in the base currency")
+
+
+def test_row_path_without_numpy():
+    """normalize() and normalize_rows() work without importing NumPy"""
+    print("Testing that the row path leaves NumPy unloaded...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "fx.json")
+        write_rates(path, RATES)
+        code = ("import sys; from fx_rates import FXTable; table = FXTable(sys.argv[1], 0); "
+                "assert table.normalize(10, 'USD') == 70.0; "
+                "assert table.normalize_rows([{'amount': 10, 'currency': 'USD'}])[0]['normalized_amount'] == 70.0; "
+                "print('numpy' in sys.modules)")
+        result = subprocess.run([sys.executable, "-c", code, path], capture_output=True, text=True, check=True)
+    print(result.stdout.strip())
+    assert result.stdout.strip() == "False"
+    print("✓ NumPy is only loaded by the column paths")
+
+
+if __name__ == "__main__":
+    test_normalize_paths()
+    test_refresh()
+    test_risk_check_integration()
+    test_row_path_without_numpy()
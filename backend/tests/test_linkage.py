@@ -0,0 +1,115 @@
+"""
+Test script for the fraud-ring linkage index
+Checks union-find clusters, 3DS failure counts, generation aging and the checkout integration
+"""
+
+import sys
+sys.path.append('.')
+
+from fastapi.testclient import TestClient
+
+import app as app_module
+import risk_service
+from linkage import LinkageIndex, UnionFind
+from rule_engine import RuleEngine
+
+
+def payment(card, user, ip="10.0.0.1", device=None):
+    return {"card_number": card, "user_id": user, "ip_address": ip, "device_id": device}
+
+
+def test_union_find():
+    """Linked keys share a cluster; sizes and failure counts add up on union"""
+    print("Testing union-find...")
+    uf = UnionFind()
+    uf.link(["a", "b"])
+    uf.link(["c", "d", "e"])
+    uf.failures[uf.link(["c"])] += 2
+    assert uf.cluster(["a"]) == (2, 0)
+    assert uf.cluster(["e"]) == (3, 2)
+    # Looking up keys from different clusters counts them as if linked, without linking
+    assert uf.cluster(["a", "d", "new"]) == (6, 2)
+    assert uf.find(uf.ids["a"]) != uf.find(uf.ids["d"])
+    uf.link(["b", "e"])
+    assert uf.cluster(["a"]) == (5, 2)
+    assert len({uf.find(i) for i in range(len(uf))}) == 1
+
+    # A long chain stays correct
+    chain = UnionFind()
+    for i in range(10000):
+        chain.link([i, i + 1])
+    assert chain.cluster([0]) == (10001, 0)
+    print("✓ Clusters and failure counts are merged")
+
+
+def test_rings_and_aging():
+    """A shared card joins users, IPs and devices; old generations are dropped"""
+    print("Testing rings and aging...")
+    index = LinkageIndex(window=100, max_nodes=1000)
+    for i in range(5):
+        index.link(payment("4111", f"u{i}", ip=f"ip{i}", device=f"d{i}"), now=i)
+    index.record_3ds_failure(payment("4111", "u0"), now=5)
+    features = index.features(payment("9999", "u3"))
+    print(features)
+    assert features == {"cluster_size": 18, "cluster_3ds_failures": 1}
+    assert index.features({"amount": 10}) == {}
+
+    # A second generation starts at window/2 and only sees later checkouts
+    index.link(payment("5555", "x", ip="ipx"), now=60)
+    assert [len(g) for g in index.generations] == [20, 3]
+    # At t=110 the first generation is dropped: the ring is forgotten
+    index.link(payment("5555", "y", ip="ipy"), now=110)
+    print(index.stats())
+    assert index.features(payment("4111", "u0", ip="ip0"))["cluster_size"] == 3
+    assert index.features(payment("5555", "x", ip="ipx"))["cluster_size"] == 5
+
+    # Memory bound: a full generation is dropped early
+    small = LinkageIndex(window=1e9, max_nodes=10)
+    for i in range(20):
+        small.link(payment(f"card{i}", f"user{i}"), now=i)
+    print([len(g) for g in small.generations])
+    # Bounded up to the identifiers of the checkout that crossed the limit
+    assert all(len(g) <= 10 + 1 for g in small.generations) and small.rotations > 0
+    assert len(small.generations[0]) >= 5
+    print("✓ Rings are linked and aged out")
+
+
+def test_checkout_integration():
+    """A failed 3DS challenge raises the risk of other checkouts with the same card"""
+    print("Testing checkout integration...")
+    config = dict(risk_service.RULES_CONFIG)
+    config["risk_rules"] = risk_service.RULES_CONFIG["risk_rules"] + [
+        {"name": "ring_3ds_failures", "field": "cluster_3ds_failures", "operator": "gt", "threshold": 0,
+         "score": 50, "message": "关联3DS失败"}
+    ]
+    saved = (risk_service.RULE_ENGINE, risk_service.LINKAGE_INDEX, app_module.LINKAGE_INDEX)
+    index = LinkageIndex()
+    risk_service.RULE_ENGINE = RuleEngine(config)
+    risk_service.LINKAGE_INDEX = app_module.LINKAGE_INDEX = index
+    try:
+        client = TestClient(app_module.app)
+        request = {"amount": 6000, "payment_method": "credit_card", "card_number": "4111111111111111",
+                   "card_country": "CN", "ip_country": "US", "user_id": "u1", "ip_address": "1.2.3.4"}
+        held = client.post("/checkout", json=request).json()
+        assert held["status"] == "pending_3ds"
+        assert "关联3DS失败" not in held["risk"]["reasons"]
+        failed = client.post("/3ds-verify", json={"transaction_id": held["transaction_id"],
+                                                  "verification_code": "200000",
+                                                  "card_number": "4111111111111111"}).json()
+        assert failed["success"] is False
+
+        other = client.post("/checkout", json={**request, "amount": 100, "ip_country": "CN", "card_country": "CN",
+                                               "user_id": "u2", "ip_address": "5.6.7.8"}).json()
+        print(other)
+        assert other["status"] == "pending_3ds" and "关联3DS失败" in other["risk"]["reasons"]
+        print(index.stats())
+        assert index.features({"user_id": "u1"}) == {"cluster_size": 5, "cluster_3ds_failures": 1}
+    finally:
+        risk_service.RULE_ENGINE, risk_service.LINKAGE_INDEX, app_module.LINKAGE_INDEX = saved
+    print("✓ 3DS failures propagate through the cluster")
+
+
+if __name__ == "__main__":
+    test_union_find()
+    test_rings_and_aging()
+    test_checkout_integration()
@@ -0,0 +1,124 @@
+"""
+Test script for the local LLM gate model
+Trains on synthetic labeled decisions and checks LLM-call reduction and the risk_check wiring
+"""
+
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import timeit
+sys.path.append('.')
+
+import numpy as np
+
+import llm_gate
+import risk_service
+from risk_service import risk_check
+
+
+def synthetic_transactions(n, seed=7):
+    """Transactions labeled by a noisy hidden fraud rule"""
+    rng = random.Random(seed)
+    records = []
+    for _ in range(n):
+        transaction = {
+            "amount": round(rng.lognormvariate(7, 1.5), 2),
+            "currency": "CNY",
+            "payment_method": rng.choice(["credit_card", "alipay", "wechat_pay"]),
+            "card_country": rng.choice(["CN", "CN", "CN", "US"]),
+            "ip_country": rng.choice(["CN", "CN", "CN", "US", "JP"]),
+            "user_history": rng.choice([0, 0, 1, 3, 10, 50])
+        }
+        z = (-4 + 0.6 * np.log1p(transaction["amount"]) - 0.8 * np.log1p(transaction["user_history"])
+             + 1.5 * (transaction["ip_country"] != transaction["card_country"]))
+        transaction["label"] = int(rng.random() < 1 / (1 + np.exp(-z)))
+        records.append(transaction)
+    return records
+
+
+def test_llm_gate():
+    """Train, save/load and evaluate the gate on a held-out replay set"""
+    print("Testing LLM gate model...")
+    engine = risk_service.RULE_ENGINE
+    records = synthetic_transactions(6000)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        train_path = os.path.join(tmp, "train.jsonl")
+        replay_path = os.path.join(tmp, "replay.jsonl")
+        model_path = os.path.join(tmp, "llm_gate.json")
+        for path, part in ((train_path, records[:4000]), (replay_path, records[4000:])):
+            with open(path, "w", encoding="utf-8") as f:
+                for record in part:
+                    f.write(llm_gate.json.dumps(record) + "\n")
+
+        X, y, _ = llm_gate.load_labeled(train_path, engine)
+        llm_gate.train(X, y).save(model_path)
+        gate = llm_gate.load_llm_gate(model_path)
+        print(f"Model size: {os.path.getsize(model_path)} bytes")
+
+        X, y, band = llm_gate.load_labeled(replay_path, engine)
+        report = llm_gate.evaluate(gate, X, y, band)
+        print(f"Replay: {report}")
+        assert report["llm_calls_after"] < report["llm_calls_before"]
+        assert report["skipped_accuracy"] > 0.8
+
+    transaction = {k: v for k, v in records[0].items() if k != "label"}
+    per_call = timeit.timeit(lambda: gate.predict(transaction, 40), number=20000) / 20000
+    print(f"predict(): {per_call * 1e6:.2f}us")
+    assert per_call < 1e-4
+    print("✓ LLM gate trains and reduces LLM calls")
+
+
+def test_risk_check_uses_gate():
+    """Confident predictions skip generate_llm_analysis; uncertain ones call it"""
+    print("Testing risk_check with the LLM gate...")
+    transaction = {
+        "amount": 6000,
+        "currency": "CNY",
+        "payment_method": "credit_card",
+        "user_history": 0,
+        "ip_country": "CN",
+        "card_country": "CN"
+    }
+    calls = []
+    saved_gate, saved_analysis = risk_service.LLM_GATE, risk_service.generate_llm_analysis
+    risk_service.generate_llm_analysis = lambda *args: calls.append(args) or "LLM"
+    try:
+        # All-zero weights predict 0.5: outside [0.9, 1.0] the gate is confident
+        risk_service.LLM_GATE = llm_gate.LLMGate([0.0] * len(llm_gate.FEATURE_NAMES), 0.0, low=0.9, high=1.0)
+        skipped = risk_check(transaction)
+        risk_service.LLM_GATE = llm_gate.LLMGate([0.0] * len(llm_gate.FEATURE_NAMES), 0.0, low=0.1, high=0.9)
+        called = risk_check(transaction)
+    finally:
+        risk_service.LLM_GATE, risk_service.generate_llm_analysis = saved_gate, saved_analysis
+
+    print(f"Skipped insight: {skipped['llm_insight']}")
+    assert skipped["llm_insight"] and skipped["llm_insight"] != "LLM"
+    assert called["llm_insight"] == "LLM"
+    assert len(calls) == 1
+    print("✓ risk_check only calls the LLM when the gate is uncertain")
+
+
+def test_service_import_without_numpy():
+    """Loading and applying the gate in the service does not import NumPy"""
+    print("Testing that the service leaves NumPy unloaded...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "llm_gate.json")
+        llm_gate.LLMGate([0.1] * len(llm_gate.FEATURE_NAMES), -1.0).save(path)
+        code = ("import sys, risk_service; "
+                "assert risk_service.LLM_GATE.needs_llm({'amount': 6000, 'user_history': 0}, 60) in (True, False); "
+                "risk_service.risk_check({'amount': 6000, 'payment_method': 'credit_card'}, llm=False); "
+                "print('numpy' in sys.modules)")
+        env = {**os.environ, "LLM_GATE_MODEL": path}
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env, check=True)
+    print(result.stdout.strip().splitlines()[-1])
+    assert result.stdout.strip().splitlines()[-1] == "False"
+    print("✓ NumPy is only needed for training and evaluation")
+
+
+if __name__ == "__main__":
+    test_llm_gate()
+    test_risk_check_uses_gate()
+    test_service_import_without_numpy()
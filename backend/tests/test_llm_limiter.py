@@ -0,0 +1,91 @@
+"""
+Test script for LLM admission control
+Checks priority ordering, early rejection, queue deadlines and the fallback in generate_llm_analysis
+"""
+
+import sys
+import threading
+import time
+sys.path.append('.')
+
+import llm_service
+from llm_limiter import LLMAdmission
+
+
+def test_priority_order():
+    """While the bucket is empty, higher risk scores are admitted first"""
+    print("Testing priority ordering...")
+    limiter = LLMAdmission(rate=20, burst=1, max_wait_ms=2000)
+    assert limiter.acquire(50)
+
+    admitted = []
+    threads = []
+    for priority in (35, 35, 35, 65, 65, 65):
+        thread = threading.Thread(target=lambda p=priority: limiter.acquire(p) and admitted.append(p))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.005)
+    for thread in threads:
+        thread.join()
+
+    stats = limiter.stats()
+    print(f"Admission order: {admitted}")
+    print(f"Stats: {stats}")
+    assert admitted == [65, 65, 65, 35, 35, 35]
+    assert stats["max_queue_depth"] == 6 and stats["queue_depth"] == 0
+    assert stats["wait_max_ms"] > 100
+    print("✓ High-risk transactions are admitted first")
+
+
+def test_rejection_and_deadline():
+    """Callers that cannot be served within max_wait get False"""
+    print("Testing rejection and queue deadline...")
+    limiter = LLMAdmission(rate=2, burst=1, max_wait_ms=300)
+    assert limiter.acquire(40)
+
+    start = time.perf_counter()
+    assert not limiter.acquire(40)
+    print(f"Predicted rejection took {(time.perf_counter() - start) * 1000:.2f}ms")
+    assert time.perf_counter() - start < 0.05
+
+    # Low priority waits inside its budget but is overtaken by a high-risk caller
+    results = {}
+    low = threading.Thread(target=lambda: results.setdefault("low", limiter.acquire(35, max_wait=0.6)))
+    high = threading.Thread(target=lambda: results.setdefault("high", limiter.acquire(70, max_wait=0.6)))
+    low.start()
+    time.sleep(0.01)
+    high.start()
+    low.join()
+    high.join()
+    print(f"Results: {results}, stats: {limiter.stats()}")
+    assert results == {"low": False, "high": True}
+    assert limiter.stats()["rejected"] == 1 and limiter.stats()["timed_out"] == 1
+    print("✓ Waits never exceed the budget")
+
+
+def test_fallback_when_rejected():
+    """generate_llm_analysis returns the fallback text without calling the API"""
+    print("Testing fallback when rate limited...")
+
+    class FailingClient:
+        @property
+        def chat(self):
+            raise AssertionError("API must not be called")
+
+    saved = (llm_service.client, llm_service.LLM_LIMITER)
+    try:
+        llm_service.client = FailingClient()
+        llm_service.LLM_LIMITER = LLMAdmission(rate=1, burst=1, max_wait_ms=10)
+        llm_service.LLM_LIMITER.acquire(100)
+        analysis = llm_service.generate_llm_analysis({"amount": 6000}, 35, ["大额交易", "新用户"])
+    finally:
+        llm_service.client, llm_service.LLM_LIMITER = saved
+    print(f"Analysis: {analysis}")
+    assert analysis == llm_service.fallback_analysis(35, ["大额交易", "新用户"])
+    print("✓ Rate-limited calls fall back to the mock analysis")
+
+
+if __name__ == "__main__":
+    test_priority_order()
+    test_rejection_and_deadline()
+    test_fallback_when_rejected()
@@ -0,0 +1,61 @@
+"""
+Test script for LLM connection warm-up
+Uses the local TLS stub to check that the warm-up connection is reused by the first LLM call
+"""
+
+import os
+import sys
+sys.path.append('.')
+
+import llm_service
+from benchmarks.tls_stub import start_stub
+
+TRANSACTION = {
+    "amount": 6000,
+    "currency": "CNY",
+    "payment_method": "credit_card",
+    "user_history": 0,
+    "ip_country": "US",
+    "card_country": "CN"
+}
+
+
+def test_warmup_connection_is_reused():
+    """Warm-up opens exactly one TLS connection which the first LLM call reuses"""
+    print("Testing LLM warm-up against a local TLS stub...")
+    server, cert, tmp = start_stub()
+    saved = (llm_service.openai_api_key, llm_service.openai_base_url, llm_service.llm_warmup,
+             os.environ.get("SSL_CERT_FILE"))
+    try:
+        os.environ["SSL_CERT_FILE"] = cert
+        llm_service.openai_api_key = "sk-stub"
+        llm_service.openai_base_url = server.base_url
+        llm_service.llm_warmup = True
+        llm_service.init_client()
+
+        print(f"Warm-up took {llm_service.warmup_ms:.1f}ms, connections: {server.connections}")
+        assert llm_service.warmup_ms is not None
+        assert server.connections == 1
+
+        analysis = llm_service.generate_llm_analysis(TRANSACTION, 60, ["大额交易", "新用户", "跨境交易"])
+        print(f"Analysis: {analysis}")
+        assert analysis == "风险分析：建议正常处理。"
+        assert server.connections == 1
+        assert len(server.requests) == 1
+
+        status = llm_service.get_llm_status()
+        assert status["pool"]["max_connections"] == llm_service.llm_max_connections
+    finally:
+        llm_service.openai_api_key, llm_service.openai_base_url, llm_service.llm_warmup, cert_file = saved
+        if cert_file is None:
+            os.environ.pop("SSL_CERT_FILE", None)
+        else:
+            os.environ["SSL_CERT_FILE"] = cert_file
+        llm_service.init_client()
+        server.shutdown()
+        tmp.cleanup()
+    print("✓ Warm-up connection is reused by the first LLM call")
+
+
+if __name__ == "__main__":
+    test_warmup_connection_is_reused()
@@ -0,0 +1,98 @@
+"""
+Test script for latency-driven load shedding
+Drives the controller with slow and fast requests and checks degradation, recovery and the risk_check wiring
+"""
+
+import sys
+import time
+sys.path.append('.')
+
+import risk_service
+from load_shedding import LoadShedder
+from risk_service import risk_check
+
+TRANSACTION = {
+    "amount": 6000,
+    "currency": "CNY",
+    "payment_method": "credit_card",
+    "user_history": 0,
+    "ip_country": "CN",
+    "card_country": "CN"
+}
+
+
+def run_requests(shedder, latency, seconds):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        with shedder.track():
+            time.sleep(latency)
+
+
+def test_degrade_and_recover():
+    """Slow checkouts raise the level step by step; fast ones bring it back"""
+    print("Testing degradation and recovery...")
+    shedder = LoadShedder(slo_ms=20, step=10, levels=2, interval=0.1, min_samples=3)
+
+    run_requests(shedder, 0.03, 0.5)
+    stats = shedder.stats()
+    print(f"After slow traffic: state={stats['state']}, p95={stats['last_p95_ms']}")
+    assert stats["state"] == "fallback"
+    assert [t["to"] for t in stats["transitions"]] == ["raised_1", "raised_2", "fallback"]
+    assert shedder.llm_action(90, 30) == "fallback"
+
+    shedder.level = 1
+    assert shedder.llm_action(35, 30) == "skip"
+    assert shedder.llm_action(45, 30) == "llm"
+
+    run_requests(shedder, 0.001, 0.5)
+    stats = shedder.stats()
+    print(f"After fast traffic: state={stats['state']}, transitions={[t['to'] for t in stats['transitions']]}")
+    assert stats["state"] == "normal"
+    assert shedder.llm_action(35, 30) == "llm"
+    print("✓ Controller degrades under latency and recovers automatically")
+
+
+def test_in_flight_limit():
+    """Too many concurrent checkouts raise the level even without latency samples"""
+    print("Testing in-flight limit...")
+    shedder = LoadShedder(slo_ms=1000, max_in_flight=2, interval=0.0, min_samples=1000)
+    contexts = [shedder.track() for _ in range(4)]
+    for context in contexts:
+        context.__enter__()
+    assert shedder.stats()["level"] >= 1
+    for context in contexts:
+        context.__exit__(None, None, None)
+    print(f"Transitions: {[t['to'] for t in shedder.stats()['transitions']]}")
+    print("✓ In-flight count triggers shedding")
+
+
+def test_risk_check_shedding():
+    """Skip removes llm_insight, fallback uses the local text; 3DS is unchanged"""
+    print("Testing risk_check with load shedding...")
+    calls = []
+    saved = (risk_service.LOAD_SHEDDER, risk_service.LLM_GATE, risk_service.generate_llm_analysis)
+    risk_service.generate_llm_analysis = lambda *args: calls.append(args) or "LLM"
+    risk_service.LLM_GATE = None
+    try:
+        shedder = LoadShedder(slo_ms=100, step=10, levels=2, interval=3600)
+        risk_service.LOAD_SHEDDER = shedder
+        normal = risk_check(TRANSACTION)
+        shedder.level = 1
+        skipped = risk_check(TRANSACTION)
+        shedder.level = 3
+        fallback = risk_check(TRANSACTION)
+    finally:
+        risk_service.LOAD_SHEDDER, risk_service.LLM_GATE, risk_service.generate_llm_analysis = saved
+
+    print(f"normal={normal['llm_insight']!r}, skipped={skipped['llm_insight']!r}, fallback={fallback['llm_insight']!r}")
+    assert normal["llm_insight"] == "LLM" and len(calls) == 1
+    assert skipped["llm_insight"] is None
+    assert fallback["llm_insight"] and fallback["llm_insight"] != "LLM"
+    assert normal["requires_3ds"] == skipped["requires_3ds"] == fallback["requires_3ds"]
+    print("✓ risk_check follows the shedding level")
+
+
+if __name__ == "__main__":
+    test_degrade_and_recover()
+    test_in_flight_limit()
+    test_risk_check_shedding()
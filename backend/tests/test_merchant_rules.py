@@ -0,0 +1,267 @@
+"""
+Test script for per-merchant rule sets
+Checks lazy loading, the default fallback, LRU eviction of compiled evaluators, the missing-merchant cache
+and the fallback for invalid rule files
+"""
+
+import copy
+import json
+import os
+import sys
+import tempfile
+import timeit
+import threading
+sys.path.append('.')
+
+import merchant_rules
+import risk_service
+from risk_service import risk_check
+
+TRANSACTION = {
+    "amount": 6000,
+    "currency": "CNY",
+    "payment_method": "credit_card",
+    "user_history": 5,
+    "ip_country": "CN",
+    "card_country": "CN"
+}
+
+
+def test_merchant_rule_sets():
+    """Merchants with a rules file get their own evaluator; others use rules.json"""
+    print("Testing per-merchant rule sets...")
+    strict = copy.deepcopy(risk_service.RULES_CONFIG)
+    strict["thresholds"]["requires_3ds"] = 10
+    saved_dir = merchant_rules.MERCHANT_RULES_DIR
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(5):
+            with open(os.path.join(tmp, f"m{i}.json"), "w", encoding="utf-8") as f:
+                json.dump(strict, f)
+        merchant_rules.MERCHANT_RULES_DIR = tmp
+        merchant_rules.clear_merchant_cache()
+        try:
+            default = risk_check({**TRANSACTION, "merchant_id": None}, llm=False)
+            unknown = risk_check({**TRANSACTION, "merchant_id": "no-such-merchant"}, llm=False)
+            merchant = risk_check({**TRANSACTION, "merchant_id": "m0"}, llm=False)
+            traversal = risk_check({**TRANSACTION, "merchant_id": "../rules"}, llm=False)
+            print(f"default 3DS: {default['requires_3ds']}, m0 3DS: {merchant['requires_3ds']}")
+            assert not default["requires_3ds"]
+            assert not unknown["requires_3ds"]
+            assert not traversal["requires_3ds"]
+            assert merchant["requires_3ds"]
+
+            cached = timeit.timeit(lambda: risk_service.get_rule_engine("m0"), number=10000) / 10000
+            print(f"Cached evaluator lookup: {cached * 1e6:.2f}us")
+        finally:
+            merchant_rules.MERCHANT_RULES_DIR = saved_dir
+            merchant_rules.clear_merchant_cache()
+    print("✓ Per-merchant rule sets work correctly")
+
+
+def test_cache_eviction():
+    """A full LRU evicts the least recently used evaluator, which is recompiled on its next use"""
+    print("Testing evaluator cache eviction...")
+    strict = copy.deepcopy(risk_service.RULES_CONFIG)
+    strict["thresholds"]["requires_3ds"] = 10
+    saved = (merchant_rules.MERCHANT_RULES_DIR, merchant_rules.ENGINE_CACHE)
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(3):
+            with open(os.path.join(tmp, f"m{i}.json"), "w", encoding="utf-8") as f:
+                json.dump(strict, f)
+        merchant_rules.MERCHANT_RULES_DIR = tmp
+        merchant_rules.ENGINE_CACHE = merchant_rules.MerchantEngineCache(2, 1 << 30)
+        try:
+            first = merchant_rules.load_merchant_engine("m0")
+            merchant_rules.load_merchant_engine("m1")
+            merchant_rules.load_merchant_engine("m2")
+            info = merchant_rules.merchant_cache_info()
+            print(f"Cache: {info}")
+            assert (info["size"], info["max_size"], info["misses"]) == (2, 2, 3)
+
+            # m0 was evicted by m2: it is compiled again and still scores with its own rules
+            reloaded = merchant_rules.load_merchant_engine("m0")
+            assert reloaded is not first
+            assert merchant_rules.merchant_cache_info()["misses"] == 4
+            assert risk_check({**TRANSACTION, "merchant_id": "m0"}, llm=False)["requires_3ds"]
+            assert merchant_rules.load_merchant_engine("m0") is reloaded
+        finally:
+            merchant_rules.MERCHANT_RULES_DIR, merchant_rules.ENGINE_CACHE = saved
+            merchant_rules.clear_merchant_cache()
+    print("✓ Evicted evaluators are reloaded on demand")
+
+
+def test_missing_merchants():
+    """Merchants without rules are cached apart and never evict compiled evaluators"""
+    print("Testing missing-merchant cache...")
+    saved = (merchant_rules.MERCHANT_RULES_DIR, merchant_rules.ENGINE_CACHE,
+             merchant_rules.MERCHANT_MISSING_CACHE_SIZE)
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, "m0.json"), "w", encoding="utf-8") as f:
+            json.dump(risk_service.RULES_CONFIG, f)
+        merchant_rules.MERCHANT_RULES_DIR = tmp
+        merchant_rules.ENGINE_CACHE = merchant_rules.MerchantEngineCache(2, 1 << 30)
+        merchant_rules.MERCHANT_MISSING_CACHE_SIZE = 50
+        try:
+            engine = merchant_rules.load_merchant_engine("m0")
+            for i in range(120):
+                assert merchant_rules.load_merchant_engine(f"unknown-{i}") is None
+            # Repeated probes are answered by the missing set without touching the file system
+            assert merchant_rules.load_merchant_engine("unknown-119") is None
+            info = merchant_rules.merchant_cache_info()
+            print(f"Cache: {info}")
+            assert info["size"] == 1 and 0 < info["missing"] <= 50
+            assert info["misses"] == 121
+            assert merchant_rules.load_merchant_engine("m0") is engine
+
+            # A rule file added later is picked up after a reload
+            with open(os.path.join(tmp, "unknown-119.json"), "w", encoding="utf-8") as f:
+                json.dump(risk_service.RULES_CONFIG, f)
+            assert merchant_rules.load_merchant_engine("unknown-119") is None
+            merchant_rules.clear_merchant_cache()
+            assert merchant_rules.load_merchant_engine("unknown-119") is not None
+        finally:
+            (merchant_rules.MERCHANT_RULES_DIR, merchant_rules.ENGINE_CACHE,
+             merchant_rules.MERCHANT_MISSING_CACHE_SIZE) = saved
+            merchant_rules.clear_merchant_cache()
+    print("✓ Unknown merchants do not evict compiled evaluators")
+
+
+def test_invalid_rule_files():
+    """Invalid rule files fall back to the default rules and are not parsed again until a reload"""
+    print("Testing invalid merchant rule files...")
+    bad_expression = copy.deepcopy(risk_service.RULES_CONFIG)
+    bad_expression["risk_rules"].append({"name": "broken", "operator": "expr", "score": 10,
+                                         "expression": "amount >", "message": "坏表达式"})
+    files = {"bad_json": '{"risk_rules": [', "bad_expression": json.dumps(bad_expression), "not_object": "[]"}
+    saved = (merchant_rules.MERCHANT_RULES_DIR, merchant_rules.ENGINE_CACHE)
+    with tempfile.TemporaryDirectory() as tmp:
+        for merchant_id, text in files.items():
+            with open(os.path.join(tmp, f"{merchant_id}.json"), "w", encoding="utf-8") as f:
+                f.write(text)
+        merchant_rules.MERCHANT_RULES_DIR = tmp
+        merchant_rules.ENGINE_CACHE = merchant_rules.MerchantEngineCache(2, 1 << 30)
+        merchant_rules.clear_merchant_cache()
+        try:
+            default = risk_check(TRANSACTION, llm=False)
+            for merchant_id in files:
+                assert merchant_rules.load_merchant_engine(merchant_id) is None
+                assert risk_check({**TRANSACTION, "merchant_id": merchant_id}, llm=False) == default
+            info = merchant_rules.merchant_cache_info()
+            print(f"Cache: {info}")
+            assert set(info["invalid"]) == set(files) and info["size"] == 0
+            assert info["invalid"]["bad_json"].startswith("JSONDecodeError")
+            assert info["invalid"]["bad_expression"].startswith("ValueError")
+            assert info["misses"] == 3
+
+            # The failure is cached: a fixed file is only read after a reload
+            with open(os.path.join(tmp, "bad_json.json"), "w", encoding="utf-8") as f:
+                json.dump(risk_service.RULES_CONFIG, f)
+            assert merchant_rules.load_merchant_engine("bad_json") is None
+            assert merchant_rules.merchant_cache_info()["misses"] == 3
+            merchant_rules.clear_merchant_cache()
+            assert merchant_rules.load_merchant_engine("bad_json") is not None
+            assert "bad_json" not in merchant_rules.merchant_cache_info()["invalid"]
+        finally:
+            merchant_rules.MERCHANT_RULES_DIR, merchant_rules.ENGINE_CACHE = saved
+            merchant_rules.clear_merchant_cache()
+    print("✓ Invalid rule files use the default rules until reloaded")
+
+
+def test_table_memory_bound():
+    """In table mode merchant tables are built at compile time and the cache is bounded by their memory"""
+    print("Testing merchant decision table memory bound...")
+    # 8 rules: a 256-entry table of about 56KB per merchant
+    config = copy.deepcopy(risk_service.RULES_CONFIG)
+    config["risk_rules"] = [{"name": f"amount_{i}", "field": "amount", "operator": "gt", "threshold": i * 1000,
+                             "score": 5, "message": f"金额>{i * 1000}"} for i in range(8)]
+    too_many = dict(config, risk_rules=config["risk_rules"] * 2)
+    saved = (merchant_rules.MERCHANT_RULES_DIR, merchant_rules.ENGINE_CACHE, merchant_rules.RISK_EVAL_MODE)
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(4):
+            with open(os.path.join(tmp, f"m{i}.json"), "w", encoding="utf-8") as f:
+                json.dump(config, f)
+        with open(os.path.join(tmp, "big.json"), "w", encoding="utf-8") as f:
+            json.dump(too_many, f)
+        merchant_rules.MERCHANT_RULES_DIR = tmp
+        merchant_rules.RISK_EVAL_MODE = "table"
+        table_bytes = 256 * 220
+        merchant_rules.ENGINE_CACHE = merchant_rules.MerchantEngineCache(256, 2 * table_bytes)
+        try:
+            # Concurrent first requests compile the merchant once
+            engines = []
+            threads = [threading.Thread(target=lambda: engines.append(merchant_rules.load_merchant_engine("m0")))
+                       for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert len({id(engine) for engine in engines}) == 1
+            assert len(engines[0].decision_table) == 256
+            assert merchant_rules.merchant_cache_info()["misses"] == 1
+
+            for i in range(1, 4):
+                merchant_rules.load_merchant_engine(f"m{i}")
+            info = merchant_rules.merchant_cache_info()
+            print(f"Cache: {info}")
+            assert (info["size"], info["evictions"], info["table_bytes"]) == (2, 2, 2 * table_bytes)
+            assert list(merchant_rules.ENGINE_CACHE.engines) == ["m2", "m3"]
+
+            # Above MERCHANT_TABLE_MAX_RULES the merchant is scored in full mode
+            big = merchant_rules.load_merchant_engine("big")
+            assert big.decision_table is None
+            assert big.decide({"amount": 5500}, "table") == big.decide({"amount": 5500}, "full")
+        finally:
+            merchant_rules.MERCHANT_RULES_DIR, merchant_rules.ENGINE_CACHE, merchant_rules.RISK_EVAL_MODE = saved
+            merchant_rules.clear_merchant_cache()
+    print("✓ Merchant tables are prebuilt and bounded by memory")
+
+
+def test_merchant_rule_stats():
+    """The sampling interval applies to merchant evaluators, whose stats are exposed per merchant"""
+    print("Testing merchant rule stats...")
+    from fastapi.testclient import TestClient
+    import app as app_module
+
+    saved = (merchant_rules.MERCHANT_RULES_DIR, merchant_rules.MERCHANT_SAMPLE_EVERY,
+             app_module.RULE_ENGINE.sample_every, app_module.ADMIN_TOKEN)
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(2):
+            with open(os.path.join(tmp, f"m{i}.json"), "w", encoding="utf-8") as f:
+                json.dump(risk_service.RULES_CONFIG, f)
+        merchant_rules.MERCHANT_RULES_DIR = tmp
+        merchant_rules.clear_merchant_cache()
+        app_module.ADMIN_TOKEN = "test-admin"
+        client = TestClient(app_module.app)
+        headers = {"X-Admin-Token": "test-admin"}
+        try:
+            m0 = merchant_rules.load_merchant_engine("m0")
+            assert m0.sample_every == saved[1]
+            assert client.post("/admin/rule-stats/sampling", params={"sample_every": 1},
+                               headers=headers).json()["sample_every"] == 1
+            # Cached and later compiled merchant evaluators both take the new interval
+            assert m0.sample_every == 1
+            assert merchant_rules.load_merchant_engine("m1").sample_every == 1
+
+            for _ in range(3):
+                risk_check({**TRANSACTION, "merchant_id": "m0"}, llm=False)
+            stats = client.get("/admin/rule-stats", params={"merchant_id": "m0"}, headers=headers).json()
+            print(f"m0: calls {stats['calls']}, sampled {stats['sampled_calls']}")
+            assert stats["sampled_calls"] == 3
+            assert client.post("/admin/rule-stats/reset", params={"merchant_id": "m0"},
+                               headers=headers).json()["calls"] == 0
+            assert client.get("/admin/rule-stats", params={"merchant_id": "m9"}, headers=headers).status_code == 404
+        finally:
+            merchant_rules.MERCHANT_RULES_DIR = saved[0]
+            merchant_rules.set_merchant_sample_every(saved[1])
+            app_module.RULE_ENGINE.sample_every, app_module.ADMIN_TOKEN = saved[2:]
+            merchant_rules.clear_merchant_cache()
+    print("✓ Merchant evaluators follow the sampling setting")
+
+
+if __name__ == "__main__":
+    test_merchant_rule_sets()
+    test_cache_eviction()
+    test_missing_merchants()
+    test_invalid_rule_files()
+    test_table_memory_bound()
+    test_merchant_rule_stats()
@@ -0,0 +1,58 @@
+"""
+Test script for the shared pending 3DS transaction store
+Checks dict behaviour and that entries written in a forked worker are visible to others
+"""
+
+import os
+import sys
+import tempfile
+sys.path.append('.')
+
+from pending_store import SqlitePendingStore
+
+ENTRY = {
+    "payment_request": {"amount": 6000.0, "payment_method": "credit_card", "card_country": None},
+    "risk": {"risk_score": 60, "requires_3ds": True, "reasons": ["大额交易"]},
+    "timestamp": 123456
+}
+
+
+def test_dict_behaviour():
+    """The store supports the dict operations used by app.py"""
+    print("Testing pending store dict behaviour...")
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SqlitePendingStore(os.path.join(tmp, "pending.db"))
+        store["tx-1"] = ENTRY
+        assert "tx-1" in store
+        assert "tx-2" not in store
+        assert store["tx-1"] == ENTRY
+        assert len(store) == 1
+        del store["tx-1"]
+        assert "tx-1" not in store
+        try:
+            del store["tx-1"]
+            assert False, "deleting a missing key must raise KeyError"
+        except KeyError:
+            pass
+    print("✓ Pending store behaves like a dict")
+
+
+def test_shared_across_processes():
+    """An entry stored by a forked worker is readable by the parent"""
+    print("Testing pending store across processes...")
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SqlitePendingStore(os.path.join(tmp, "pending.db"))
+        assert "warm" not in store
+        pid = os.fork()
+        if pid == 0:
+            store["from-child"] = ENTRY
+            os._exit(0)
+        os.waitpid(pid, 0)
+        assert store["from-child"] == ENTRY
+    print("✓ Pending store is shared between worker processes")
+
+
+if __name__ == "__main__":
+    test_dict_behaviour()
+    print()
+    test_shared_across_processes()
@@ -0,0 +1,98 @@
+"""
+Test script for the on-demand sampling profiler
+Checks per-route collapsed stacks, top self-time functions, session limits and the overhead of an armed sampler
+"""
+
+import sys
+import threading
+import time
+sys.path.append('.')
+
+from profiler import SamplingProfiler, collapsed_text
+from risk_service import risk_check
+
+TRANSACTION = {
+    "amount": 6000,
+    "currency": "CNY",
+    "payment_method": "credit_card",
+    "user_history": 0,
+    "ip_country": "US",
+    "card_country": "CN"
+}
+
+
+def busy_hash(seconds):
+    end = time.perf_counter() + seconds
+    value = 0
+    while time.perf_counter() < end:
+        value = hash((value, 1))
+    return value
+
+
+def serve(profiler, route, work, stop):
+    while not stop.is_set():
+        with profiler.route(route):
+            work()
+
+
+def test_route_breakdown():
+    """Samples are attributed to the route of the thread that was running"""
+    print("Testing per-route stacks...")
+    profiler = SamplingProfiler(interval_ms=2)
+    assert profiler.start(seconds=0.5)
+    assert not profiler.start(seconds=1)
+
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=serve, args=(profiler, "/checkout", lambda: busy_hash(0.005), stop)),
+        threading.Thread(target=serve, args=(profiler, "/3ds-verify", lambda: time.sleep(0.005), stop))
+    ]
+    for thread in threads:
+        thread.start()
+    result = profiler.wait()
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    checkout = result["routes"]["/checkout"]
+    print(f"Passes: {result['sampling_passes']}, requests: {result['requests']}, "
+          f"overhead: {result['sampler_overhead']:.4f}")
+    print(f"/checkout top: {checkout['top_self'][:2]}")
+    assert set(result["routes"]) == {"/checkout", "/3ds-verify"}
+    assert checkout["top_self"][0]["function"].startswith("busy_hash")
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in checkout["collapsed"])
+    assert collapsed_text(result).startswith(("/checkout;", "/3ds-verify;"))
+    assert not profiler.running
+    print("✓ Collapsed stacks and self time are broken down by route")
+
+
+def test_request_limit_and_overhead():
+    """A session can end after N requests; an idle profiler costs nothing measurable"""
+    print("Testing request limit and overhead...")
+    profiler = SamplingProfiler(interval_ms=5)
+
+    def run(n, tagged=True):
+        start = time.perf_counter()
+        for _ in range(n):
+            if tagged:
+                with profiler.route("/checkout"):
+                    risk_check(dict(TRANSACTION), llm=False)
+            else:
+                risk_check(dict(TRANSACTION), llm=False)
+        return (time.perf_counter() - start) / n
+
+    baseline = run(20000, tagged=False)
+    idle = run(20000)
+    assert profiler.start(requests=20000, max_seconds=30)
+    sampling = run(20000)
+    result = profiler.wait()
+    print(f"risk_check: baseline {baseline * 1e6:.2f}us, armed idle {idle * 1e6:.2f}us, "
+          f"sampling {sampling * 1e6:.2f}us ({result['sampler_overhead']:.4f} of wall time in sampler)")
+    assert result["requests"] == 20000
+    assert result["routes"]["/checkout"]["samples"] > 0
+    print("✓ Session stops after N requests")
+
+
+if __name__ == "__main__":
+    test_route_breakdown()
+    test_request_limit_and_overhead()
@@ -0,0 +1,84 @@
+"""
+Test script for the prompt template registry
+Compares prompt sizes of v1 and v2, and checks per-level max_tokens and usage accounting against the local TLS stub
+"""
+
+import os
+import sys
+sys.path.append('.')
+
+import llm_service
+import prompt_templates
+from benchmarks.tls_stub import start_stub
+from prompt_templates import TOKEN_USAGE, estimate_tokens, get_template
+
+TRANSACTION = {
+    "amount": 6000,
+    "currency": "CNY",
+    "payment_method": "credit_card",
+    "user_history": 0,
+    "ip_country": "US",
+    "card_country": "CN"
+}
+REASONS = ["大额交易", "新用户", "跨境交易"]
+
+
+def prompt_tokens(template):
+    return sum(estimate_tokens(m["content"]) for m in template.render(TRANSACTION, 60, REASONS))
+
+
+def test_compact_templates():
+    """v2 prompts are smaller than v1 and budgets grow with the risk level"""
+    print("Testing prompt template sizes...")
+    v1 = prompt_tokens(get_template("MEDIUM", "v1"))
+    for level in ("LOW", "MEDIUM", "HIGH"):
+        template = get_template(level, "v2")
+        print(f"{template.key}: ~{prompt_tokens(template)} prompt tokens (v1: ~{v1}), max_tokens={template.max_tokens}")
+        assert prompt_tokens(template) < v1
+    assert get_template("LOW", "v2").max_tokens < get_template("MEDIUM", "v2").max_tokens < get_template("HIGH", "v2").max_tokens
+    assert get_template("UNKNOWN", "v2") is get_template("MEDIUM", "v2")
+    print("✓ Compact templates are smaller with per-level budgets")
+
+
+def test_usage_accounting():
+    """Each call sends the template's budget and its usage is aggregated"""
+    print("Testing token usage accounting...")
+    server, cert, tmp = start_stub()
+    saved = (llm_service.openai_api_key, llm_service.openai_base_url, os.environ.get("SSL_CERT_FILE"))
+    try:
+        os.environ["SSL_CERT_FILE"] = cert
+        llm_service.openai_api_key = "sk-stub"
+        llm_service.openai_base_url = server.base_url
+        llm_service.init_client()
+        TOKEN_USAGE.reset()
+
+        llm_service.generate_llm_analysis(TRANSACTION, 35, REASONS[:2], "MEDIUM")
+        llm_service.generate_llm_analysis(TRANSACTION, 60, REASONS, "HIGH")
+        llm_service.generate_llm_analysis(TRANSACTION, 65, REASONS, "HIGH")
+
+        sent = [request["max_tokens"] for request in server.requests]
+        print(f"max_tokens sent: {sent}")
+        assert sent == [get_template("MEDIUM").max_tokens] + [get_template("HIGH").max_tokens] * 2
+
+        usage = TOKEN_USAGE.snapshot()
+        print(f"Usage: {usage}")
+        high = usage["templates"][f"{prompt_templates.PROMPT_VERSION}/HIGH"]
+        assert high["calls"] == 2
+        assert high["prompt_tokens"] == 240 and high["completion_tokens"] == 24
+        assert high["estimated_prompt_tokens"] > 0
+    finally:
+        llm_service.openai_api_key, llm_service.openai_base_url, cert_file = saved
+        if cert_file is None:
+            os.environ.pop("SSL_CERT_FILE", None)
+        else:
+            os.environ["SSL_CERT_FILE"] = cert_file
+        llm_service.init_client()
+        TOKEN_USAGE.reset()
+        server.shutdown()
+        tmp.cleanup()
+    print("✓ Token usage is aggregated per template")
+
+
+if __name__ == "__main__":
+    test_compact_templates()
+    test_usage_accounting()
@@ -0,0 +1,121 @@
+"""
+Test script for the offline replay CLI
+Replays small JSONL and CSV files and compares the aggregates with direct risk_check calls
+"""
+
+import csv
+import json
+import os
+import random
+import sys
+import tempfile
+sys.path.append('.')
+
+from replay import PAYMENT_DEFAULTS, replay
+from risk_service import risk_check
+
+
+def make_transactions(n, seed=1):
+    rng = random.Random(seed)
+    return [
+        {
+            "amount": rng.choice([100.0, 3000.0, 6000.0]),
+            "payment_method": rng.choice(["credit_card", "alipay", "wechat_pay"]),
+            "card_country": rng.choice(["CN", "US"]),
+            "ip_country": rng.choice(["CN", "US"]),
+            "user_history": rng.choice([0, 3])
+        }
+        for _ in range(n)
+    ]
+
+
+def expected_summary(transactions):
+    """Aggregate with direct, single-process risk_check calls"""
+    requires_3ds = 0
+    reasons = {}
+    for transaction in transactions:
+        risk = risk_check({**PAYMENT_DEFAULTS, **transaction}, mode="full", llm=False)
+        requires_3ds += risk["requires_3ds"]
+        for reason in risk["reasons"]:
+            reasons[reason] = reasons.get(reason, 0) + 1
+    return requires_3ds, reasons
+
+
+def test_replay_jsonl():
+    """JSONL replay across several workers matches direct scoring"""
+    print("Testing JSONL replay...")
+    transactions = make_transactions(2500)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "transactions.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            for transaction in transactions:
+                f.write(json.dumps(transaction) + "\n")
+        summary = replay(path, workers=2, chunk_size=300)
+
+    requires_3ds, reasons = expected_summary(transactions)
+    print(f"Replayed {summary['count']} transactions, 3DS: {summary['requires_3ds']}")
+    assert summary["count"] == len(transactions)
+    assert summary["errors"] == 0
+    assert summary["requires_3ds"] == requires_3ds
+    assert dict(summary["reasons"]) == reasons
+    assert sum(summary["score_histogram"].values()) == len(transactions)
+    print("✓ JSONL replay works correctly")
+
+
+def test_replay_csv():
+    """CSV replay converts column types and applies PaymentRequest defaults"""
+    print("Testing CSV replay...")
+    transactions = make_transactions(500, seed=2)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "transactions.csv")
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(transactions[0]))
+            writer.writeheader()
+            writer.writerows(transactions)
+        summary = replay(path, workers=2, chunk_size=128)
+
+    requires_3ds, reasons = expected_summary(transactions)
+    assert summary["count"] == len(transactions)
+    assert summary["requires_3ds"] == requires_3ds
+    assert dict(summary["reasons"]) == reasons
+    print("✓ CSV replay works correctly")
+
+
+def test_replay_corrupt_lines():
+    """Malformed lines are counted as errors instead of aborting the replay"""
+    print("Testing corrupt input lines...")
+    transactions = make_transactions(200, seed=3)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "transactions.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            for i, transaction in enumerate(transactions):
+                f.write(json.dumps(transaction) + "\n")
+                if i == 50:
+                    f.write('{"amount": 100, "payment_method": \n')
+                if i == 120:
+                    f.write("[1, 2, 3]\n")
+        summary = replay(path, workers=1, chunk_size=64)
+        assert summary["count"] == len(transactions) and summary["errors"] == 2
+
+        path = os.path.join(tmp, "transactions.csv")
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(transactions[0]))
+            writer.writeheader()
+            writer.writerows(transactions[:100])
+            writer.writerow({**transactions[0], "amount": "abc"})
+            writer.writerows(transactions[100:])
+        summary = replay(path, workers=1, chunk_size=64)
+        print(summary["count"], summary["errors"])
+        assert summary["count"] == len(transactions) and summary["errors"] == 1
+
+    requires_3ds, _ = expected_summary(transactions)
+    assert summary["requires_3ds"] == requires_3ds
+    print("✓ Corrupt lines are skipped and counted")
+
+
+if __name__ == "__main__":
+    test_replay_jsonl()
+    print()
+    test_replay_csv()
+    print()
+    test_replay_corrupt_lines()
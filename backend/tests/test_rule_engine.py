@@ -0,0 +1,123 @@
+"""
+Test script for the compiled rule engine
+Checks that fast (early-exit) evaluation reaches the same decisions as full evaluation
+"""
+
+import json
+import random
+import sys
+sys.path.append('.')
+
+from rule_engine import RuleEngine
+
+with open('rules.json', 'r', encoding='utf-8') as f:
+    RULES_CONFIG = json.load(f)
+
+
+def random_transaction(rng):
+    """Build a random transaction in the PaymentRequest shape"""
+    return {
+        "amount": rng.choice([100, 3000, 5000, 6000, 20000]),
+        "currency": "CNY",
+        "payment_method": rng.choice(["credit_card", "alipay", "wechat_pay"]),
+        "card_number": "4111111111111111",
+        "card_country": rng.choice(["CN", "US"]),
+        "ip_country": rng.choice(["CN", "US", "JP"]),
+        "user_history": rng.choice([0, 0, 1, 5, 20])
+    }
+
+
+def test_full_mode_matches_rules():
+    """Full mode evaluates every rule and keeps reasons in config order"""
+    print("Testing full evaluation mode...")
+    engine = RuleEngine(RULES_CONFIG)
+    transaction = {
+        "amount": 6000,
+        "payment_method": "credit_card",
+        "user_history": 0,
+        "ip_country": "US",
+        "card_country": "CN"
+    }
+    score, reasons = engine.evaluate(transaction, "full")
+    print(f"Score: {score}, reasons: {reasons}")
+    assert score == 60
+    assert reasons == ["大额交易", "新用户", "跨境交易"]
+    assert engine.classify(score) == ("MEDIUM", True, True)
+    assert all(rule.evaluations == 1 for rule in engine.rules)
+    print("✓ Full mode works correctly")
+
+
+def test_fast_mode_same_decisions():
+    """Fast mode must reach the same level/3DS/LLM decision as full mode"""
+    print("Testing fast evaluation mode against full mode...")
+    rng = random.Random(42)
+    full_engine = RuleEngine(RULES_CONFIG)
+    fast_engine = RuleEngine(RULES_CONFIG)
+
+    for _ in range(5000):
+        transaction = random_transaction(rng)
+        full_score, full_reasons = full_engine.evaluate(transaction, "full")
+        fast_score, fast_reasons = fast_engine.evaluate(transaction, "fast", explain_llm=False)
+        assert full_engine.classify(full_score) == fast_engine.classify(fast_score), transaction
+        # Reasons from a partial evaluation are always a subset of the full list
+        assert set(fast_reasons) <= set(full_reasons)
+
+    full_evals = sum(rule.evaluations for rule in full_engine.rules)
+    fast_evals = sum(rule.evaluations for rule in fast_engine.rules)
+    print(f"Rule evaluations - full: {full_evals}, fast: {fast_evals}")
+    print(f"Learned order: {[rule.name for rule in fast_engine.order]}")
+    assert fast_evals < full_evals
+    print("✓ Fast mode reaches identical decisions with fewer evaluations")
+
+
+def test_fast_mode_explains_llm_band():
+    """When LLM insight is required, fast mode still collects all reasons"""
+    print("Testing fast mode in the LLM band...")
+    engine = RuleEngine(RULES_CONFIG)
+    transaction = {
+        "amount": 6000,
+        "payment_method": "credit_card",
+        "user_history": 0,
+        "ip_country": "US",
+        "card_country": "CN"
+    }
+    score, reasons = engine.evaluate(transaction, "fast")
+    print(f"Score: {score}, reasons: {reasons}")
+    assert score == 60
+    assert reasons == ["大额交易", "新用户", "跨境交易"]
+    print("✓ Fast mode keeps full reasons for LLM prompts")
+
+
+def test_stats_sampling_and_reset():
+    """Stats are collected on one in sample_every calls and can be reset"""
+    print("Testing rule stats sampling and reset...")
+    rng = random.Random(7)
+    engine = RuleEngine(RULES_CONFIG, sample_every=10)
+    for _ in range(1000):
+        engine.evaluate(random_transaction(rng))
+
+    stats = engine.stats()
+    print(json.dumps(stats, indent=2, ensure_ascii=False))
+    assert stats["calls"] == 1000
+    assert stats["sampled_calls"] == 100
+    assert all(rule["evaluations"] == 100 for rule in stats["rules"])
+
+    engine.reset_stats()
+    stats = engine.stats()
+    assert stats["calls"] == 0
+    assert all(rule["evaluations"] == 0 and rule["total_ns"] == 0 for rule in stats["rules"])
+
+    engine.sample_every = 0
+    engine.evaluate(random_transaction(rng))
+    assert engine.stats()["sampled_calls"] == 0
+    print("✓ Sampling and reset work correctly")
+
+
+if __name__ == "__main__":
+    test_full_mode_matches_rules()
+    print()
+    test_fast_mode_same_decisions()
+    print()
+    test_fast_mode_explains_llm_band()
+    print()
+    test_stats_sampling_and_reset()
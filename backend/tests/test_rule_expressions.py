@@ -0,0 +1,141 @@
+"""
+Test script for composite expression rules
+Checks parsing, shared subexpressions, failure semantics and RuleEngine integration
+"""
+
+import json
+import random
+import sys
+sys.path.append('.')
+
+from rule_engine import RuleEngine
+from rule_expressions import ExpressionSet, compile_expression, parse_expression
+
+with open('rules.json', 'r', encoding='utf-8') as f:
+    RULES_CONFIG = json.load(f)
+
+EXPRESSIONS = [
+    "amount > 5000 and user_history == 0 and ip_country != card_country",
+    "amount > 5000 and payment_method in ('alipay', 'wechat_pay')",
+    "amount / (user_history + 1) > 1000 or amount > 20000",
+    "not (ip_country != card_country) and amount > 5000",
+    "amount / (user_history + 1) > 1000 and user_history == 0",
+    "ip_country not in ['CN', 'HK'] and 100 < amount <= 6000"
+]
+
+
+def random_transaction(rng):
+    transaction = {
+        "amount": rng.choice([100, 3000, 5000, 6000, 25000, None]),
+        "payment_method": rng.choice(["credit_card", "alipay", "wechat_pay"]),
+        "card_country": rng.choice(["CN", "US"]),
+        "ip_country": rng.choice(["CN", "US", "HK"]),
+        "user_history": rng.choice([0, 1, 5, -1, None])
+    }
+    for field in list(transaction):
+        if rng.random() < 0.1:
+            del transaction[field]
+    return transaction
+
+
+def test_parse_rejects_unsupported_syntax():
+    """Only comparisons, arithmetic and boolean logic over fields are accepted"""
+    print("Testing expression validation...")
+    parse_expression("amount > 5000 and not ip_country in ('CN',)")
+    for bad in ["__import__('os')", "amount.real > 1", "t['amount'] > 1", "amount > ",
+                "payment_method in (card_country,)", "(lambda: 1)()"]:
+        try:
+            parse_expression(bad)
+        except ValueError as e:
+            print(f"Rejected: {e}")
+        else:
+            raise AssertionError(f"accepted {bad}")
+    print("✓ Unsupported syntax is rejected at load time")
+
+
+def test_shared_subexpressions_match_standalone():
+    """Sharing and factoring give the same hits as evaluating each rule alone"""
+    print("Testing shared subexpressions...")
+    rules = [(i, 10 + i, expression) for i, expression in enumerate(EXPRESSIONS)]
+    shared = ExpressionSet(rules)
+    unshared = ExpressionSet(rules, share=False)
+    predicates = [compile_expression(expression) for expression in EXPRESSIONS]
+    print(f"Shared subexpressions: {shared.shared_count}")
+    assert shared.shared_count >= 3
+    assert unshared.shared_count == 0
+    assert shared.source.count("amount") == 1
+
+    rng = random.Random(7)
+    for _ in range(3000):
+        transaction = random_transaction(rng)
+        expected = [i for i, predicate in enumerate(predicates) if predicate(transaction)]
+        score, hits = shared.evaluate(transaction)
+        assert sorted(hits) == expected, (transaction, hits, expected)
+        assert score == sum(10 + i for i in expected)
+        score, hits = unshared.evaluate(transaction)
+        assert sorted(hits) == expected
+    print("✓ Shared evaluation matches per-rule evaluation")
+
+
+def test_failures_do_not_apply():
+    """Missing fields, None and division by zero make the rule not apply"""
+    print("Testing failure semantics...")
+    ratio = compile_expression("amount / (user_history + 1) > 1000")
+    assert ratio({"amount": 6000, "user_history": 0})
+    assert not ratio({"amount": 6000, "user_history": -1})
+    assert not ratio({"amount": 6000})
+    assert not ratio({"amount": None, "user_history": 0})
+    # A failing branch of an "or" only fails the rule if it is reached
+    either = compile_expression("amount > 20000 or amount / user_history > 1000")
+    assert either({"amount": 25000, "user_history": 0})
+    assert not either({"amount": 6000, "user_history": 0})
+    assert compile_expression("not (amount > 5000)")({"amount": 100})
+    assert not compile_expression("not (amount > 5000)")({})
+    print("✓ Failing rules do not apply")
+
+
+def test_engine_mixed_rules():
+    """Expression rules sit next to field rules; reasons stay in config order"""
+    print("Testing RuleEngine with expression rules...")
+    config = dict(RULES_CONFIG)
+    config["risk_rules"] = [
+        {"name": "new_user_big_cross_border", "operator": "expr", "score": 30,
+         "expression": EXPRESSIONS[0], "message": "新用户大额跨境交易"}
+    ] + RULES_CONFIG["risk_rules"] + [
+        {"name": "wallet_big_amount", "operator": "expr", "score": 5,
+         "expression": EXPRESSIONS[1], "message": "钱包大额支付"}
+    ]
+    engine = RuleEngine(config)
+    plain = RuleEngine(RULES_CONFIG)
+    transaction = {
+        "amount": 6000,
+        "payment_method": "credit_card",
+        "user_history": 0,
+        "ip_country": "US",
+        "card_country": "CN"
+    }
+    score, reasons = engine.evaluate(transaction, "full")
+    plain_score, plain_reasons = plain.evaluate(transaction, "full")
+    print(f"Score: {score}, reasons: {reasons}")
+    assert score == plain_score + 30
+    assert reasons == ["新用户大额跨境交易"] + plain_reasons
+
+    transaction["payment_method"] = "alipay"
+    score, reasons = engine.evaluate(transaction, "fast", explain_llm=True)
+    assert reasons[0] == "新用户大额跨境交易" and reasons[-1] == "钱包大额支付"
+
+    stats = {rule["name"]: rule for rule in engine.stats()["rules"]}
+    assert stats["new_user_big_cross_border"]["evaluations"] == 2
+    assert stats["new_user_big_cross_border"]["hits"] == 2
+    assert stats["wallet_big_amount"]["hits"] == 1
+    assert "new_user_big_cross_border" not in engine.stats()["order"]
+    engine.reset_stats()
+    assert engine.stats()["rules"][0]["evaluations"] == 0
+    print("✓ Expression rules integrate with the engine")
+
+
+if __name__ == "__main__":
+    test_parse_rejects_unsupported_syntax()
+    test_shared_subexpressions_match_standalone()
+    test_failures_do_not_apply()
+    test_engine_mixed_rules()
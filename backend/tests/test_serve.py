@@ -0,0 +1,70 @@
+"""
+Test script for the pre-fork server
+Checks that records buffered in the workers reach disk when the server is stopped
+"""
+
+import glob
+import json
+import os
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+sys.path.append('.')
+
+import httpx
+
+PAYMENT = {"amount": 100.0, "payment_method": "alipay", "card_number": "4111111111111111",
+           "card_country": "CN", "ip_country": "CN", "user_history": 5}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_shutdown_flushes_workers():
+    """Audit records and profile deltas queued just before SIGTERM are written"""
+    print("Testing worker shutdown...")
+    with tempfile.TemporaryDirectory() as tmp:
+        port = free_port()
+        env = {**os.environ, "OPENAI_API_KEY": "", "AUDIT_LOG_DIR": os.path.join(tmp, "audit"),
+               "AUDIT_FLUSH_INTERVAL": "60", "FEATURE_STORE_PATH": os.path.join(tmp, "profiles.db"),
+               "FEATURE_STORE_KEY": "serve-test-card-hash-key",
+               "FEATURE_FLUSH_INTERVAL": "60", "PENDING_STORE_PATH": os.path.join(tmp, "pending.db")}
+        server = subprocess.Popen([sys.executable, "serve.py", "--workers", "2", "--port", str(port)], env=env)
+        try:
+            with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=10) as client:
+                for _ in range(100):
+                    try:
+                        client.get("/health")
+                        break
+                    except httpx.TransportError:
+                        time.sleep(0.1)
+                for i in range(20):
+                    response = client.post("/checkout", json={**PAYMENT, "user_id": f"u{i % 4}"}).json()
+                    assert response["status"] == "success"
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=30)
+
+        # Nothing was flushed by the 60s timers; everything comes from the shutdown path
+        records = []
+        for path in glob.glob(os.path.join(tmp, "audit", "audit-*.jsonl")):
+            with open(path, "r", encoding="utf-8") as f:
+                records.extend(json.loads(line) for line in f)
+        print(f"Audit records: {len(records)}")
+        assert len(records) == 20
+        with sqlite3.connect(os.path.join(tmp, "profiles.db")) as conn:
+            counts = conn.execute("SELECT count, kind FROM profiles").fetchall()
+        print(f"Profiles: {counts}")
+        assert sum(count for count, kind in counts if kind == "user") == 20
+    print("✓ Buffered records are flushed on shutdown")
+
+
+if __name__ == "__main__":
+    test_shutdown_flushes_workers()
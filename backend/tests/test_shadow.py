@@ -0,0 +1,156 @@
+"""
+Test script for shadow rule set evaluation
+Checks that shadow configs are scored in the background and disagreements are counted
+"""
+
+import copy
+import json
+import sys
+import time
+sys.path.append('.')
+
+from shadow import ShadowEvaluator
+from rule_engine import RuleEngine
+
+with open('rules.json', 'r', encoding='utf-8') as f:
+    RULES_CONFIG = json.load(f)
+
+HIGH_RISK = {
+    "amount": 6000,
+    "payment_method": "credit_card",
+    "user_history": 0,
+    "ip_country": "US",
+    "card_country": "CN"
+}
+
+MEDIUM_RISK = {
+    "amount": 6000,
+    "payment_method": "credit_card",
+    "user_history": 0,
+    "ip_country": "CN",
+    "card_country": "CN"
+}
+
+
+def production_risk(transaction):
+    engine = RuleEngine(RULES_CONFIG)
+    score, _ = engine.evaluate(transaction)
+    level, requires_3ds, _ = engine.classify(score)
+    return {"risk_score": score, "risk_level": level, "requires_3ds": requires_3ds}
+
+
+def wait_until_drained(evaluator, expected):
+    deadline = time.time() + 5
+    while evaluator.snapshot()["evaluated"] < expected and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_shadow_disagreements():
+    """A stricter 3DS threshold removes 3DS for the 60-point transaction"""
+    print("Testing shadow disagreement stats...")
+    candidate = copy.deepcopy(RULES_CONFIG)
+    candidate["thresholds"]["requires_3ds"] = 60
+    candidate["risk_levels"]["medium"] = 40
+    evaluator = ShadowEvaluator({"same": RULES_CONFIG, "candidate": candidate})
+
+    for transaction in (HIGH_RISK, MEDIUM_RISK):
+        evaluator.submit(transaction, production_risk(transaction))
+    wait_until_drained(evaluator, 2)
+
+    snapshot = evaluator.snapshot()
+    print(json.dumps(snapshot, indent=2, ensure_ascii=False))
+    assert snapshot["evaluated"] == 2
+    assert snapshot["configs"]["same"]["3ds_removed"] == 0
+    assert snapshot["configs"]["same"]["level_flips"] == {}
+    assert snapshot["configs"]["candidate"]["3ds_removed"] == 1
+    assert snapshot["configs"]["candidate"]["level_flips"] == {"MEDIUM->LOW": 1}
+    print("✓ Shadow disagreements are aggregated correctly")
+
+
+def test_shadow_partial_scores():
+    """Fast-mode production scores count for level and 3DS flips but not for the score delta"""
+    print("Testing shadow stats for fast-mode scores...")
+    candidate = copy.deepcopy(RULES_CONFIG)
+    candidate["thresholds"]["requires_3ds"] = 60
+    evaluator = ShadowEvaluator({"candidate": candidate})
+
+    # Fast mode settled the decision after the amount and new-user rules
+    evaluator.submit(HIGH_RISK, {"risk_score": 45, "risk_level": "MEDIUM", "requires_3ds": True},
+                     partial_score=True)
+    evaluator.submit(MEDIUM_RISK, production_risk(MEDIUM_RISK))
+    wait_until_drained(evaluator, 2)
+
+    stats = evaluator.snapshot()["configs"]["candidate"]
+    print(json.dumps(stats, ensure_ascii=False))
+    assert stats["3ds_removed"] == 1
+    assert stats["mean_score_delta"] == 0
+    evaluator.reset()
+    evaluator.submit(HIGH_RISK, production_risk(HIGH_RISK), partial_score=True)
+    wait_until_drained(evaluator, 1)
+    assert evaluator.snapshot()["configs"]["candidate"]["mean_score_delta"] is None
+    print("✓ Partial scores are left out of the score delta")
+
+
+def test_shadow_drops_when_full():
+    """submit never blocks; overflow is dropped and counted"""
+    print("Testing shadow queue backpressure...")
+    evaluator = ShadowEvaluator({"same": RULES_CONFIG}, queue_size=1)
+    risk = production_risk(HIGH_RISK)
+    with evaluator.lock:
+        # The worker is blocked on the lock, so the queue fills up
+        start = time.perf_counter()
+        for _ in range(100):
+            evaluator.submit(HIGH_RISK, risk)
+        elapsed = time.perf_counter() - start
+    print(f"100 submits took {elapsed * 1e6:.0f}us, dropped: {evaluator.dropped}")
+    assert evaluator.dropped >= 98
+    print("✓ Shadow queue drops under pressure without blocking")
+
+
+def test_shadow_drains_backlog():
+    """A backlog larger than one batch is scored completely"""
+    print("Testing shadow backlog draining...")
+    evaluator = ShadowEvaluator({"same": RULES_CONFIG}, batch_size=4)
+    risk = production_risk(HIGH_RISK)
+    with evaluator.lock:
+        for _ in range(10):
+            evaluator.submit(HIGH_RISK, risk)
+    wait_until_drained(evaluator, 10)
+
+    snapshot = evaluator.snapshot()
+    print(snapshot)
+    assert snapshot["evaluated"] == 10 and snapshot["queue_depth"] == 0 and snapshot["dropped"] == 0
+    assert snapshot["configs"]["same"]["level_flip_rate"] == 0
+    print("✓ Backlog is scored in batches")
+
+
+def test_shadow_candidate_errors():
+    """A candidate that raises on live data is counted and the evaluator keeps running"""
+    print("Testing shadow candidate errors...")
+    broken = copy.deepcopy(RULES_CONFIG)
+    broken["risk_rules"].append({"name": "country_gt", "field": "ip_country", "operator": "gt",
+                                 "threshold": 5, "score": 10, "message": "坏规则"})
+    evaluator = ShadowEvaluator({"broken": broken, "same": RULES_CONFIG})
+
+    for transaction in (HIGH_RISK, MEDIUM_RISK, HIGH_RISK):
+        evaluator.submit(transaction, production_risk(transaction))
+    wait_until_drained(evaluator, 3)
+
+    snapshot = evaluator.snapshot()
+    print(json.dumps(snapshot, indent=2, ensure_ascii=False))
+    assert snapshot["evaluated"] == 3
+    assert snapshot["configs"]["broken"]["errors"] == 3
+    assert snapshot["configs"]["broken"]["last_error"].startswith("TypeError")
+    assert snapshot["configs"]["same"]["errors"] == 0
+    assert evaluator.thread.is_alive()
+    print("✓ Candidate errors are counted without stopping shadow evaluation")
+
+
+if __name__ == "__main__":
+    test_shadow_disagreements()
+    test_shadow_partial_scores()
+    print()
+    test_shadow_candidate_errors()
+    print()
+    test_shadow_drops_when_full()
+    test_shadow_drains_backlog()
@@ -0,0 +1,142 @@
+"""
+Test script for streaming NDJSON scoring
+Checks line splitting across chunks, result order, bounded in-flight work, backpressure and the /risk/stream endpoint
+"""
+
+import asyncio
+import json
+import random
+import sys
+import threading
+import time
+sys.path.append('.')
+
+from fastapi.testclient import TestClient
+
+from app import app, score_event
+from risk_service import risk_check
+from stream_scoring import score_stream
+
+EVENTS = [
+    {"id": "a", "amount": 6000, "payment_method": "credit_card", "user_history": 0,
+     "ip_country": "US", "card_country": "CN"},
+    {"amount": 120, "payment_method": "alipay", "user_history": 5, "ip_country": "CN", "card_country": "CN"},
+    {"id": 7, "amount": 5500, "payment_method": "wechat_pay", "user_history": 2, "ip_country": "CN",
+     "card_country": "CN"}
+]
+
+
+async def chunked(data, sizes):
+    """Yield data in chunks of the given sizes, cycling through them"""
+    i = 0
+    while data:
+        size = sizes[i % len(sizes)]
+        yield data[:size]
+        data = data[size:]
+        i += 1
+
+
+async def collect(stream):
+    return b"".join([out async for out in stream])
+
+
+def test_lines_across_chunks():
+    """Results do not depend on where the body is split; bad lines get an error line"""
+    print("Testing line splitting...")
+    body = "\n".join(json.dumps(event) for event in EVENTS) + "\n\n不是JSON\n[1, 2]\n" + json.dumps(EVENTS[0])
+    body = body.encode()
+    expected = None
+    rng = random.Random(3)
+    for _ in range(20):
+        sizes = [rng.randint(1, 40) for _ in range(5)]
+        out = asyncio.run(collect(score_stream(chunked(body, sizes), lambda e: score_event(e, False))))
+        expected = expected or out
+        assert out == expected
+    results = [json.loads(line) for line in expected.decode().splitlines()]
+    for line in results:
+        print(line)
+    assert [r["line"] for r in results] == [1, 2, 3, 4, 5, 6]
+    assert results[0]["id"] == "a" and "id" not in results[1] and results[2]["id"] == 7
+    assert results[1]["risk_score"] == risk_check(dict(EVENTS[1]), llm=False)["risk_score"]
+    assert "error" in results[3] and "error" in results[4]
+    assert results[5]["risk_score"] == results[0]["risk_score"]
+    print("✓ Lines split across chunks are scored once, in order")
+
+
+def test_bounded_in_flight_and_backpressure():
+    """Thread-pool scoring keeps order, caps concurrency and stops reading when the window is full"""
+    print("Testing in-flight limit and backpressure...")
+    lock = threading.Lock()
+    state = {"running": 0, "peak": 0, "read": 0}
+
+    def slow_score(event):
+        with lock:
+            state["running"] += 1
+            state["peak"] = max(state["peak"], state["running"])
+        time.sleep(random.random() * 0.01)
+        with lock:
+            state["running"] -= 1
+        return {"n": event["n"]}
+
+    async def source(n):
+        for i in range(n):
+            state["read"] += 1
+            yield (json.dumps({"n": i}) + "\n").encode()
+
+    async def run():
+        out = await collect(score_stream(source(200), slow_score, in_threads=True, max_in_flight=4))
+        results = [json.loads(line)["n"] for line in out.decode().splitlines()]
+        assert results == list(range(200))
+
+        # A consumer that stops after the first output stops the input too
+        state["read"] = 0
+        stream = score_stream(source(10000), slow_score, in_threads=True, max_in_flight=4)
+        await stream.__anext__()
+        await asyncio.sleep(0.05)
+        read = state["read"]
+        await stream.aclose()
+        return read
+
+    read = asyncio.run(run())
+    print(f"Peak concurrency: {state['peak']}, lines read before the consumer stopped: {read}")
+    assert state["peak"] <= 4
+    assert read <= 6
+    print("✓ At most max_in_flight lines are outstanding")
+
+
+def test_line_limit():
+    """An over-long line ends the stream with an error"""
+    print("Testing line length limit...")
+    body = json.dumps(EVENTS[1]).encode() + b"\n" + b"x" * 5000
+    out = asyncio.run(collect(score_stream(chunked(body, [1000]), lambda e: score_event(e, False),
+                                           max_line_bytes=4096)))
+    results = [json.loads(line) for line in out.decode().splitlines()]
+    print(results[-1])
+    assert len(results) == 2 and results[1]["line"] == 2 and "error" in results[1]
+    print("✓ Over-long lines are rejected")
+
+
+def test_endpoint():
+    """POST /risk/stream accepts a chunked body and returns NDJSON"""
+    print("Testing /risk/stream...")
+    client = TestClient(app)
+
+    def body():
+        for event in EVENTS:
+            yield (json.dumps(event) + "\n").encode()
+
+    for llm in ("false", "true"):
+        response = client.post(f"/risk/stream?llm={llm}", content=body())
+        results = [json.loads(line) for line in response.text.splitlines()]
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        assert [r["line"] for r in results] == [1, 2, 3]
+        assert (results[0]["llm_insight"] is not None) == (llm == "true")
+    print("✓ Endpoint streams one result per line")
+
+
+if __name__ == "__main__":
+    test_lines_across_chunks()
+    test_bounded_in_flight_and_backpressure()
+    test_line_limit()
+    test_endpoint()
@@ -0,0 +1,112 @@
+"""
+Test script for the synthetic transaction generator
+Checks determinism, agreement between output formats, distributions and injected fraud patterns
+"""
+
+import json
+import os
+import sys
+import tempfile
+sys.path.append('.')
+
+import numpy as np
+
+from replay import parse_lines, read_chunks
+from risk_service import risk_check
+from synth_data import FIELDS, TransactionGenerator, load_config, read_columnar, write_columnar, write_csv, write_jsonl
+
+ROWS = 150000
+
+
+def test_deterministic_and_formats_agree():
+    """Same seed gives identical files; JSONL, CSV and columnar hold the same rows"""
+    print("Testing determinism and output formats...")
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = [os.path.join(tmp, name) for name in ("a.jsonl", "b.jsonl", "c.jsonl")]
+        write_jsonl(TransactionGenerator(7), ROWS, paths[0])
+        write_jsonl(TransactionGenerator(7), ROWS, paths[1])
+        write_jsonl(TransactionGenerator(8), ROWS, paths[2])
+        with open(paths[0], "rb") as a, open(paths[1], "rb") as b, open(paths[2], "rb") as c:
+            first, second, other = a.read(), b.read(), c.read()
+        assert first == second
+        assert first != other
+
+        csv_path = os.path.join(tmp, "a.csv")
+        write_csv(TransactionGenerator(7), ROWS, csv_path)
+        columnar_dir = os.path.join(tmp, "columnar")
+        write_columnar(TransactionGenerator(7), ROWS, columnar_dir, segment_rows=100000)
+
+        from_jsonl = [json.loads(line) for line in first.decode().splitlines()]
+        from_csv = [row for _, header, lines in read_chunks(csv_path, 50000) for row in parse_lines("csv", header, lines)]
+        segments = list(read_columnar(columnar_dir))
+        print(f"Rows: {len(from_jsonl)}, segments: {[meta['rows'] for _, meta in segments]}")
+        assert len(from_jsonl) == len(from_csv) == sum(meta["rows"] for _, meta in segments) == ROWS
+
+        for i in (0, 1, 65535, 65536, ROWS - 1):
+            row = from_jsonl[i]
+            assert list(row) == FIELDS
+            csv_row = from_csv[i]
+            assert csv_row["amount"] == row["amount"] and csv_row["user_history"] == row["user_history"]
+            assert csv_row["payment_method"] == row["payment_method"] and csv_row.get("card_number") == row["card_number"]
+            columns, meta = segments[0] if i < 131072 else segments[1]
+            j = i if i < 131072 else i - 131072
+            assert columns["amount"][j] == row["amount"]
+            assert meta["dictionaries"]["ip_country"][columns["ip_country"][j]] == row["ip_country"]
+
+        # The first rows do not depend on how many rows are generated
+        assert list(TransactionGenerator(7).transactions(10)) == from_jsonl[:10]
+    print("✓ Output is deterministic and identical across formats")
+
+
+def test_distributions_and_fraud():
+    """Heavy-tailed amounts, configured mixes and labelled fraud patterns"""
+    print("Testing distributions and injected fraud...")
+    generator = TransactionGenerator(1)
+    blocks = list(generator.blocks(500000))
+    column = {name: np.concatenate([block[name] for block in blocks]) for name in FIELDS}
+    amount = column["amount"]
+    p50, p99 = np.percentile(amount, [50, 99])
+    methods = dict(zip(generator.methods, np.bincount(column["payment_method"]) / len(amount)))
+    print(f"Amount p50 {p50:.0f}, p99 {p99:.0f}, max {amount.max():.0f}; methods {methods}")
+    assert p99 / p50 > 20 and amount.max() <= generator.config["amount"]["max"]
+    assert abs(methods["alipay"] - 0.45) < 0.01
+    assert abs((column["user_history"] == 0).mean() - 0.12) < 0.02
+    assert np.all(np.diff(column["ts"]) >= 0)
+
+    pattern = column["pattern"]
+    card_testing = pattern == 1
+    cross_border = pattern == 2
+    print(f"Card testing rows: {card_testing.sum()}, cross-border rows: {cross_border.sum()}")
+    assert card_testing.sum() > 0 and cross_border.sum() > 0
+    assert np.array_equal(column["label"] == 1, card_testing | cross_border)
+    assert np.all(amount[card_testing] <= 20)
+    assert np.all(column["card_number"][card_testing] > 0)
+    cn = generator.country_code["CN"]
+    assert np.all(column["ip_country"][cross_border] != cn) and np.all(column["card_country"][cross_border] == cn)
+    print("✓ Distributions and fraud patterns match the config")
+
+
+def test_config_and_scoring():
+    """Config overrides apply, and generated rows go through risk_check"""
+    print("Testing config overrides...")
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump({"payment_method": {"credit_card": 1}, "merchants": 3,
+                   "fraud": {"card_testing": {"bursts_per_million": 0}}}, f)
+    try:
+        config = load_config(f.name)
+    finally:
+        os.unlink(f.name)
+    assert config["fraud"]["cross_border"]["spikes_per_million"] == 20
+    rows = list(TransactionGenerator(3, config).transactions(2000))
+    assert {row["payment_method"] for row in rows} == {"credit_card"}
+    assert {row["merchant_id"] for row in rows} <= {"m_00001", "m_00002", "m_00003"}
+    assert not any(row["pattern"] == "card_testing" for row in rows)
+    scores = [risk_check(row, llm=False)["risk_score"] for row in rows]
+    print(f"Mean risk score: {sum(scores) / len(scores):.1f}")
+    print("✓ Config overrides are applied")
+
+
+if __name__ == "__main__":
+    test_deterministic_and_formats_agree()
+    test_distributions_and_fraud()
+    test_config_and_scoring()
@@ -0,0 +1,152 @@
+"""
+Test script for request tracing
+Checks the span tree of process_payment, propagation through threads and asyncio, sampling and the JSONL exporter
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import timeit
+sys.path.append('.')
+
+import tracing
+from tracing import Tracer
+
+TRANSACTION = {
+    "amount": 6000,
+    "currency": "CNY",
+    "payment_method": "credit_card",
+    "card_number": "4111111111111111",
+    "user_history": 0,
+    "ip_country": "US",
+    "card_country": "CN"
+}
+
+
+def with_tracer(tracer, fn):
+    saved = tracing.TRACER
+    tracing.TRACER = tracer
+    try:
+        return fn()
+    finally:
+        tracing.TRACER = saved
+
+
+def test_process_payment_spans():
+    """A checkout produces one trace with enrichment, rule, LLM insight and pending-store spans"""
+    print("Testing process_payment spans...")
+    from app import process_payment
+    tracer = Tracer(sample_rate=1.0)
+
+    def run():
+        with tracing.span("POST /checkout"):
+            tracing.record("request_parse")
+            return process_payment(dict(TRANSACTION))
+
+    result = with_tracer(tracer, run)
+    trace = tracer.recent()[0]
+    names = [span["name"] for span in trace["spans"]]
+    print(f"Status: {result['status']}, spans: {names}, total {trace['duration_ms']}ms")
+    assert result["status"] == "pending_3ds"
+    for name in ("POST /checkout", "request_parse", "enrichment", "risk_rules", "llm_insight", "pending_store"):
+        assert name in names
+    # Enrichment comes before the rules; the LLM decision after them
+    assert names.index("enrichment") < names.index("risk_rules") < names.index("llm_insight")
+    root = trace["spans"][0]
+    assert root["parent_id"] is None
+    assert all(span["parent_id"] for span in trace["spans"][1:])
+
+    # Profile and linkage lookups are children of the enrichment span
+    import risk_service
+    from feature_store import FeatureStore
+    from linkage import LinkageIndex
+    saved = (risk_service.FEATURE_STORE, risk_service.LINKAGE_INDEX)
+    with tempfile.TemporaryDirectory() as tmp:
+        risk_service.FEATURE_STORE = FeatureStore(os.path.join(tmp, "profiles.db"), b"tracing-test-card-key")
+        risk_service.LINKAGE_INDEX = LinkageIndex()
+        try:
+            tracer = Tracer(sample_rate=1.0)
+
+            def check():
+                with tracing.span("root"):
+                    risk_service.risk_check({**TRANSACTION, "user_id": "u1"}, llm=False)
+            with_tracer(tracer, check)
+        finally:
+            risk_service.FEATURE_STORE.close()
+            risk_service.FEATURE_STORE, risk_service.LINKAGE_INDEX = saved
+    spans = {span["name"]: span for span in tracer.recent()[0]["spans"]}
+    print(f"Risk check spans: {list(spans)}")
+    assert spans["feature_store"]["parent_id"] == spans["enrichment"]["span_id"]
+    assert spans["linkage"]["parent_id"] == spans["enrichment"]["span_id"]
+    print("✓ Checkout spans are recorded in one trace")
+
+
+def test_context_propagation():
+    """Spans created in other threads and asyncio tasks join the caller's trace"""
+    print("Testing propagation through threads and asyncio...")
+    tracer = Tracer(sample_rate=1.0)
+
+    def child(name):
+        with tracing.span(name):
+            pass
+
+    async def handler():
+        with tracing.span("async-root"):
+            await asyncio.gather(*(asyncio.sleep(0, child(f"task-{i}")) for i in range(2)))
+            await asyncio.to_thread(child, "to-thread")
+            thread = threading.Thread(target=tracing.wrap(child), args=("thread",))
+            thread.start()
+            thread.join()
+
+    with_tracer(tracer, lambda: asyncio.run(handler()))
+    traces = tracer.recent()
+    names = sorted(span["name"] for span in traces[0]["spans"])
+    print(f"Traces: {len(traces)}, spans: {names}")
+    assert len(traces) == 1
+    assert names == ["async-root", "task-0", "task-1", "thread", "to-thread"]
+    print("✓ Trace context follows threads and tasks")
+
+
+def test_sampling_and_exporter():
+    """Unsampled requests record nothing; sampled ones are appended to TRACE_FILE"""
+    print("Testing sampling and JSONL exporter...")
+    from risk_service import risk_check
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "traces.jsonl")
+        tracer = Tracer(sample_rate=0.5, path=path)
+
+        def run():
+            for _ in range(400):
+                with tracing.span("root"):
+                    risk_check(dict(TRANSACTION), llm=False)
+
+        with_tracer(tracer, run)
+        with open(path, "r", encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f]
+        stats = tracer.stats()
+        print(f"Stats: {stats}, file lines: {len(lines)}")
+        assert stats["started"] == 400
+        assert 120 < stats["sampled"] < 280
+        assert len(lines) == stats["sampled"]
+        assert {span["name"] for span in lines[0]["spans"]} == {"root", "enrichment", "risk_rules"}
+
+    def traced_check():
+        with tracing.span("root"):
+            risk_check(dict(TRANSACTION), llm=False)
+
+    disabled = timeit.timeit(traced_check, number=5000) / 5000
+    unsampled = with_tracer(Tracer(sample_rate=1e-9), lambda: timeit.timeit(traced_check, number=5000) / 5000)
+    sampled = with_tracer(Tracer(sample_rate=1.0), lambda: timeit.timeit(traced_check, number=5000) / 5000)
+    print(f"risk_check per request: disabled {disabled * 1e6:.1f}us, "
+          f"unsampled {unsampled * 1e6:.1f}us, sampled {sampled * 1e6:.1f}us")
+    print("✓ Sampling keeps unsampled requests free of recording")
+
+
+if __name__ == "__main__":
+    test_process_payment_spans()
+    test_context_propagation()
+    test_sampling_and_exporter()
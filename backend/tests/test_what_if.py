@@ -0,0 +1,116 @@
+"""
+Test script for the what-if simulator
+Compares simulated rates for several variants with a RuleEngine run per variant
+"""
+
+import json
+import os
+import random
+import sys
+import tempfile
+sys.path.append('.')
+
+import risk_service
+from fx_rates import FXTable
+from replay import PAYMENT_DEFAULTS
+from rule_engine import RuleEngine
+from what_if import build_variant, simulate
+
+with open('rules.json', 'r', encoding='utf-8') as f:
+    RULES_CONFIG = json.load(f)
+
+VARIANTS = [
+    {"name": "baseline"},
+    {"name": "3ds_50", "thresholds": {"requires_3ds": 50}},
+    {"name": "amount_30", "rule_scores": {"amount": 30}},
+    {
+        "name": "amount_3000",
+        "risk_rules": [dict(RULES_CONFIG["risk_rules"][0], threshold=3000)] + RULES_CONFIG["risk_rules"][1:]
+    }
+]
+
+
+def test_simulate_matches_engine():
+    """Every variant's rates equal those from scoring each transaction directly"""
+    print("Testing what-if simulation...")
+    rng = random.Random(3)
+    transactions = [
+        {**PAYMENT_DEFAULTS,
+         "amount": rng.choice([100.0, 4000.0, 6000.0]),
+         "payment_method": "credit_card",
+         "card_country": rng.choice(["CN", "US", None]),
+         "ip_country": rng.choice(["CN", "US"]),
+         "user_history": rng.choice([0, 2])}
+        for _ in range(3000)
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "transactions.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            for transaction in transactions:
+                f.write(json.dumps(transaction) + "\n")
+        results = simulate(path, RULES_CONFIG, VARIANTS, llm_cost_per_call=0.01, chunk_size=700)
+
+    for variant, result in zip(VARIANTS, results):
+        engine = RuleEngine(build_variant(RULES_CONFIG, variant), sample_every=0)
+        decisions = [engine.classify(engine.evaluate(t)[0]) for t in transactions]
+        requires_3ds = sum(d[1] for d in decisions)
+        llm_calls = sum(d[2] for d in decisions)
+        print(f"{result['name']}: 3DS {result['requires_3ds_rate']:.2%}, LLM calls {result['llm_calls']}")
+        assert result["transactions"] == len(transactions)
+        assert result["requires_3ds_rate"] == requires_3ds / len(transactions)
+        assert result["llm_calls"] == llm_calls
+        assert abs(result["projected_llm_cost"] - llm_calls * 0.01) < 1e-9
+    print("✓ Simulated variants match direct evaluation")
+
+
+def test_simulate_normalized_amount():
+    """Rules on normalized_amount see the amount in the base currency, as in risk_check"""
+    print("Testing what-if simulation with currency-normalized amounts...")
+    rng = random.Random(4)
+    transactions = [
+        {**PAYMENT_DEFAULTS,
+         "amount": rng.choice([100.0, 1000.0, 6000.0, 90000.0]),
+         "currency": rng.choice(["CNY", "USD", "JPY", "XYZ"]),
+         "payment_method": "credit_card",
+         "user_history": rng.choice([0, 2])}
+        for _ in range(2000)
+    ]
+    variants = [
+        {"name": "normalized_field", "risk_rules": [
+            {"name": "large", "field": "normalized_amount", "operator": "gt", "threshold": 5000, "score": 60,
+             "message": "折算金额过大"}]},
+        {"name": "normalized_expr", "risk_rules": [
+            {"name": "large_new", "operator": "expr", "expression": "normalized_amount > 5000 and user_history == 0",
+             "score": 60, "message": "新用户折算金额过大"}]}
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        rates_path = os.path.join(tmp, "fx.json")
+        with open(rates_path, "w", encoding="utf-8") as f:
+            json.dump({"base": "CNY", "rates": {"CNY": 1.0, "USD": 7.0, "JPY": 0.05}}, f)
+        path = os.path.join(tmp, "transactions.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            for transaction in transactions:
+                f.write(json.dumps(transaction) + "\n")
+
+        saved = risk_service.FX_TABLE
+        risk_service.FX_TABLE = FXTable(rates_path, refresh_interval=0)
+        try:
+            results = simulate(path, RULES_CONFIG, variants, chunk_size=700)
+            normalized = risk_service.normalize_amounts(transactions)
+        finally:
+            risk_service.FX_TABLE = saved
+
+    for variant, result in zip(variants, results):
+        engine = RuleEngine(build_variant(RULES_CONFIG, variant), sample_every=0)
+        requires_3ds = sum(engine.classify(engine.evaluate(t)[0])[1] for t in normalized)
+        print(f"{result['name']}: 3DS {result['requires_3ds_rate']:.2%}")
+        assert 0 < requires_3ds < len(transactions)
+        assert result["requires_3ds_rate"] == requires_3ds / len(transactions)
+    print("✓ normalized_amount rules match risk_check scoring")
+
+
+if __name__ == "__main__":
+    test_simulate_matches_engine()
+    test_simulate_normalized_amount()
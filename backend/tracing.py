@@ -0,0 +1,202 @@
+"""
+Lightweight request tracing
+
+Spans are nested with a ContextVar, so the current trace follows the
+request into FastAPI's threadpool and across awaits; use wrap() for work
+handed to other threads. A trace is sampled once at its root span
+(TRACE_SAMPLE_RATE); unsampled requests and disabled tracing only pay
+for a no-op context manager.
+
+Finished traces are kept in an in-memory ring (TRACE_RING_SIZE, served
+by GET /admin/traces) and, when TRACE_FILE is set, appended to a JSONL
+file.
+
+Usage:
+    with tracing.span("risk_rules", merchant_id=merchant_id) as s:
+        ...
+        s.set("score", score)
+"""
+
+import contextvars
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+
+_current = contextvars.ContextVar("trace_span", default=None)
+
+
+class _NoopSpan:
+    """Stand-in for spans of unsampled requests"""
+
+    __slots__ = ("token",)
+
+    def set(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class _UnsampledRoot(_NoopSpan):
+    """Marks the context as unsampled so child spans stay no-ops"""
+
+    def __enter__(self):
+        self.token = _current.set(NOOP_SPAN)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self.token)
+        return False
+
+
+class Trace:
+    def __init__(self, name):
+        self.trace_id = os.urandom(8).hex()
+        self.name = name
+        self.start_ts = time.time()
+        self.start = time.perf_counter()
+        self.span_ids = itertools.count(1)
+        self.spans = []
+
+
+class Span:
+    __slots__ = ("tracer", "trace", "name", "span_id", "parent_id", "attrs", "start", "token")
+
+    def __init__(self, tracer, trace, name, parent_id, attrs):
+        self.tracer = tracer
+        self.trace = trace
+        self.name = name
+        self.span_id = next(trace.span_ids)
+        self.parent_id = parent_id
+        self.attrs = attrs
+
+    def set(self, key, value):
+        self.attrs[key] = value
+
+    def __enter__(self):
+        self.token = _current.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        if exc_type:
+            self.attrs["error"] = exc_type.__name__
+        _current.reset(self.token)
+        self.trace.spans.append(self._record(self.start, end))
+        if self.parent_id is None:
+            self.tracer.export(self.trace, end)
+        return False
+
+    def _record(self, start, end):
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ms": round((start - self.trace.start) * 1000, 3),
+            "duration_ms": round((end - start) * 1000, 3),
+            "attrs": self.attrs
+        }
+
+
+class Tracer:
+    """Samples root spans and exports finished traces"""
+
+    def __init__(self, sample_rate=1.0, ring_size=1000, path=None):
+        self.sample_rate = sample_rate
+        self.path = path
+        self.traces = deque(maxlen=ring_size)
+        self.lock = threading.Lock()
+        self.started = 0
+        self.sampled = 0
+
+    def span(self, name, **attrs):
+        parent = _current.get()
+        if parent is NOOP_SPAN:
+            return NOOP_SPAN
+        if parent is None:
+            self.started += 1
+            if random.random() >= self.sample_rate:
+                return _UnsampledRoot()
+            self.sampled += 1
+            return Span(self, Trace(name), name, None, attrs)
+        return Span(self, parent.trace, name, parent.span_id, attrs)
+
+    def record(self, name, start=None, **attrs):
+        """Add an already finished child span that began at perf_counter() value start
+        (defaults to the start of the current span)"""
+        parent = _current.get()
+        if isinstance(parent, Span):
+            span = Span(self, parent.trace, name, parent.span_id, attrs)
+            parent.trace.spans.append(span._record(parent.start if start is None else start, time.perf_counter()))
+
+    def export(self, trace, end):
+        spans = sorted(trace.spans, key=lambda s: (s["start_ms"], s["span_id"]))
+        record = {
+            "trace_id": trace.trace_id,
+            "name": trace.name,
+            "ts": trace.start_ts,
+            "duration_ms": round((end - trace.start) * 1000, 3),
+            "spans": spans
+        }
+        self.traces.append(record)
+        if self.path:
+            line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+            with self.lock:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+
+    def recent(self, limit=50, min_duration_ms=0, name=None):
+        """Most recent traces first, optionally only slow ones or one route"""
+        traces = [t for t in reversed(self.traces)
+                  if t["duration_ms"] >= min_duration_ms and (name is None or t["name"] == name)]
+        return traces[:limit]
+
+    def stats(self):
+        return {
+            "sample_rate": self.sample_rate,
+            "started": self.started,
+            "sampled": self.sampled,
+            "buffered": len(self.traces),
+            "file": self.path
+        }
+
+
+def load_tracer():
+    """Create the tracer from environment variables, or None when TRACE_SAMPLE_RATE is unset or 0"""
+    sample_rate = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+    if sample_rate <= 0:
+        return None
+    return Tracer(sample_rate, int(os.getenv("TRACE_RING_SIZE", "1000")), os.getenv("TRACE_FILE") or None)
+
+
+TRACER = load_tracer()
+
+
+def span(name, **attrs):
+    """Context manager for a span under the current one (a root span starts a trace)"""
+    if TRACER is None:
+        return NOOP_SPAN
+    return TRACER.span(name, **attrs)
+
+
+def record(name, start=None, **attrs):
+    """Record a finished child span of the current span"""
+    if TRACER is not None:
+        TRACER.record(name, start, **attrs)
+
+
+def wrap(fn):
+    """Run fn in another thread under the caller's trace context"""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
@@ -0,0 +1,243 @@
+"""
+What-if simulator for candidate rule configs
+
+Reads a transaction dataset once, evaluates every distinct rule condition
+used by any candidate config a single time, and compresses the resulting
+per-rule hit matrix into unique hit patterns with counts. Each candidate
+config (rule scores, risk_levels, thresholds, max_score) is then scored
+against the patterns only, so adding configs costs almost nothing.
+
+Usage:
+    python what_if.py transactions.jsonl variants.json [--llm-cost-per-call 0.002]
+
+variants.json:
+    {
+      "variants": [
+        {"name": "baseline"},
+        {"name": "3ds_50", "thresholds": {"requires_3ds": 50}},
+        {"name": "amount_30", "rule_scores": {"amount": 30}},
+        {"name": "custom", "risk_rules": [...]}
+      ]
+    }
+
+Each variant is applied on top of the base rules file: risk_levels and
+thresholds are merged key by key, risk_rules and max_score replace the
+base values and rule_scores overrides rule scores by rule name.
+"""
+
+import argparse
+import copy
+import json
+import time
+from collections import Counter
+
+import numpy as np
+
+from replay import parse_lines, read_chunks
+import risk_service
+from rule_engine import FIELD_OPERATORS, RuleEngine, compile_rule
+
+# Rule keys that do not affect whether a rule hits
+NON_CONDITION_KEYS = {"name", "description", "score", "message"}
+
+
+def rule_condition(rule):
+    """Hashable key identifying the condition of a rule"""
+    return json.dumps({k: v for k, v in rule.items() if k not in NON_CONDITION_KEYS}, sort_keys=True)
+
+
+def build_variant(base_config, variant):
+    """Apply a variant on top of the base config"""
+    config = copy.deepcopy(base_config)
+    for key in ("risk_levels", "thresholds"):
+        if key in variant:
+            config[key] = {**config.get(key, {}), **variant[key]}
+    for key in ("risk_rules", "max_score"):
+        if key in variant:
+            config[key] = copy.deepcopy(variant[key])
+    for rule in config.get("risk_rules", []):
+        if rule.get("name") in variant.get("rule_scores", {}):
+            rule["score"] = variant["rule_scores"][rule["name"]]
+    return config
+
+
+def column(rows, field):
+    """Return (values, present) arrays for one field of a chunk"""
+    present = np.fromiter((field in row for row in rows), dtype=bool, count=len(rows))
+    values = [row.get(field) for row in rows]
+    try:
+        return np.array(values, dtype=np.float64), present
+    except (TypeError, ValueError):
+        return np.array(values, dtype=object), present
+
+
+def normalized_amount_column(rows, columns):
+    """normalized_amount for a chunk as a column, with the currencies dictionary-encoded
+
+    Rows without an amount are not present, like the amount column itself.
+    Without an FX table the amount is used unconverted, as in risk_check.
+    """
+    amounts, present = columns["amount"] if "amount" in columns else column(rows, "amount")
+    if risk_service.FX_TABLE:
+        amounts = risk_service.FX_TABLE.normalize_column(amounts, [row.get("currency") for row in rows])
+    return amounts, present
+
+
+def needs_normalized_rows(conditions):
+    """Whether a condition reads normalized_amount from the row dicts instead of the column"""
+    for rule in conditions:
+        if "normalized_amount" in rule.get("expression", ""):
+            return True
+        if rule.get("field") == "normalized_amount" and not isinstance(rule.get("threshold"), (int, float)):
+            return True
+    return False
+
+
+def evaluate_condition(rule, rows, columns):
+    """Vectorized rule condition over a chunk; falls back to the compiled predicate"""
+    op = rule.get("operator")
+    field = rule.get("field")
+    fields = rule.get("fields", [])
+
+    if op in FIELD_OPERATORS and field:
+        values, present = columns[field]
+        if values.dtype == np.float64 and isinstance(rule.get("threshold"), (int, float)):
+            return present & FIELD_OPERATORS[op](values, rule["threshold"])
+    elif op == "not_eq" and fields and len(fields) == 2:
+        (left, left_present), (right, right_present) = columns[fields[0]], columns[fields[1]]
+        return left_present & right_present & (left != right)
+
+    predicate = compile_rule(rule)
+    return np.fromiter((predicate(row) for row in rows), dtype=bool, count=len(rows))
+
+
+def hit_patterns(path, conditions, chunk_size=50000):
+    """Evaluate each condition once per transaction.
+
+    Returns (patterns, counts): a (unique patterns x conditions) bool matrix
+    and how many transactions produced each pattern.
+    """
+    fields = set()
+    for rule in conditions:
+        if rule.get("field"):
+            fields.add(rule["field"])
+        fields.update(rule.get("fields", []))
+
+    row_fallback = needs_normalized_rows(conditions)
+    normalized = "normalized_amount" in fields or row_fallback
+
+    pattern_counts = Counter()
+    for fmt, header, lines in read_chunks(path, chunk_size):
+        rows = list(parse_lines(fmt, header, lines))
+        if not rows:
+            continue
+        columns = {field: column(rows, field) for field in fields if field != "normalized_amount"}
+        if normalized:
+            columns["normalized_amount"] = normalized_amount_column(rows, columns)
+            if row_fallback:
+                for row, value in zip(rows, columns["normalized_amount"][0].tolist()):
+                    row["normalized_amount"] = value if row.get("amount") is not None else None
+        hits = np.column_stack([evaluate_condition(rule, rows, columns) for rule in conditions])
+        packed = np.packbits(hits, axis=1)
+        unique, counts = np.unique(packed, axis=0, return_counts=True)
+        for row, count in zip(unique, counts):
+            pattern_counts[row.tobytes()] += int(count)
+
+    if not pattern_counts:
+        return np.zeros((0, len(conditions)), dtype=bool), np.zeros(0, dtype=np.int64)
+    packed = np.frombuffer(b"".join(pattern_counts), dtype=np.uint8).reshape(len(pattern_counts), -1)
+    patterns = np.unpackbits(packed, axis=1, count=len(conditions)).astype(bool)
+    counts = np.fromiter(pattern_counts.values(), dtype=np.int64, count=len(pattern_counts))
+    return patterns, counts
+
+
+def simulate_variant(config, condition_index, patterns, counts, llm_cost_per_call):
+    """Score one config from the hit patterns"""
+    engine = RuleEngine(config, sample_every=0)
+    weights = np.zeros(patterns.shape[1], dtype=np.int64)
+    for rule in config.get("risk_rules", []):
+        weights[condition_index[rule_condition(rule)]] += rule.get("score", 0)
+
+    scores = patterns.astype(np.int64) @ weights
+    total = int(counts.sum()) or 1
+    high = scores > engine.high
+    medium = ~high & (scores > engine.medium)
+    requires_3ds = scores > engine.threshold_3ds
+    requires_llm = scores > engine.threshold_llm
+    llm_calls = int(counts[requires_llm].sum())
+
+    return {
+        "transactions": int(counts.sum()),
+        "mean_score": float((np.minimum(scores, engine.max_score) * counts).sum() / total),
+        "high_rate": float(counts[high].sum() / total),
+        "medium_rate": float(counts[medium].sum() / total),
+        "low_rate": float(counts[~high & ~medium].sum() / total),
+        "requires_3ds_rate": float(counts[requires_3ds].sum() / total),
+        "llm_call_rate": llm_calls / total,
+        "llm_calls": llm_calls,
+        "projected_llm_cost": llm_calls * llm_cost_per_call
+    }
+
+
+def simulate(path, base_config, variants, llm_cost_per_call=0.002, chunk_size=50000):
+    """Simulate all variants with a single pass over the dataset"""
+    configs = [(variant.get("name", f"variant_{i}"), build_variant(base_config, variant))
+               for i, variant in enumerate(variants)]
+
+    condition_index = {}
+    conditions = []
+    for _, config in configs:
+        for rule in config.get("risk_rules", []):
+            key = rule_condition(rule)
+            if key not in condition_index:
+                condition_index[key] = len(conditions)
+                conditions.append(rule)
+
+    patterns, counts = hit_patterns(path, conditions, chunk_size)
+    return [
+        {"name": name, **simulate_variant(config, condition_index, patterns, counts, llm_cost_per_call)}
+        for name, config in configs
+    ]
+
+
+def format_table(results):
+    """Render results as a comparison table, with deltas against the first variant"""
+    baseline = results[0] if results else None
+    lines = [f"{'variant':<20}{'3DS%':>8}{'LLM%':>8}{'HIGH%':>8}{'MED%':>8}{'mean':>8}{'LLM calls':>12}{'LLM cost':>12}{'Δcost':>12}"]
+    for result in results:
+        lines.append(
+            f"{result['name']:<20}{result['requires_3ds_rate']:>8.2%}{result['llm_call_rate']:>8.2%}"
+            f"{result['high_rate']:>8.2%}{result['medium_rate']:>8.2%}{result['mean_score']:>8.1f}"
+            f"{result['llm_calls']:>12}{result['projected_llm_cost']:>12.2f}"
+            f"{result['projected_llm_cost'] - baseline['projected_llm_cost']:>+12.2f}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare candidate rule configs on one dataset")
+    parser.add_argument("input", help="JSONL or CSV transactions")
+    parser.add_argument("variants", help="JSON file with a list of variants")
+    parser.add_argument("--rules", default="rules.json", help="base rules file")
+    parser.add_argument("--llm-cost-per-call", type=float, default=0.002)
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--json", dest="json_path", help="write the results to this file")
+    args = parser.parse_args()
+
+    with open(args.rules, "r", encoding="utf-8") as f:
+        base_config = json.load(f)
+    with open(args.variants, "r", encoding="utf-8") as f:
+        variants = json.load(f)["variants"]
+
+    start = time.perf_counter()
+    results = simulate(args.input, base_config, variants, args.llm_cost_per_call, args.chunk_size)
+    print(format_table(results))
+    print(f"\n{len(results)} variants simulated in {time.perf_counter() - start:.2f}s")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()